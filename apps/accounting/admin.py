@@ -1,18 +1,18 @@
 from django.contrib import admin
-from .models import FinancialAccount, Expenditure, Transfer
+from .models import FinancialAccount, Expenditure, Transfer, AccountLedgerEntry
 
 @admin.register(FinancialAccount)
 class FinancialAccountAdmin(admin.ModelAdmin):
     list_display = ('name', 'account_type', 'currency', 'current_balance', 'is_active', 'created_at')
     list_filter = ('account_type', 'currency', 'is_active')
     search_fields = ('name', 'account_details')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('initial_balance', 'created_at', 'updated_at')
     fieldsets = (
         ('Basic Information', {
             'fields': ('name', 'account_type', 'currency', 'is_active')
         }),
         ('Balance Information', {
-            'fields': ('current_balance',)
+            'fields': ('current_balance', 'initial_balance')
         }),
         ('Additional Details', {
             'fields': ('account_details',)
@@ -83,3 +83,23 @@ class TransferAdmin(admin.ModelAdmin):
         if obj:  # editing an existing object
             readonly_fields.extend(['from_account', 'to_account', 'amount', 'currency', 'conversion_rate', 'converted_amount'])
         return readonly_fields
+
+
+@admin.register(AccountLedgerEntry)
+class AccountLedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ['entry_date', 'account', 'source_type', 'source_id', 'amount', 'currency', 'description']
+    list_filter = ['source_type', 'currency', 'account']
+    search_fields = ['description', 'account__name']
+    date_hierarchy = 'entry_date'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('account')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -3,6 +3,7 @@ from django.core.exceptions import ValidationError
 from .models import Expenditure, FinancialAccount, Transfer, Deposit
 from django.utils import timezone
 from apps.core.constants import CurrencyChoices, AccountTypeChoices
+from apps.core.forms import ReferenceChoiceField
 
 
 class FinancialAccountForm(forms.ModelForm):
@@ -65,7 +66,8 @@ class ExpenditureForm(forms.ModelForm):
         choices=CurrencyChoices.choices,
         widget=forms.Select(attrs={'class': 'form-select form-select-sm', 'id': 'id_currency'})
     )
-    paid_from_account = forms.ModelChoiceField(
+    paid_from_account = ReferenceChoiceField(
+        'active_accounts',
         label="To'lov Hisobi",
         queryset=FinancialAccount.objects.filter(is_active=True),
         widget=forms.Select(attrs={'class': 'form-select form-select-sm', 'id': 'id_paid_from_account'}),
@@ -91,8 +93,6 @@ class ExpenditureForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # Only show active accounts
-        self.fields['paid_from_account'].queryset = FinancialAccount.objects.filter(is_active=True)
         
         # Set labels in Uzbek
         self.fields['expenditure_date'].label = "Xarajat sanasi"
@@ -134,8 +134,8 @@ class TransferForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         # Only show active accounts
         active_accounts = FinancialAccount.objects.filter(is_active=True)
-        self.fields['from_account'].queryset = active_accounts
-        self.fields['to_account'].queryset = active_accounts
+        for name in ('from_account', 'to_account'):
+            self.fields[name] = ReferenceChoiceField.replacing(self.fields[name], 'active_accounts', active_accounts)
         
         # Set initial transfer_date to current datetime
         if not self.instance.pk:
@@ -214,7 +214,9 @@ class DepositForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['to_account'].queryset = FinancialAccount.objects.filter(is_active=True)
+        self.fields['to_account'] = ReferenceChoiceField.replacing(
+            self.fields['to_account'], 'active_accounts', FinancialAccount.objects.filter(is_active=True)
+        )
         if not self.instance.pk:
             self.fields['deposit_date'].initial = timezone.now()
         self.fields['description'].initial = 'Deposit'
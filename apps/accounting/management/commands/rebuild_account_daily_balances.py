@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.accounting.models import AccountDailyBalance, FinancialAccount
+
+
+class Command(BaseCommand):
+    help = "Recompute daily closing balance snapshots of financial accounts from the ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', type=int, help='Only rebuild the account with this id')
+
+    def handle(self, *args, **options):
+        accounts = FinancialAccount.objects.all()
+        if options['account']:
+            accounts = accounts.filter(pk=options['account'])
+
+        created = 0
+        for account in accounts:
+            with transaction.atomic():
+                created += AccountDailyBalance.rebuild(account)
+            self.stdout.write(f"{account.name}: {account.daily_balances.count()} days")
+
+        self.stdout.write(self.style.SUCCESS(f"Daily balances rebuilt. Created: {created} snapshots"))
@@ -0,0 +1,140 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.accounting.models import AccountDailyBalance, AccountLedgerEntry, Deposit, Expenditure, FinancialAccount, Transfer
+from apps.contacts.models import AgentPayment, SupplierPayment
+from apps.sales.models import Sale, TicketReturn
+
+
+class Command(BaseCommand):
+    help = "Rebuild the account ledger from sales, payments, expenditures, transfers, deposits and returns."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            deleted, _ = AccountLedgerEntry.objects.all().delete()
+            self.stdout.write(f"Removed {deleted} existing ledger entries")
+
+            batch = []
+            created = 0
+            for entry in self._iter_entries():
+                batch.append(entry)
+                if len(batch) >= batch_size:
+                    AccountLedgerEntry.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            if batch:
+                AccountLedgerEntry.objects.bulk_create(batch)
+                created += len(batch)
+
+            # Entries were bulk inserted, so daily snapshots have to be recomputed from the new ledger
+            for account in FinancialAccount.objects.all():
+                AccountDailyBalance.rebuild(account)
+
+        self.stdout.write(self.style.SUCCESS(f"Ledger rebuilt. Created: {created} entries"))
+
+    def _iter_entries(self):
+        source = AccountLedgerEntry.SourceType
+
+        client_sales = Sale.objects.filter(
+            agent__isnull=True, paid_to_account__isnull=False
+        ).select_related('related_acquisition__ticket', 'paid_to_account')
+        for sale in client_sales.iterator():
+            ticket = sale.related_acquisition.ticket if sale.related_acquisition else None
+            ticket_desc = ticket.get_ticket_type_display() if ticket else "Unknown Ticket"
+            yield AccountLedgerEntry(
+                account=sale.paid_to_account, entry_date=sale.sale_date,
+                amount=sale.total_sale_amount, currency=sale.paid_to_account.currency,
+                source_type=source.SALE, source_id=sale.pk,
+                description=f"{ticket_desc} - {sale.client_full_name or 'N/A'}"[:255],
+            )
+
+        for payment in AgentPayment.objects.select_related('agent', 'paid_to_account').iterator():
+            cross_currency = payment.is_cross_currency_payment()
+            yield AccountLedgerEntry(
+                account=payment.paid_to_account, entry_date=payment.payment_date,
+                amount=payment.original_amount if cross_currency else payment.amount,
+                currency=payment.paid_to_account.currency,
+                source_type=source.AGENT_PAYMENT, source_id=payment.pk,
+                description=f"Agent: {payment.agent.name}"[:255],
+                conversion_rate=payment.exchange_rate if cross_currency else None,
+                counter_amount=payment.amount if cross_currency else None,
+                counter_currency=payment.currency if cross_currency else None,
+            )
+
+        for payment in SupplierPayment.objects.select_related('supplier', 'paid_from_account').iterator():
+            yield AccountLedgerEntry(
+                account=payment.paid_from_account, entry_date=payment.payment_date,
+                amount=-payment.amount, currency=payment.paid_from_account.currency,
+                source_type=source.SUPPLIER_PAYMENT, source_id=payment.pk,
+                description=f"Ta'minotchi: {payment.supplier.name}"[:255],
+            )
+
+        for exp in Expenditure.objects.select_related('paid_from_account').iterator():
+            yield AccountLedgerEntry(
+                account=exp.paid_from_account, entry_date=exp.expenditure_date,
+                amount=-exp.amount, currency=exp.paid_from_account.currency,
+                source_type=source.EXPENDITURE, source_id=exp.pk,
+                description=exp.description[:255],
+            )
+
+        for transfer in Transfer.objects.select_related('from_account', 'to_account').iterator():
+            rate_suffix = f" (Rate: {transfer.conversion_rate:,.4f})" if transfer.is_cross_currency() else ""
+            note_suffix = f" - {transfer.description}" if transfer.description else ""
+            yield AccountLedgerEntry(
+                account=transfer.from_account, entry_date=transfer.transfer_date,
+                amount=-transfer.amount, currency=transfer.from_account.currency,
+                source_type=source.TRANSFER_OUT, source_id=transfer.pk,
+                description=f"Transfer to {transfer.to_account.name}{rate_suffix}{note_suffix}"[:255],
+                conversion_rate=transfer.conversion_rate,
+                counter_amount=transfer.converted_amount,
+                counter_currency=transfer.to_account.currency,
+            )
+            yield AccountLedgerEntry(
+                account=transfer.to_account, entry_date=transfer.transfer_date,
+                amount=transfer.converted_amount, currency=transfer.to_account.currency,
+                source_type=source.TRANSFER_IN, source_id=transfer.pk,
+                description=f"Transfer from {transfer.from_account.name}{rate_suffix}{note_suffix}"[:255],
+                conversion_rate=transfer.conversion_rate,
+                counter_amount=transfer.amount,
+                counter_currency=transfer.currency,
+            )
+
+        for dep in Deposit.objects.select_related('to_account').iterator():
+            yield AccountLedgerEntry(
+                account=dep.to_account, entry_date=dep.deposit_date,
+                amount=dep.amount, currency=dep.to_account.currency,
+                source_type=source.DEPOSIT, source_id=dep.pk,
+                description=(dep.description or 'Deposit')[:255],
+                notes=dep.notes or '',
+            )
+
+        customer_returns = TicketReturn.objects.filter(
+            original_sale__agent__isnull=True
+        ).select_related(
+            'original_sale__paid_to_account', 'original_sale__related_acquisition', 'fine_paid_to_account'
+        )
+        for ret in customer_returns.iterator():
+            sale = ret.original_sale
+            description = f"Qaytarish #{ret.pk} - {sale.client_full_name or 'N/A'}"[:255]
+            if sale.paid_to_account:
+                yield AccountLedgerEntry(
+                    account=sale.paid_to_account, entry_date=ret.return_date,
+                    amount=-ret.returned_acquisition_amount, currency=sale.paid_to_account.currency,
+                    source_type=source.RETURN_REFUND, source_id=ret.pk, description=description,
+                )
+                if ret.total_fine_amount > 0:
+                    yield AccountLedgerEntry(
+                        account=sale.paid_to_account, entry_date=ret.return_date,
+                        amount=-ret.total_fine_amount, currency=sale.paid_to_account.currency,
+                        source_type=source.RETURN_FINE, source_id=ret.pk, description=description,
+                    )
+            if ret.fine_paid_to_account and ret.fine_paid_to_account_id != sale.paid_to_account_id:
+                yield AccountLedgerEntry(
+                    account=ret.fine_paid_to_account, entry_date=ret.return_date,
+                    amount=ret.total_fine_amount, currency=ret.fine_paid_to_account.currency,
+                    source_type=source.RETURN_FINE, source_id=ret.pk, description=description,
+                )
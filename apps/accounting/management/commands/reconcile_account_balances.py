@@ -0,0 +1,54 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.accounting.services import AccountReconciliationService
+from apps.core.services import DateFilterService
+
+
+class Command(BaseCommand):
+    help = "Compare financial account balances with their postings (sales, payments, transfers, ...) and optionally fix drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', type=int, action='append', dest='accounts',
+                            help='Only check the account with this id (repeatable)')
+        parser.add_argument('--since', help='Only check accounts touched at or after this date/datetime (ISO format)')
+        parser.add_argument('--tolerance', type=Decimal, default=AccountReconciliationService.TOLERANCE,
+                            help='Ignore differences up to this amount')
+        parser.add_argument('--fix', action='store_true',
+                            help='Rewrite drifted balances to their source totals (dry run by default)')
+        parser.add_argument('--baseline', action='store_true',
+                            help='Record opening balances that make the current balances reconcile (run once)')
+
+    def handle(self, *args, **options):
+        started_at = timezone.now()
+        account_ids = options['accounts']
+        if options['since']:
+            since = DateFilterService.parse_moment(options['since'])
+            if since is None:
+                raise CommandError("--since must be an ISO date or datetime")
+            touched = AccountReconciliationService.touched_since(since)
+            account_ids = sorted(touched & set(account_ids)) if account_ids else sorted(touched)
+            self.stdout.write(f"{len(account_ids)} accounts touched since {timezone.localtime(since):%Y-%m-%d %H:%M}")
+
+        if options['baseline']:
+            updated = AccountReconciliationService.baseline_initial_balances(account_ids)
+            self.stdout.write(self.style.SUCCESS(f"Opening balances recorded for {updated} accounts"))
+            return
+
+        drifts = AccountReconciliationService.find_drift(account_ids, options['tolerance'])
+        for drift in drifts:
+            self.stdout.write(self.style.ERROR(f"{drift['name']} (id {drift['id']}, {drift['currency']})"))
+            self.stdout.write(
+                f"  stored={drift['stored']}, expected={drift['expected']}, "
+                f"ledger={drift['ledger']}, diff={drift['diff']:+}"
+            )
+
+        if not drifts:
+            self.stdout.write(self.style.SUCCESS("All account balances match their postings"))
+        elif options['fix']:
+            updated = AccountReconciliationService.apply_fixes(drifts)
+            self.stdout.write(self.style.SUCCESS(f"Fixed {updated} account balances"))
+        else:
+            self.stdout.write(self.style.WARNING(f"Found {len(drifts)} drifted accounts. Run with --fix to correct them."))
+
+        self.stdout.write(f"Next run: --since {timezone.localtime(started_at).isoformat(timespec='seconds')}")
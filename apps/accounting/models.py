@@ -1,8 +1,13 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
 from django.db import models
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from apps.core.constants import CurrencyChoices, AccountTypeChoices
+from apps.core.services import BalanceDeltaCollector, CacheVersionService, DateFilterService
 
 
 class FinancialAccount(models.Model):
@@ -15,11 +20,22 @@ class FinancialAccount(models.Model):
         default=0.00,
         help_text="Hisobning joriy balansi"
     )
+    initial_balance = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        default=0,
+        help_text="Hisob ochilgandagi balans"
+    )
     account_details = models.TextField(blank=True, null=True, help_text="E.g., last 4 digits of card, bank account number")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def save(self, *args, **kwargs):
+        if not self.pk:
+            self.initial_balance = self.current_balance
+        super().save(*args, **kwargs)
+
     def has_sufficient_balance(self, amount):
         """Check if account has sufficient balance for the given amount"""
         return self.current_balance >= amount
@@ -28,6 +44,58 @@ class FinancialAccount(models.Model):
         """Return formatted balance with currency"""
         return f"{self.current_balance:,.2f} {self.currency}"
 
+    def adjust_balance(self, amount):
+        """Add ``amount`` to current_balance with a single UPDATE and refresh that field"""
+        CacheVersionService.bump_on_commit(CacheVersionService.ACCOUNTS)
+        collector = BalanceDeltaCollector.current()
+        if collector is not None:
+            collector.add(self, 'current_balance', amount)
+            return
+        FinancialAccount.objects.filter(pk=self.pk).update(
+            current_balance=F('current_balance') + amount, updated_at=timezone.now()
+        )
+        self.refresh_from_db(fields=['current_balance', 'updated_at'])
+
+    def post_entry(self, amount, source_type, source_id, entry_date=None, **details):
+        """Apply a balance change and journal it in the ledger"""
+        with transaction.atomic():
+            self.adjust_balance(amount)
+            return AccountLedgerEntry.record(self, amount, source_type, source_id, entry_date=entry_date, **details)
+
+    def balance_as_of(self, when):
+        """
+        Balance at the end of ``when`` (a date) or at the exact moment ``when`` (an aware datetime).
+        Resolved from the nearest daily snapshot plus at most one day of ledger entries.
+        """
+        if isinstance(when, datetime):
+            day = timezone.localdate(when)
+            base = self._closing_balance_before(day)
+            day_entries = self.ledger_entries.filter(
+                entry_date__gte=DateFilterService.day_start(day), entry_date__lte=when
+            )
+            return base + (day_entries.aggregate(total=Sum('amount'))['total'] or Decimal('0'))
+
+        snapshot = self.daily_balances.filter(date__lte=when).order_by('-date').first()
+        if snapshot:
+            return snapshot.closing_balance
+        return self._closing_balance_before(when)
+
+    def _closing_balance_before(self, day):
+        """Closing balance of the last day before ``day``"""
+        previous = self.daily_balances.filter(date__lt=day).order_by('-date').first()
+        if previous:
+            return previous.closing_balance
+
+        # Nothing recorded before ``day``: the opening balance is the first snapshot minus its own day's movement
+        first = self.daily_balances.order_by('date').first()
+        if not first:
+            return self.current_balance
+        first_day_total = self.ledger_entries.filter(
+            entry_date__gte=DateFilterService.day_start(first.date),
+            entry_date__lt=DateFilterService.day_start(first.date + timedelta(days=1)),
+        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        return first.closing_balance - first_day_total
+
     def __str__(self):
         return f"{self.name} ({self.get_account_type_display()} - {self.currency}) - Balance: {self.current_balance}"
 
@@ -115,15 +183,31 @@ class Transfer(models.Model):
         self.full_clean()
         
         with transaction.atomic():
-            # Update account balances
-            self.from_account.current_balance -= self.amount
-            self.from_account.save(update_fields=['current_balance', 'updated_at'])
-            
-            self.to_account.current_balance += self.converted_amount
-            self.to_account.save(update_fields=['current_balance', 'updated_at'])
-            
             # Save the transfer record
             super().save(*args, **kwargs)
+            
+            # Move the money and journal both legs of the transfer
+            for account, amount, source_type, details in self.ledger_legs():
+                account.post_entry(amount, source_type, self.pk, entry_date=self.transfer_date, **details)
+
+    def ledger_legs(self):
+        """(account, amount, source type, entry details) for the outgoing and incoming legs"""
+        rate_suffix = f" (Rate: {self.conversion_rate:,.4f})" if self.is_cross_currency() else ""
+        note_suffix = f" - {self.description}" if self.description else ""
+        return [
+            (self.from_account, -self.amount, AccountLedgerEntry.SourceType.TRANSFER_OUT, {
+                'description': f"Transfer to {self.to_account.name}{rate_suffix}{note_suffix}"[:255],
+                'conversion_rate': self.conversion_rate,
+                'counter_amount': self.converted_amount,
+                'counter_currency': self.to_account.currency,
+            }),
+            (self.to_account, self.converted_amount, AccountLedgerEntry.SourceType.TRANSFER_IN, {
+                'description': f"Transfer from {self.from_account.name}{rate_suffix}{note_suffix}"[:255],
+                'conversion_rate': self.conversion_rate,
+                'counter_amount': self.amount,
+                'counter_currency': self.currency,
+            }),
+        ]
 
     def is_cross_currency(self):
         """Check if this is a cross-currency transfer"""
@@ -139,6 +223,9 @@ class Transfer(models.Model):
         verbose_name = "Transfer"
         verbose_name_plural = "Transfers"
         ordering = ['-transfer_date']
+        indexes = [
+            models.Index(fields=['updated_at'], name='transfer_updated_idx'),
+        ]
 
 
 class Deposit(models.Model):
@@ -172,11 +259,13 @@ class Deposit(models.Model):
         is_new = self.pk is None
         previous_amount = None
         previous_account_id = None
+        previous_date = None
         if not is_new:
             try:
                 original = Deposit.objects.get(pk=self.pk)
                 previous_amount = original.amount
                 previous_account_id = original.to_account_id
+                previous_date = original.deposit_date
             except Deposit.DoesNotExist:
                 pass
 
@@ -185,20 +274,31 @@ class Deposit(models.Model):
 
             if is_new:
                 # Positive amount -> add, Negative amount -> subtract
-                self.to_account.current_balance += self.amount
-                self.to_account.save(update_fields=['current_balance', 'updated_at'])
+                self._post_to_account(self.to_account, self.amount, entry_date=self.deposit_date)
             else:
-                if previous_account_id == self.to_account_id:
+                # Corrections are dated like the deposit, so balance_as_of() and the daily
+                # snapshots see the edited amount from the deposit's day on
+                if previous_account_id == self.to_account_id and previous_date == self.deposit_date:
                     amount_diff = self.amount - (previous_amount or 0)
-                    self.to_account.current_balance += amount_diff
-                    self.to_account.save(update_fields=['current_balance', 'updated_at'])
+                    if amount_diff:
+                        self._post_to_account(self.to_account, amount_diff, entry_date=self.deposit_date)
                 else:
+                    # Moved to another account or day: reverse it where it was, post it where it is
                     if previous_account_id:
                         original_account = FinancialAccount.objects.get(pk=previous_account_id)
-                        original_account.current_balance -= (previous_amount or 0)
-                        original_account.save(update_fields=['current_balance', 'updated_at'])
-                    self.to_account.current_balance += self.amount
-                    self.to_account.save(update_fields=['current_balance', 'updated_at'])
+                        self._post_to_account(original_account, -(previous_amount or 0), entry_date=previous_date)
+                    self._post_to_account(self.to_account, self.amount, entry_date=self.deposit_date)
+
+    def _post_to_account(self, account, amount, entry_date=None):
+        account.post_entry(
+            amount,
+            AccountLedgerEntry.SourceType.DEPOSIT, self.pk,
+            entry_date=entry_date,
+            **self.ledger_details()
+        )
+
+    def ledger_details(self):
+        return {'description': (self.description or 'Deposit')[:255], 'notes': self.notes or ''}
 
     def __str__(self):
         return f"Deposit: {self.amount} {self.currency} to {self.to_account.name}"
@@ -207,6 +307,9 @@ class Deposit(models.Model):
         verbose_name = "Deposit"
         verbose_name_plural = "Deposits"
         ordering = ['-deposit_date']
+        indexes = [
+            models.Index(fields=['updated_at'], name='deposit_updated_idx'),
+        ]
 
 
 class Expenditure(models.Model):
@@ -271,12 +374,11 @@ class Expenditure(models.Model):
             except Expenditure.DoesNotExist:
                 pass
         
-        super().save(*args, **kwargs)
-        
         with transaction.atomic():
+            super().save(*args, **kwargs)
+
             if is_new:
-                self.paid_from_account.current_balance -= self.amount
-                self.paid_from_account.save(update_fields=['current_balance', 'updated_at'])
+                self._post_to_account(self.paid_from_account, -self.amount, entry_date=self.expenditure_date)
             else:
                 self._update_balance_for_edit(original_expenditure)
 
@@ -287,16 +389,23 @@ class Expenditure(models.Model):
             
         amount_diff = self.amount - original_expenditure.amount
         
-        if self.paid_from_account_id == original_expenditure.paid_from_account_id:
-            self.paid_from_account.current_balance -= amount_diff
+        # Corrections are dated like the expenditure, as Deposit.save does
+        if (self.paid_from_account_id == original_expenditure.paid_from_account_id
+                and self.expenditure_date == original_expenditure.expenditure_date):
+            if amount_diff:
+                self._post_to_account(self.paid_from_account, -amount_diff, entry_date=self.expenditure_date)
         else:
             original_account = FinancialAccount.objects.get(pk=original_expenditure.paid_from_account_id)
-            original_account.current_balance += original_expenditure.amount
-            original_account.save(update_fields=['current_balance', 'updated_at'])
-            
-            self.paid_from_account.current_balance -= self.amount
-        
-        self.paid_from_account.save(update_fields=['current_balance', 'updated_at'])
+            self._post_to_account(original_account, original_expenditure.amount, entry_date=original_expenditure.expenditure_date)
+            self._post_to_account(self.paid_from_account, -self.amount, entry_date=self.expenditure_date)
+
+    def _post_to_account(self, account, amount, entry_date=None):
+        account.post_entry(
+            amount,
+            AccountLedgerEntry.SourceType.EXPENDITURE, self.pk,
+            entry_date=entry_date,
+            description=self.description[:255],
+        )
 
     def __str__(self):
         return f"{self.description} - {self.amount} {self.currency} on {self.expenditure_date.strftime('%Y-%m-%d')}"
@@ -305,3 +414,184 @@ class Expenditure(models.Model):
         verbose_name = "Expenditure"
         verbose_name_plural = "Expenditures"
         ordering = ['-expenditure_date']
+        indexes = [
+            models.Index(fields=['-expenditure_date'], name='expenditure_date_idx'),
+            models.Index(fields=['updated_at'], name='expenditure_updated_idx'),
+        ]
+
+
+class AccountLedgerEntry(models.Model):
+    """Append-only journal of every change applied to FinancialAccount.current_balance"""
+
+    class SourceType(models.TextChoices):
+        SALE = 'SALE', 'Sotuv (Mijoz)'
+        AGENT_PAYMENT = 'AGENT_PAYMENT', "Agent To'lovi"
+        SUPPLIER_PAYMENT = 'SUPPLIER_PAYMENT', "Ta'minotchi To'lovi"
+        EXPENDITURE = 'EXPENDITURE', 'Xarajat'
+        TRANSFER_OUT = 'TRANSFER_OUT', 'Transfer (Chiqim)'
+        TRANSFER_IN = 'TRANSFER_IN', 'Transfer (Kirim)'
+        DEPOSIT = 'DEPOSIT', 'Kirim/Chiqim (Deposit)'
+        RETURN_REFUND = 'RETURN_REFUND', "Qaytarish (To'lov)"
+        RETURN_FINE = 'RETURN_FINE', 'Qaytarish (Jarima)'
+
+    account = models.ForeignKey(
+        FinancialAccount,
+        on_delete=models.PROTECT,
+        related_name='ledger_entries'
+    )
+    entry_date = models.DateTimeField(default=timezone.now)
+    amount = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        help_text="Signed amount. Positive increases the account balance."
+    )
+    currency = models.CharField(max_length=3, choices=CurrencyChoices.choices)
+    source_type = models.CharField(max_length=20, choices=SourceType.choices)
+    source_id = models.PositiveBigIntegerField()
+
+    # Display details captured at posting time so the dashboard never joins back to the source
+    description = models.CharField(max_length=255, blank=True, default='')
+    notes = models.TextField(blank=True, null=True)
+    conversion_rate = models.DecimalField(max_digits=10, decimal_places=4, null=True, blank=True)
+    counter_amount = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Amount on the other side of a cross-currency operation"
+    )
+    counter_currency = models.CharField(max_length=3, choices=CurrencyChoices.choices, null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def record(cls, account, amount, source_type, source_id, entry_date=None, **details):
+        """Append an entry for a balance change that was just applied to ``account``"""
+        with transaction.atomic():
+            entry = cls.objects.create(
+                account=account,
+                entry_date=entry_date or timezone.now(),
+                amount=amount,
+                currency=account.currency,
+                source_type=source_type,
+                source_id=source_id,
+                **details
+            )
+            AccountDailyBalance.apply_delta(account, entry.entry_date, amount)
+        return entry
+
+    @classmethod
+    def post_many(cls, entries):
+        """
+        Insert unsaved ``entries`` and apply their balance changes: one net delta per
+        account and one per account-day. Run it inside an active BalanceDeltaCollector
+        to get a single balance UPDATE per account.
+        """
+        with transaction.atomic():
+            cls.objects.bulk_create(entries)
+
+            accounts = {}
+            net = {}
+            daily = {}
+            for entry in entries:
+                accounts.setdefault(entry.account_id, entry.account)
+                net[entry.account_id] = net.get(entry.account_id, 0) + entry.amount
+                day = timezone.localdate(entry.entry_date)
+                bucket = daily.setdefault((entry.account_id, day), [entry.entry_date, 0])
+                bucket[1] += entry.amount
+            for account_id, amount in net.items():
+                accounts[account_id].adjust_balance(amount)
+            # Oldest day first, so a first snapshot is derived before later days build on it
+            for (account_id, _), (entry_date, amount) in sorted(daily.items(), key=lambda item: item[0][1]):
+                AccountDailyBalance.apply_delta(accounts[account_id], entry_date, amount)
+        return entries
+
+    @property
+    def balance_effect(self):
+        return 'income' if self.amount >= 0 else 'expense'
+
+    def __str__(self):
+        return f"{self.get_source_type_display()} #{self.source_id}: {self.amount} {self.currency} ({self.account.name})"
+
+    class Meta:
+        verbose_name = "Account Ledger Entry"
+        verbose_name_plural = "Account Ledger Entries"
+        ordering = ['-entry_date', '-id']
+        indexes = [
+            models.Index(fields=['account', '-entry_date', '-id'], name='ledger_account_date_idx'),
+            models.Index(fields=['-entry_date', '-id'], name='ledger_date_idx'),
+            models.Index(fields=['source_type', 'source_id'], name='ledger_source_idx'),
+            models.Index(fields=['created_at'], name='ledger_created_idx'),
+        ]
+
+
+class AccountDailyBalance(models.Model):
+    """Closing balance of an account per local day, kept in step with the ledger"""
+    account = models.ForeignKey(
+        FinancialAccount,
+        on_delete=models.CASCADE,
+        related_name='daily_balances'
+    )
+    date = models.DateField()
+    closing_balance = models.DecimalField(max_digits=20, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def apply_delta(cls, account, entry_date, amount):
+        """
+        Shift the closing balance of the entry's day and every later snapshot by ``amount``.
+        Expects the delta to already be applied to ``account.current_balance``
+        or pending in the active BalanceDeltaCollector.
+        """
+        day = timezone.localdate(entry_date)
+        cls.objects.filter(account=account, date__gte=day).update(
+            closing_balance=F('closing_balance') + amount
+        )
+        if cls.objects.filter(account=account, date=day).exists():
+            return
+
+        previous = cls.objects.filter(account=account, date__lt=day).order_by('-date').first()
+        if previous:
+            closing = previous.closing_balance + amount
+        else:
+            # First snapshot for this account: walk back from the stored balance
+            current = FinancialAccount.objects.filter(pk=account.pk).values_list('current_balance', flat=True).get()
+            current += BalanceDeltaCollector.pending_delta(FinancialAccount, account.pk, 'current_balance')
+            later_total = AccountLedgerEntry.objects.filter(
+                account=account, entry_date__gte=DateFilterService.day_start(day + timedelta(days=1))
+            ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+            closing = current - later_total
+        try:
+            with transaction.atomic():
+                cls.objects.create(account=account, date=day, closing_balance=closing)
+        except IntegrityError:
+            # A concurrent first posting on this day created the snapshot; add to it instead
+            cls.objects.filter(account=account, date=day).update(closing_balance=F('closing_balance') + amount)
+
+    @classmethod
+    def rebuild(cls, account):
+        """Recreate every snapshot of ``account`` from its ledger. Returns the number of rows written."""
+        cls.objects.filter(account=account).delete()
+        daily_totals = account.ledger_entries.annotate(
+            day=TruncDate('entry_date', tzinfo=timezone.get_current_timezone())
+        ).values('day').annotate(total=Sum('amount')).order_by('day')
+
+        ledger_total = sum((row['total'] for row in daily_totals), Decimal('0'))
+        running = account.current_balance - ledger_total
+        snapshots = []
+        for row in daily_totals:
+            running += row['total']
+            snapshots.append(cls(account=account, date=row['day'], closing_balance=running))
+        cls.objects.bulk_create(snapshots)
+        return len(snapshots)
+
+    def __str__(self):
+        return f"{self.account.name} {self.date}: {self.closing_balance}"
+
+    class Meta:
+        verbose_name = "Account Daily Balance"
+        verbose_name_plural = "Account Daily Balances"
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'date'], name='unique_account_daily_balance'),
+        ]
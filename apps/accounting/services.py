@@ -0,0 +1,288 @@
+from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+from django.utils import timezone
+import logging
+
+from apps.core.services import BalanceDeltaCollector, CacheVersionService, DateFilterService
+from .models import AccountDailyBalance, AccountLedgerEntry, Deposit, Expenditure, FinancialAccount, Transfer
+
+logger = logging.getLogger(__name__)
+
+MONEY = DecimalField(max_digits=20, decimal_places=2)
+
+
+class AccountReconciliationService:
+    """
+    Expected FinancialAccount balances recomputed from the rows that post to them.
+
+    Every posting source is summed per account with one GROUP BY query, mirroring
+    the amounts the services post (and rebuild_account_ledger replays).
+    """
+
+    TOLERANCE = Decimal('0.01')
+
+    @staticmethod
+    def posting_sources():
+        """(name, queryset, account field, signed amount expression) for every balance movement"""
+        from apps.contacts.models import AgentPayment, SupplierPayment
+        from apps.sales.models import Sale, TicketReturn, TicketReturnQuerySet
+
+        return_amounts = TicketReturnQuerySet.amount_expressions()
+        returned_amount = return_amounts['returned_acquisition_amount'][0]
+        fine_amount = return_amounts['total_fine_amount'][0]
+        customer_returns = TicketReturn.objects.filter(
+            original_sale__agent__isnull=True, original_sale__paid_to_account__isnull=False
+        )
+        return [
+            ('client_sales', Sale.objects.filter(agent__isnull=True, paid_to_account__isnull=False),
+             'paid_to_account', F('total_sale_amount')),
+            # Cross-currency payments land in the account in their original currency
+            ('agent_payments', AgentPayment.objects.all(), 'paid_to_account', Case(
+                When(exchange_rate__isnull=False, original_amount__isnull=False, then=F('original_amount')),
+                default=F('amount'),
+            )),
+            ('supplier_payments', SupplierPayment.objects.all(), 'paid_from_account', -F('amount')),
+            ('expenditures', Expenditure.objects.all(), 'paid_from_account', -F('amount')),
+            ('transfers_out', Transfer.objects.all(), 'from_account', -F('amount')),
+            ('transfers_in', Transfer.objects.all(), 'to_account', F('converted_amount')),
+            ('deposits', Deposit.objects.all(), 'to_account', F('amount')),
+            ('return_refunds', customer_returns, 'original_sale__paid_to_account', -(returned_amount + fine_amount)),
+            # Fines collected into a different account than the refund came from
+            ('return_fines', TicketReturn.objects.filter(
+                original_sale__agent__isnull=True, fine_paid_to_account__isnull=False
+            ).exclude(fine_paid_to_account=F('original_sale__paid_to_account')), 'fine_paid_to_account', fine_amount),
+        ]
+
+    @staticmethod
+    def touched_since(since):
+        """Ids of accounts whose balance, ledger or posting rows changed at or after ``since``"""
+        touched = set(FinancialAccount.objects.filter(updated_at__gte=since).values_list('pk', flat=True))
+        touched.update(
+            AccountLedgerEntry.objects.filter(created_at__gte=since).values_list('account_id', flat=True).distinct()
+        )
+        for _, queryset, account_field, _ in AccountReconciliationService.posting_sources():
+            rows = DateFilterService.changed_since(queryset.model.objects.all(), since)
+            touched.update(rows.order_by().values_list(account_field, flat=True).distinct())
+        touched.discard(None)
+        return touched
+
+    @staticmethod
+    def expected_balances(account_ids=None):
+        """{account_id: {'expected': ..., 'ledger': ...}}: initial balance plus source totals / ledger total"""
+        accounts = FinancialAccount.objects.all()
+        ledger = AccountLedgerEntry.objects.all()
+        if account_ids is not None:
+            accounts = accounts.filter(pk__in=account_ids)
+            ledger = ledger.filter(account_id__in=account_ids)
+        balances = {
+            pk: {'expected': initial, 'ledger': initial}
+            for pk, initial in accounts.values_list('pk', 'initial_balance')
+        }
+
+        for _, queryset, account_field, amount in AccountReconciliationService.posting_sources():
+            if account_ids is not None:
+                queryset = queryset.filter(**{f'{account_field}__in': account_ids})
+            rows = queryset.order_by().values(account_id=F(account_field)).annotate(
+                total=Sum(amount, output_field=MONEY)
+            )
+            for row in rows:
+                if row['account_id'] in balances:
+                    balances[row['account_id']]['expected'] += row['total'] or 0
+
+        for row in ledger.order_by().values('account_id').annotate(total=Sum('amount')):
+            balances[row['account_id']]['ledger'] += row['total'] or 0
+        return balances
+
+    @staticmethod
+    def find_drift(account_ids=None, tolerance=TOLERANCE):
+        """
+        Accounts whose stored balance is off from their sources or their ledger by more than ``tolerance``.
+
+        Each item is {'id', 'name', 'currency', 'stored', 'expected', 'ledger', 'diff'};
+        diff is expected minus stored.
+        """
+        accounts = FinancialAccount.objects.all()
+        if account_ids is not None:
+            accounts = accounts.filter(pk__in=account_ids)
+
+        with transaction.atomic():
+            stored = list(accounts.order_by('pk').values_list('pk', 'name', 'currency', 'current_balance'))
+            balances = AccountReconciliationService.expected_balances(account_ids)
+
+        drifts = []
+        for pk, name, currency, current in stored:
+            expected = balances[pk]['expected']
+            ledger = balances[pk]['ledger']
+            if abs(expected - current) > tolerance or abs(ledger - current) > tolerance:
+                drifts.append({
+                    'id': pk, 'name': name, 'currency': currency, 'stored': current,
+                    'expected': expected, 'ledger': ledger, 'diff': expected - current,
+                })
+        return drifts
+
+    @staticmethod
+    def apply_fixes(drifts):
+        """
+        Shift the drifted balances to the source totals with one UPDATE and
+        rebuild their daily snapshots, all in one transaction. Returns the
+        number of accounts updated.
+        """
+        drifts = [drift for drift in drifts if drift['diff']]
+        if not drifts:
+            return 0
+        with transaction.atomic():
+            updated = FinancialAccount.objects.filter(pk__in=[drift['id'] for drift in drifts]).update(
+                current_balance=F('current_balance') + Case(
+                    *[When(pk=drift['id'], then=Value(drift['diff'])) for drift in drifts],
+                    default=Value(Decimal('0')), output_field=MONEY,
+                ),
+                updated_at=timezone.now(),
+            )
+            for account in FinancialAccount.objects.filter(pk__in=[drift['id'] for drift in drifts]):
+                AccountDailyBalance.rebuild(account)
+            CacheVersionService.bump_on_commit(CacheVersionService.ACCOUNTS)
+        logger.info(f"Reconciled {updated} financial account balances")
+        return updated
+
+    @staticmethod
+    def baseline_initial_balances(account_ids=None):
+        """
+        Set initial_balance so that today's stored balances reconcile exactly.
+
+        Meant to run once for accounts created before initial_balance was
+        recorded. Returns the number of accounts updated.
+        """
+        with transaction.atomic():
+            accounts = FinancialAccount.objects.select_for_update()
+            if account_ids is not None:
+                accounts = accounts.filter(pk__in=account_ids)
+            stored = dict(accounts.values_list('pk', 'current_balance'))
+            balances = AccountReconciliationService.expected_balances(account_ids)
+            whens = [
+                When(pk=pk, then=Value(current - (balances[pk]['expected'] - initial)))
+                for pk, initial, current in FinancialAccount.objects.filter(pk__in=stored).values_list(
+                    'pk', 'initial_balance', 'current_balance'
+                )
+            ]
+            if not whens:
+                return 0
+            return FinancialAccount.objects.filter(pk__in=stored).update(
+                initial_balance=Case(*whens, output_field=MONEY)
+            )
+
+
+class PostingBatchService:
+    """
+    All-or-nothing posting of many transfers and deposits.
+
+    The involved accounts are locked once, every operation is validated against
+    the running balances of the batch, the records and ledger entries are
+    bulk-inserted and each account gets a single net balance UPDATE.
+    """
+
+    MAX_OPERATIONS = 200
+    TYPES = ('transfer', 'deposit')
+
+    @staticmethod
+    def post(operations):
+        """
+        ``operations`` is a list of dicts with 'type' ('transfer' or 'deposit') plus
+        the TransferForm / DepositForm fields. Returns (transfers, deposits); raises
+        ValidationError with a {index: [messages]} dict when any operation is invalid.
+        """
+        from apps.core.forms import form_error_messages
+        from .forms import DepositForm, TransferForm
+
+        if not operations:
+            raise ValidationError("Amallar ro'yxati bo'sh")
+        if len(operations) > PostingBatchService.MAX_OPERATIONS:
+            raise ValidationError(f"Bir paketda ko'pi bilan {PostingBatchService.MAX_OPERATIONS} ta amal bo'lishi mumkin")
+
+        with transaction.atomic(), BalanceDeltaCollector():
+            accounts = PostingBatchService._lock_accounts(operations)
+            running = {pk: account.current_balance for pk, account in accounts.items()}
+
+            errors = {}
+            transfers, deposits = [], []
+            for index, operation in enumerate(operations):
+                data = dict(operation) if isinstance(operation, dict) else {}
+                kind = data.pop('type', None)
+                if kind not in PostingBatchService.TYPES:
+                    errors[index] = ["Amal turi 'transfer' yoki 'deposit' bo'lishi kerak"]
+                    continue
+
+                date_field = 'transfer_date' if kind == 'transfer' else 'deposit_date'
+                data.setdefault(date_field, timezone.now())
+                form = (TransferForm if kind == 'transfer' else DepositForm)(data)
+                if not form.is_valid():
+                    errors[index] = form_error_messages(form)
+                    continue
+                instance = form.save(commit=False)
+                try:
+                    # Computes converted_amount and re-checks the model rules, as save() would
+                    instance.full_clean()
+                except ValidationError as error:
+                    errors[index] = error.messages
+                    continue
+
+                if kind == 'transfer':
+                    if running[instance.from_account_id] < instance.amount:
+                        errors[index] = [
+                            f"{instance.from_account.name}: paket davomida mablag' yetarli emas "
+                            f"(mavjud: {running[instance.from_account_id]:,.2f} {instance.from_account.currency})"
+                        ]
+                        continue
+                    running[instance.from_account_id] -= instance.amount
+                    running[instance.to_account_id] += instance.converted_amount
+                    transfers.append(instance)
+                else:
+                    running[instance.to_account_id] += instance.amount
+                    deposits.append(instance)
+
+            if errors:
+                raise ValidationError(errors)
+
+            Transfer.objects.bulk_create(transfers)
+            Deposit.objects.bulk_create(deposits)
+            PostingBatchService._post_ledger(transfers, deposits)
+
+        logger.info(f"Posted batch of {len(transfers)} transfers and {len(deposits)} deposits")
+        return transfers, deposits
+
+    @staticmethod
+    def _lock_accounts(operations):
+        """Lock every referenced account in primary key order, so concurrent batches cannot deadlock"""
+        ids = set()
+        for operation in operations:
+            if not isinstance(operation, dict):
+                continue
+            for field in ('from_account', 'to_account'):
+                try:
+                    ids.add(int(operation[field]))
+                except (KeyError, TypeError, ValueError):
+                    pass
+        return {
+            account.pk: account
+            for account in FinancialAccount.objects.select_for_update().filter(pk__in=ids).order_by('pk')
+        }
+
+    @staticmethod
+    def _post_ledger(transfers, deposits):
+        """Journal every leg; the balances move by one net delta per account and per account-day"""
+        entries = []
+        for transfer in transfers:
+            for account, amount, source_type, details in transfer.ledger_legs():
+                entries.append(AccountLedgerEntry(
+                    account=account, entry_date=transfer.transfer_date, amount=amount,
+                    currency=account.currency, source_type=source_type, source_id=transfer.pk, **details
+                ))
+        for deposit in deposits:
+            entries.append(AccountLedgerEntry(
+                account=deposit.to_account, entry_date=deposit.deposit_date, amount=deposit.amount,
+                currency=deposit.to_account.currency, source_type=AccountLedgerEntry.SourceType.DEPOSIT,
+                source_id=deposit.pk, **deposit.ledger_details()
+            ))
+        # Queued on the active collector: one UPDATE per account when the batch commits
+        AccountLedgerEntry.post_many(entries)
@@ -1,3 +1,199 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError
+from django.db.models import Sum
 from django.test import TestCase
+from django.utils import timezone
+from .models import FinancialAccount, AccountLedgerEntry, AccountDailyBalance, Transfer, Deposit, Expenditure
+from .services import PostingBatchService
 
-# Create your tests here.
+
+class LedgerTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.uzs = FinancialAccount.objects.create(
+            name='Kassa UZS', account_type='CASH_UZS', currency='UZS', current_balance=Decimal('1000000')
+        )
+        cls.uzs_bank = FinancialAccount.objects.create(
+            name='Bank UZS', account_type='BANK_UZS', currency='UZS', current_balance=Decimal('0')
+        )
+        cls.usd = FinancialAccount.objects.create(
+            name='Kassa USD', account_type='CASH_USD', currency='USD', current_balance=Decimal('1000')
+        )
+
+    def days_ago(self, days):
+        return timezone.now() - timedelta(days=days)
+
+    def assertLedgerMatchesBalance(self, account):
+        """The stored balance is the opening balance plus every ledger entry of the account"""
+        account.refresh_from_db()
+        ledger_total = account.ledger_entries.aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        self.assertEqual(account.current_balance, account.initial_balance + ledger_total)
+
+
+class LedgerInvariantTests(LedgerTestCase):
+    def test_same_currency_transfer_posts_both_legs(self):
+        transfer = Transfer.objects.create(
+            from_account=self.uzs, to_account=self.uzs_bank, amount=Decimal('250000'), currency='UZS'
+        )
+
+        entries = AccountLedgerEntry.objects.filter(source_id=transfer.pk).order_by('amount')
+        self.assertEqual(
+            [(entry.account_id, entry.amount, entry.source_type) for entry in entries],
+            [(self.uzs.pk, Decimal('-250000'), AccountLedgerEntry.SourceType.TRANSFER_OUT),
+             (self.uzs_bank.pk, Decimal('250000'), AccountLedgerEntry.SourceType.TRANSFER_IN)],
+        )
+        self.assertTrue(all(entry.entry_date == transfer.transfer_date for entry in entries))
+        for account in (self.uzs, self.uzs_bank):
+            self.assertLedgerMatchesBalance(account)
+
+    def test_cross_currency_transfer_posts_converted_amount(self):
+        Transfer.objects.create(
+            from_account=self.usd, to_account=self.uzs, amount=Decimal('100'), currency='USD',
+            conversion_rate=Decimal('12500'),
+        )
+
+        self.uzs.refresh_from_db()
+        self.assertEqual(self.uzs.current_balance, Decimal('2250000'))
+        for account in (self.usd, self.uzs):
+            self.assertLedgerMatchesBalance(account)
+
+    def test_deposit_edits_keep_ledger_in_step(self):
+        deposit = Deposit.objects.create(
+            deposit_date=self.days_ago(3), to_account=self.uzs, amount=Decimal('50000'), currency='UZS'
+        )
+        deposit.amount = Decimal('80000')
+        deposit.save()
+        deposit.to_account = self.uzs_bank
+        deposit.deposit_date = self.days_ago(1)
+        deposit.save()
+
+        self.uzs.refresh_from_db()
+        self.uzs_bank.refresh_from_db()
+        self.assertEqual(self.uzs.current_balance, Decimal('1000000'))
+        self.assertEqual(self.uzs_bank.current_balance, Decimal('80000'))
+        for account in (self.uzs, self.uzs_bank):
+            self.assertLedgerMatchesBalance(account)
+
+    def test_expenditure_edits_keep_ledger_in_step(self):
+        expenditure = Expenditure.objects.create(
+            expenditure_date=self.days_ago(2), paid_from_account=self.usd,
+            amount=Decimal('40'), currency='USD', description='Ijara',
+        )
+        expenditure.amount = Decimal('65')
+        expenditure.save()
+
+        self.usd.refresh_from_db()
+        self.assertEqual(self.usd.current_balance, Decimal('935'))
+        self.assertLedgerMatchesBalance(self.usd)
+        self.assertEqual(
+            set(self.usd.ledger_entries.values_list('entry_date', flat=True)), {expenditure.expenditure_date}
+        )
+
+
+class BalanceAsOfTests(LedgerTestCase):
+    def setUp(self):
+        # Opening balance sits before every posting below
+        Deposit.objects.create(deposit_date=self.days_ago(6), to_account=self.uzs_bank, amount=Decimal('500'), currency='UZS')
+        Deposit.objects.create(deposit_date=self.days_ago(4), to_account=self.uzs_bank, amount=Decimal('300'), currency='UZS')
+        self.expenditure = Expenditure.objects.create(
+            expenditure_date=self.days_ago(2), paid_from_account=self.uzs_bank,
+            amount=Decimal('120'), currency='UZS', description='Ijara',
+        )
+
+    def expected(self, day):
+        """Balance at the end of ``day`` summed straight from the source rows"""
+        deposits = sum(
+            deposit.amount for deposit in Deposit.objects.filter(to_account=self.uzs_bank)
+            if timezone.localdate(deposit.deposit_date) <= day
+        )
+        expenditures = sum(
+            expenditure.amount for expenditure in Expenditure.objects.filter(paid_from_account=self.uzs_bank)
+            if timezone.localdate(expenditure.expenditure_date) <= day
+        )
+        return self.uzs_bank.initial_balance + deposits - expenditures
+
+    def assertAsOfMatchesSources(self):
+        self.uzs_bank.refresh_from_db()
+        for days in range(8, -1, -1):
+            day = timezone.localdate(self.days_ago(days))
+            self.assertEqual(self.uzs_bank.balance_as_of(day), self.expected(day), day)
+        self.assertEqual(self.uzs_bank.current_balance, self.expected(timezone.localdate()))
+
+    def test_as_of_each_day(self):
+        self.assertAsOfMatchesSources()
+
+    def test_as_of_a_moment_within_the_day(self):
+        moment = self.expenditure.expenditure_date
+        self.assertEqual(self.uzs_bank.balance_as_of(moment - timedelta(seconds=1)), Decimal('800'))
+        self.assertEqual(self.uzs_bank.balance_as_of(moment), Decimal('680'))
+
+    def test_edits_that_move_a_row_to_another_day(self):
+        self.expenditure.amount = Decimal('150')
+        self.expenditure.save()
+        self.expenditure.expenditure_date = self.days_ago(5)
+        self.expenditure.save()
+
+        self.assertAsOfMatchesSources()
+
+    def test_snapshots_match_a_rebuild(self):
+        incremental = list(self.uzs_bank.daily_balances.order_by('date').values_list('date', 'closing_balance'))
+        AccountDailyBalance.rebuild(self.uzs_bank)
+        rebuilt = list(self.uzs_bank.daily_balances.order_by('date').values_list('date', 'closing_balance'))
+
+        self.assertEqual(incremental, rebuilt)
+
+
+class PostingBatchTests(LedgerTestCase):
+    def operations(self):
+        return [
+            {'type': 'transfer', 'from_account': self.uzs.pk, 'to_account': self.uzs_bank.pk, 'amount': '400000'},
+            {'type': 'deposit', 'to_account': self.usd.pk, 'amount': '50', 'currency': 'USD'},
+            {'type': 'transfer', 'from_account': self.uzs.pk, 'to_account': self.uzs_bank.pk, 'amount': '500000'},
+        ]
+
+    def balances(self):
+        return list(FinancialAccount.objects.order_by('pk').values_list('current_balance', flat=True))
+
+    def assertNothingPosted(self, balances):
+        self.assertFalse(Transfer.objects.exists())
+        self.assertFalse(Deposit.objects.exists())
+        self.assertFalse(AccountLedgerEntry.objects.exists())
+        self.assertFalse(AccountDailyBalance.objects.exists())
+        self.assertEqual(self.balances(), balances)
+
+    def test_batch_posts_every_operation(self):
+        transfers, deposits = PostingBatchService.post(self.operations())
+
+        self.assertEqual((len(transfers), len(deposits)), (2, 1))
+        self.assertEqual(AccountLedgerEntry.objects.count(), 5)
+        self.uzs_bank.refresh_from_db()
+        self.assertEqual(self.uzs_bank.current_balance, Decimal('900000'))
+        for account in (self.uzs, self.uzs_bank, self.usd):
+            self.assertLedgerMatchesBalance(account)
+
+    def test_invalid_operation_rejects_whole_batch(self):
+        balances = self.balances()
+        operations = self.operations()
+        # The running balance of the batch leaves 100000 for the last transfer
+        operations.append(
+            {'type': 'transfer', 'from_account': self.uzs.pk, 'to_account': self.uzs_bank.pk, 'amount': '200000'}
+        )
+        operations.append({'type': 'withdrawal', 'to_account': self.usd.pk, 'amount': '5'})
+
+        with self.assertRaises(ValidationError) as raised:
+            PostingBatchService.post(operations)
+
+        self.assertEqual(set(raised.exception.message_dict), {3, 4})
+        self.assertNothingPosted(balances)
+
+    def test_failure_while_writing_rolls_back(self):
+        balances = self.balances()
+
+        with mock.patch.object(AccountLedgerEntry, 'post_many', side_effect=DatabaseError('disk full')):
+            with self.assertRaises(DatabaseError):
+                PostingBatchService.post(self.operations())
+
+        self.assertNothingPosted(balances)
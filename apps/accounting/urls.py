@@ -2,7 +2,7 @@ from django.urls import path
 from .views import (
     ExpenditureListView, ExpenditureCreateView,
     FinancialAccountListView, FinancialAccountCreateView,
-    api_accounts_list
+    api_accounts_list, api_account_balance_history
 )
 
 app_name = 'accounting'
@@ -13,4 +13,5 @@ urlpatterns = [
     path('accounts/', FinancialAccountListView.as_view(), name='financial-account-list'),
     path('accounts/create/', FinancialAccountCreateView.as_view(), name='financial-account-create'),
     path('api/accounts/', api_accounts_list, name='api-accounts-list'),
+    path('api/accounts/<int:pk>/balance-history/', api_account_balance_history, name='api-account-balance-history'),
 ] 
\ No newline at end of file
@@ -1,14 +1,18 @@
-from django.shortcuts import redirect
+from datetime import datetime, timedelta
+from django.shortcuts import redirect, get_object_or_404
 from django.views.generic import ListView, CreateView
 from django.urls import reverse_lazy
 from django.http import JsonResponse
+from django.utils import timezone
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.db.models import Sum, Q, Value, DecimalField
 from django.db.models.functions import Coalesce
 from .models import Expenditure, FinancialAccount
 from .forms import ExpenditureForm, FinancialAccountForm
-from apps.core.services import DateFilterService
+from apps.core.services import CacheVersionService, DateFilterService, ReferenceDataService
 
 
 class FinancialAccountListView(ListView):
@@ -73,7 +77,7 @@ class ExpenditureListView(ListView):
             self.filter_period, self.date_filter, self.start_date, self.end_date
         )
         
-        return queryset.filter(expenditure_date__date__range=[start_date, end_date])
+        return DateFilterService.filter_queryset(queryset, 'expenditure_date', start_date, end_date)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -113,6 +117,8 @@ class ExpenditureCreateView(CreateView):
 
 
 @login_required(login_url='/core/login/')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=lambda request: CacheVersionService.etag(ReferenceDataService.VERSION))
 def api_accounts_list(request):
     accounts = FinancialAccount.objects.filter(is_active=True).values(
         'id', 'name', 'currency'
@@ -126,3 +132,35 @@ def api_accounts_list(request):
         })
     
     return JsonResponse(result, safe=False)
+
+
+@login_required(login_url='/core/login/')
+def api_account_balance_history(request, pk):
+    """Daily closing balances of an account for ?start_date=&end_date= (YYYY-MM-DD, default last 30 days)"""
+    account = get_object_or_404(FinancialAccount, pk=pk)
+
+    try:
+        end_date = datetime.strptime(request.GET['end_date'], '%Y-%m-%d').date() if request.GET.get('end_date') else timezone.localdate()
+        start_date = datetime.strptime(request.GET['start_date'], '%Y-%m-%d').date() if request.GET.get('start_date') else end_date - timedelta(days=29)
+    except ValueError:
+        return JsonResponse({'error': "Sana formati noto'g'ri (YYYY-MM-DD)"}, status=400)
+    if start_date > end_date or (end_date - start_date).days > 366:
+        return JsonResponse({'error': "Sana oralig'i noto'g'ri (ko'pi bilan 366 kun)"}, status=400)
+
+    snapshots = dict(
+        account.daily_balances.filter(date__range=(start_date, end_date)).values_list('date', 'closing_balance')
+    )
+    balance = account.balance_as_of(start_date - timedelta(days=1))
+    history = []
+    day = start_date
+    while day <= end_date:
+        balance = snapshots.get(day, balance)
+        history.append({'date': day.isoformat(), 'balance': str(balance)})
+        day += timedelta(days=1)
+
+    return JsonResponse({
+        'account': {'id': account.pk, 'name': account.name, 'currency': account.currency},
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'history': history,
+    })
@@ -1,4 +1,6 @@
 from django.contrib import admin
+from django.db import transaction
+from apps.sales.models import SalesDailyRollup
 from .models import Agent, Supplier, AgentPayment, SupplierPayment, Commission
 
 @admin.register(Agent)
@@ -29,6 +31,24 @@ class CommissionAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('supplier', 'acquisition__ticket')
 
+    # Commissions are rolled up by date, supplier and acquisition salesperson; an edit moves the amount between keys
+    def save_model(self, request, obj, form, change):
+        if change:
+            stored = Commission.objects.select_related('acquisition').get(pk=obj.pk)
+            SalesDailyRollup.record_commission(stored, sign=-1)
+        super().save_model(request, obj, form, change)
+        SalesDailyRollup.record_commission(obj)
+
+    def delete_model(self, request, obj):
+        SalesDailyRollup.record_commission(obj, sign=-1)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            for commission in queryset.select_related('acquisition'):
+                SalesDailyRollup.record_commission(commission, sign=-1)
+            super().delete_queryset(request, queryset)
+
 @admin.register(SupplierPayment)
 class SupplierPaymentAdmin(admin.ModelAdmin):
     list_display = ('supplier', 'payment_date', 'amount', 'currency', 'paid_from_account')
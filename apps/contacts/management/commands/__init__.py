@@ -0,0 +1 @@
+"""Commands for contacts app."""
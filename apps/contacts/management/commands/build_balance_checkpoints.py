@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.contacts.models import Agent, Supplier, ContactBalanceCheckpoint
+from apps.contacts.services import ContactLedgerService
+
+
+class Command(BaseCommand):
+    help = "Build or extend per-period balance checkpoints used for statement prior balances."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', choices=['month', 'week'], default='month', help='Checkpoint granularity')
+        parser.add_argument('--contact-type', choices=['agent', 'supplier'], help='Only process one contact type')
+        parser.add_argument('--rebuild', action='store_true', help='Drop existing checkpoints and rebuild from scratch')
+
+    def handle(self, *args, **options):
+        period = options['period']
+        rebuild = options['rebuild']
+        contact_types = [options['contact_type']] if options['contact_type'] else ['agent', 'supplier']
+
+        created = 0
+        for contact_type in contact_types:
+            if contact_type == 'agent':
+                contacts = Agent.objects.all()
+                sources_for = ContactLedgerService.agent_sources
+            else:
+                contacts = Supplier.objects.all()
+                sources_for = ContactLedgerService.supplier_sources
+
+            for contact in contacts.iterator():
+                sources = sources_for(contact)
+                with transaction.atomic():
+                    for scope in ContactBalanceCheckpoint.Scope.values:
+                        created += ContactLedgerService.build_checkpoints(
+                            contact, sources, scope, period=period, rebuild=rebuild
+                        )
+
+        self.stdout.write(self.style.SUCCESS(f"Checkpoints up to date. Created: {created}"))
@@ -0,0 +1,42 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from apps.contacts.services import BalanceReconciliationService
+
+
+class Command(BaseCommand):
+    help = "Compare stored agent/supplier balances with the ones implied by their transactions and optionally fix drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--contact-type', choices=['agent', 'supplier'], help='Only reconcile one contact type')
+        parser.add_argument('--id', type=int, action='append', dest='ids',
+                            help='Only reconcile this contact (repeatable, requires --contact-type)')
+        parser.add_argument('--tolerance', type=Decimal, default=BalanceReconciliationService.TOLERANCE,
+                            help='Ignore differences up to this amount')
+        parser.add_argument('--fix', action='store_true', help='Correct the drifted balances (dry run by default)')
+
+    def handle(self, *args, **options):
+        if options['ids'] and not options['contact_type']:
+            raise CommandError("--id requires --contact-type")
+        contact_types = [options['contact_type']] if options['contact_type'] else ['agent', 'supplier']
+
+        total_drifts = 0
+        for contact_type in contact_types:
+            drifts = BalanceReconciliationService.find_drift(contact_type, options['ids'], options['tolerance'])
+            total_drifts += len(drifts)
+            for drift in drifts:
+                self.stdout.write(self.style.ERROR(f"{contact_type} {drift['id']} ({drift['name']})"))
+                for currency in ('UZS', 'USD'):
+                    if drift['diff'][currency]:
+                        self.stdout.write(
+                            f"  {currency}: stored={drift['stored'][currency]}, "
+                            f"expected={drift['expected'][currency]}, diff={drift['diff'][currency]:+}"
+                        )
+
+            if drifts and options['fix']:
+                updated = BalanceReconciliationService.apply_fixes(contact_type, drifts)
+                self.stdout.write(self.style.SUCCESS(f"Fixed {updated} {contact_type} balances"))
+
+        if not total_drifts:
+            self.stdout.write(self.style.SUCCESS("All balances match their transactions"))
+        elif not options['fix']:
+            self.stdout.write(self.style.WARNING(f"Found {total_drifts} drifted balances. Run with --fix to correct them."))
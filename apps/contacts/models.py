@@ -1,7 +1,9 @@
 from django.db import models
+from django.db.models.functions import Collate
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from apps.core.constants import CurrencyChoices
+from apps.core.services import BalanceDeltaCollector, CacheVersionService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -30,39 +32,38 @@ class BaseContact(models.Model):
             self.initial_balance_usd = self.balance_usd
         super().save(*args, **kwargs)
 
+    BALANCE_FIELDS = {
+        CurrencyChoices.UZS: 'balance_uzs',
+        CurrencyChoices.USD: 'balance_usd',
+    }
+
     def add_debt(self, amount, currency):
-        logger.info(f"add_debt called for {self.__class__.__name__} {self.id} ({self.name})")
-        logger.info(f"  Adding {amount} {currency}")
-        logger.info(f"  Balance before: UZS={self.balance_uzs}, USD={self.balance_usd}")
-        
-        if currency == CurrencyChoices.UZS:
-            old_balance = self.balance_uzs
-            self.balance_uzs += amount
-            logger.info(f"  UZS balance changed from {old_balance} to {self.balance_uzs}")
-        elif currency == CurrencyChoices.USD:
-            old_balance = self.balance_usd
-            self.balance_usd += amount
-            logger.info(f"  USD balance changed from {old_balance} to {self.balance_usd}")
-        
-        self.save(update_fields=['balance_uzs', 'balance_usd', 'updated_at'])
-        logger.info(f"  Balance after save: UZS={self.balance_uzs}, USD={self.balance_usd}")
+        self.adjust_balance(amount, currency)
 
     def reduce_debt(self, amount, currency):
-        logger.info(f"reduce_debt called for {self.__class__.__name__} {self.id} ({self.name})")
-        logger.info(f"  Reducing {amount} {currency}")
-        logger.info(f"  Balance before: UZS={self.balance_uzs}, USD={self.balance_usd}")
-        
-        if currency == CurrencyChoices.UZS:
-            old_balance = self.balance_uzs
-            self.balance_uzs -= amount
-            logger.info(f"  UZS balance changed from {old_balance} to {self.balance_uzs}")
-        elif currency == CurrencyChoices.USD:
-            old_balance = self.balance_usd
-            self.balance_usd -= amount
-            logger.info(f"  USD balance changed from {old_balance} to {self.balance_usd}")
-        
-        self.save(update_fields=['balance_uzs', 'balance_usd', 'updated_at'])
-        logger.info(f"  Balance after save: UZS={self.balance_uzs}, USD={self.balance_usd}")
+        self.adjust_balance(-amount, currency)
+
+    def adjust_balance(self, amount, currency):
+        """
+        Add ``amount`` to the balance in ``currency`` with a single UPDATE and refresh that field.
+        Concurrent postings to the same contact never overwrite each other.
+        """
+        field = self.BALANCE_FIELDS.get(currency)
+        if field is None or not amount:
+            return
+        CacheVersionService.bump_on_commit(CacheVersionService.ledger_name(self._meta.model_name, self.pk))
+        collector = BalanceDeltaCollector.current()
+        if collector is not None:
+            collector.add(self, field, amount)
+            return
+        type(self).objects.filter(pk=self.pk).update(
+            **{field: models.F(field) + amount, 'updated_at': timezone.now()}
+        )
+        self.refresh_from_db(fields=[field, 'updated_at'])
+        logger.info(
+            f"{self.__class__.__name__} {self.id} ({self.name}): {amount:+} {currency}, "
+            f"balance now {getattr(self, field)}"
+        )
 
     def __str__(self):
         return self.name
@@ -75,36 +76,22 @@ class Supplier(BaseContact):
         verbose_name = "Ta'minotchi"
         verbose_name_plural = "Ta'minotchilar"
         ordering = ['name']
+        indexes = [
+            # Case-insensitive prefix search (typeahead); SQLite's LIKE only uses a NOCASE index
+            models.Index(Collate('name', 'NOCASE'), name='supplier_name_nocase_idx'),
+        ]
 
     def can_be_deactivated(self):
         """Check if supplier can be deactivated (when there's no debt on both sides)"""
         return self.balance_uzs == 0 and self.balance_usd == 0
     
     def recalculate_balance(self):
-        """Recalculate supplier balance based on all transactions"""
-        from django.db.models import Sum
-        
-        # Calculate UZS balance
-        uzs_acquisitions = self.acquisitions.filter(currency='UZS', is_active=True).aggregate(
-            total=Sum('total_amount'))['total'] or 0
-        uzs_payments = self.payments.filter(currency='UZS').aggregate(
-            total=Sum('amount'))['total'] or 0
-        uzs_commissions = self.commissions.filter(currency='UZS').aggregate(
-            total=Sum('amount'))['total'] or 0
-        
-        # Calculate USD balance  
-        usd_acquisitions = self.acquisitions.filter(currency='USD', is_active=True).aggregate(
-            total=Sum('total_amount'))['total'] or 0
-        usd_payments = self.payments.filter(currency='USD').aggregate(
-            total=Sum('amount'))['total'] or 0
-        usd_commissions = self.commissions.filter(currency='USD').aggregate(
-            total=Sum('amount'))['total'] or 0
-        
-        # Update balances: Initial + Acquisitions - Commissions - Payments
-        self.balance_uzs = (self.initial_balance_uzs or 0) + uzs_acquisitions - uzs_commissions - uzs_payments
-        self.balance_usd = (self.initial_balance_usd or 0) + usd_acquisitions - usd_commissions - usd_payments
-        
-        self.save(update_fields=['balance_uzs', 'balance_usd', 'updated_at'])
+        """Recalculate supplier balance from all its transactions (see BalanceReconciliationService)"""
+        from .services import BalanceReconciliationService
+
+        drifts = BalanceReconciliationService.find_drift('supplier', [self.pk])
+        BalanceReconciliationService.apply_fixes('supplier', drifts)
+        self.refresh_from_db(fields=['balance_uzs', 'balance_usd', 'updated_at'])
         return self.balance_uzs, self.balance_usd
 
 
@@ -113,6 +100,9 @@ class Agent(BaseContact):
         verbose_name = "Agent"
         verbose_name_plural = "Agentlar"
         ordering = ['name']
+        indexes = [
+            models.Index(Collate('name', 'NOCASE'), name='agent_name_nocase_idx'),
+        ]
 
 
 class Commission(models.Model):
@@ -139,6 +129,10 @@ class Commission(models.Model):
         verbose_name = "Komissiya"
         verbose_name_plural = "Komissiyalar"
         ordering = ['-commission_date']
+        indexes = [
+            models.Index(fields=['supplier', 'commission_date'], name='commission_supplier_date_idx'),
+            models.Index(fields=['updated_at'], name='commission_updated_idx'),
+        ]
 
     def clean(self):
         super().clean()
@@ -181,6 +175,10 @@ class SupplierPayment(BasePayment):
     class Meta(BasePayment.Meta):
         verbose_name = "Ta'minotchi To'lovi"
         verbose_name_plural = "Ta'minotchi To'lovlari"
+        indexes = [
+            models.Index(fields=['supplier', 'payment_date'], name='supplierpay_supplier_date_idx'),
+            models.Index(fields=['created_at'], name='supplierpay_created_idx'),
+        ]
 
 
 class AgentPayment(BasePayment):
@@ -228,6 +226,10 @@ class AgentPayment(BasePayment):
     class Meta(BasePayment.Meta):
         verbose_name = "Agent To'lovi"
         verbose_name_plural = "Agent To'lovlari"
+        indexes = [
+            models.Index(fields=['agent', 'payment_date'], name='agentpay_agent_date_idx'),
+            models.Index(fields=['created_at'], name='agentpay_created_idx'),
+        ]
 
 
 class SupplierBalanceAdjustment(models.Model):
@@ -243,6 +245,10 @@ class SupplierBalanceAdjustment(models.Model):
         ordering = ['-adjustment_date', '-created_at']
         verbose_name = "Ta'minotchi Balans Tuzatish"
         verbose_name_plural = "Ta'minotchi Balans Tuzatishlar"
+        indexes = [
+            models.Index(fields=['supplier', 'adjustment_date'], name='supplieradj_supplier_date_idx'),
+            models.Index(fields=['updated_at'], name='supplieradj_updated_idx'),
+        ]
 
     def __str__(self):
         sign = '+' if self.amount >= 0 else ''
@@ -262,7 +268,63 @@ class AgentBalanceAdjustment(models.Model):
         ordering = ['-adjustment_date', '-created_at']
         verbose_name = "Agent Balans Tuzatish"
         verbose_name_plural = "Agent Balans Tuzatishlar"
+        indexes = [
+            models.Index(fields=['agent', 'adjustment_date'], name='agentadj_agent_date_idx'),
+            models.Index(fields=['updated_at'], name='agentadj_updated_idx'),
+        ]
 
     def __str__(self):
         sign = '+' if self.amount >= 0 else ''
-        return f"{self.agent.name} {sign}{self.amount:,.2f} {self.currency} ({self.adjustment_date.strftime('%d-%m-%Y')})"
\ No newline at end of file
+        return f"{self.agent.name} {sign}{self.amount:,.2f} {self.currency} ({self.adjustment_date.strftime('%d-%m-%Y')})"
+
+
+class ContactBalanceCheckpoint(models.Model):
+    """
+    Cumulative statement balance of a contact as of the start of a period.
+
+    Balances sum every statement row dated before ``as_of`` and exclude the
+    contact's initial balance. Rows written or edited on or before a
+    checkpoint's date invalidate it (see signals), and the
+    build_balance_checkpoints command fills the gaps forward.
+    """
+
+    class ContactType(models.TextChoices):
+        AGENT = 'agent', 'Agent'
+        SUPPLIER = 'supplier', "Ta'minotchi"
+
+    class Scope(models.TextChoices):
+        ALL = 'all', 'Barchasi'
+        UMRA = 'umra', 'Umra'
+
+    contact_type = models.CharField(max_length=10, choices=ContactType.choices)
+    contact_id = models.PositiveBigIntegerField()
+    scope = models.CharField(max_length=4, choices=Scope.choices, default=Scope.ALL)
+    as_of = models.DateField(help_text="Balances include rows dated before this day.")
+    balance_uzs = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    balance_usd = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-as_of']
+        verbose_name = "Balans Nazorat Nuqtasi"
+        verbose_name_plural = "Balans Nazorat Nuqtalari"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['contact_type', 'contact_id', 'scope', 'as_of'],
+                name='unique_contact_checkpoint',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_contact_type_display()} #{self.contact_id} ({self.scope}) @ {self.as_of}: UZS={self.balance_uzs}, USD={self.balance_usd}"
+
+    @classmethod
+    def invalidate(cls, contact_type, contact_id, row_date):
+        """Drop checkpoints that include a row dated row_date (a date or aware datetime)"""
+        if contact_id is None or row_date is None:
+            return
+        if hasattr(row_date, 'tzinfo') and timezone.is_aware(row_date):
+            row_date = timezone.localdate(row_date)
+        elif hasattr(row_date, 'date'):
+            row_date = row_date.date()
+        cls.objects.filter(contact_type=contact_type, contact_id=contact_id, as_of__gt=row_date).delete()
@@ -0,0 +1,650 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum, Q, F, Case, When, Value, DecimalField, DateField, IntegerField, ExpressionWrapper
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from datetime import datetime, timedelta
+from decimal import Decimal
+import logging
+
+from apps.core.services import CacheVersionService, DateFilterService
+from .models import (
+    AgentPayment, SupplierPayment, Commission, AgentBalanceAdjustment, SupplierBalanceAdjustment,
+    ContactBalanceCheckpoint,
+)
+
+logger = logging.getLogger(__name__)
+
+MONEY = DecimalField(max_digits=20, decimal_places=2)
+
+
+class ContactLedgerService:
+    """
+    Statement totals for suppliers and agents.
+
+    Every source (acquisitions, payments, returns, ...) is aggregated with a
+    single conditional-aggregation query that returns the pre-period and
+    in-period sums for both currencies at once.
+    """
+
+    CURRENCIES = ('UZS', 'USD')
+
+    @staticmethod
+    def parse_period(params):
+        """Read filter/start_date/end_date from GET params, dropping invalid dates"""
+        filter_type = params.get('filter', 'all')
+        start_date = params.get('start_date', '')
+        end_date = params.get('end_date', '')
+        start_date_obj = None
+        end_date_obj = None
+
+        if start_date:
+            try:
+                start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
+            except ValueError:
+                start_date = ''
+
+        if end_date:
+            try:
+                end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
+            except ValueError:
+                end_date = ''
+        elif start_date and not end_date:
+            # If only start date is provided, set end date to today
+            end_date_obj = timezone.localdate()
+            end_date = end_date_obj.strftime('%Y-%m-%d')
+
+        return {
+            'filter_type': filter_type,
+            'start_date': start_date,
+            'end_date': end_date,
+            'start_date_obj': start_date_obj,
+            'end_date_obj': end_date_obj,
+        }
+
+    @staticmethod
+    def supplier_sources(supplier=None):
+        """
+        Statement sources for a supplier, in display order for same-date rows.
+
+        Each component is (key, amount expression, currency field, sign);
+        sources with no umra_field are left out of the UMRA filter.
+        contact_field links a row to its supplier; with supplier=None the
+        querysets cover every supplier.
+        """
+        from apps.inventory.models import Acquisition
+        from apps.sales.models import TicketReturn, TicketReturnQuerySet
+
+        return_amounts = TicketReturnQuerySet.amount_expressions()
+
+        sources = [
+            {
+                'type': 'acquisition',
+                # Soft-deleted acquisitions have their debt reversed
+                'queryset': Acquisition.objects.filter(is_active=True),
+                'contact_field': 'supplier',
+                'date_field': 'acquisition_date',
+                'umra_field': 'ticket__ticket_type',
+                'select_related': ('ticket',),
+                'components': [('acquisitions', F('total_amount'), 'currency', 1)],
+            },
+            {
+                'type': 'payment',
+                'queryset': SupplierPayment.objects.all(),
+                'contact_field': 'supplier',
+                'date_field': 'payment_date',
+                'umra_field': None,
+                'select_related': ('paid_from_account',),
+                'components': [('payments', F('amount'), 'currency', -1)],
+            },
+            {
+                'type': 'commission',
+                'queryset': Commission.objects.all(),
+                'contact_field': 'supplier',
+                'date_field': 'commission_date',
+                'umra_field': 'acquisition__ticket__ticket_type',
+                'select_related': ('acquisition__ticket',),
+                'components': [('commissions', F('amount'), 'currency', -1)],
+            },
+            {
+                'type': 'return',
+                'queryset': TicketReturn.objects.all(),
+                'contact_field': 'original_sale__related_acquisition__supplier',
+                'date_field': 'return_date',
+                'umra_field': 'original_sale__related_acquisition__ticket__ticket_type',
+                'select_related': ('original_sale__related_acquisition__ticket',),
+                'components': [
+                    ('returned_amount', *return_amounts['returned_acquisition_amount'], -1),
+                    ('supplier_fines', *return_amounts['total_supplier_fine_amount'], 1),
+                ],
+            },
+            {
+                'type': 'adjustment',
+                'queryset': SupplierBalanceAdjustment.objects.all(),
+                'contact_field': 'supplier',
+                'date_field': 'adjustment_date',
+                'umra_field': None,
+                'select_related': (),
+                'components': [('adjustments', F('amount'), 'currency', 1)],
+            },
+        ]
+        return ContactLedgerService._for_contact(sources, supplier)
+
+    @staticmethod
+    def agent_sources(agent=None):
+        """Same shape as supplier_sources, for an agent's receivable"""
+        from apps.sales.models import Sale, TicketReturn, TicketReturnQuerySet
+
+        return_amounts = TicketReturnQuerySet.amount_expressions()
+
+        sources = [
+            {
+                'type': 'sale',
+                'queryset': Sale.objects.all(),
+                'contact_field': 'agent',
+                'date_field': 'sale_date',
+                'umra_field': 'related_acquisition__ticket__ticket_type',
+                'select_related': ('related_acquisition__ticket', 'related_acquisition__supplier'),
+                'components': [('sales', F('total_sale_amount'), 'sale_currency', 1)],
+            },
+            {
+                'type': 'payment',
+                'queryset': AgentPayment.objects.all(),
+                'contact_field': 'agent',
+                'date_field': 'payment_date',
+                'umra_field': None,
+                'select_related': ('paid_to_account',),
+                'components': [('payments', F('amount'), 'currency', -1)],
+            },
+            {
+                'type': 'return',
+                'queryset': TicketReturn.objects.all(),
+                'contact_field': 'original_sale__agent',
+                'date_field': 'return_date',
+                'umra_field': 'original_sale__related_acquisition__ticket__ticket_type',
+                'select_related': ('original_sale__related_acquisition__ticket',),
+                'components': [
+                    ('returned_amount', *return_amounts['returned_acquisition_amount'], -1),
+                    ('agent_fines', *return_amounts['total_fine_amount'], 1),
+                ],
+            },
+            {
+                'type': 'adjustment',
+                'queryset': AgentBalanceAdjustment.objects.all(),
+                'contact_field': 'agent',
+                'date_field': 'adjustment_date',
+                'umra_field': None,
+                'select_related': (),
+                'components': [('adjustments', F('amount'), 'currency', 1)],
+            },
+        ]
+        return ContactLedgerService._for_contact(sources, agent)
+
+    @staticmethod
+    def _for_contact(sources, contact):
+        if contact is not None:
+            for source in sources:
+                source['queryset'] = source['queryset'].filter(**{source['contact_field']: contact})
+        return sources
+
+    @staticmethod
+    def get_totals(contact, sources, filter_type='all', start_date=None, end_date=None):
+        """
+        Compute starting balance, per-currency period totals and closing balance.
+
+        Returns a flat dict using the template names: '<uzs|usd>_<key>' for
+        each component, plus starting_balance_* and filtered_balance_*.
+        """
+        currencies = ContactLedgerService.currencies_for(filter_type)
+        is_umra = filter_type == 'umra'
+
+        totals = {}
+        starting = {}
+        closing = {}
+        for currency in ContactLedgerService.CURRENCIES:
+            # UMRA statements only cover ticket activity, so they start from zero
+            initial = 0 if is_umra else getattr(contact, f'initial_balance_{currency.lower()}') or 0
+            starting[currency] = initial if currency in currencies else 0
+
+        # The prior balance starts from the nearest checkpoint and only sums rows after it
+        checkpoint = None
+        if start_date:
+            checkpoint = ContactLedgerService.get_checkpoint(contact, filter_type, start_date)
+            if checkpoint:
+                for currency in currencies:
+                    starting[currency] += getattr(checkpoint, f'balance_{currency.lower()}')
+
+        for source in sources:
+            components = source['components']
+            date_field = source['date_field']
+            queryset = ContactLedgerService._scoped_queryset(source, filter_type)
+            if queryset is None:
+                for key, _, _, _ in components:
+                    for currency in ContactLedgerService.CURRENCIES:
+                        totals[f'{currency.lower()}_{key}'] = 0
+                continue
+
+            period_q = ContactLedgerService._period_q(date_field, start_date, end_date)
+            pre_q = Q(**{f'{date_field}__lt': DateFilterService.day_start(start_date)}) if start_date else None
+            if checkpoint:
+                pre_q &= DateFilterService.range_q(date_field, checkpoint.as_of)
+            aggregates = {}
+            for key, amount, currency_field, _ in components:
+                for currency in currencies:
+                    currency_q = Q(**{currency_field: currency})
+                    aggregates[f'{currency}_{key}'] = Sum(amount, filter=currency_q & period_q)
+                    if pre_q is not None:
+                        aggregates[f'pre_{currency}_{key}'] = Sum(amount, filter=currency_q & pre_q)
+            row = queryset.aggregate(**aggregates)
+
+            for key, _, _, sign in components:
+                for currency in ContactLedgerService.CURRENCIES:
+                    period_total = row.get(f'{currency}_{key}') or 0
+                    totals[f'{currency.lower()}_{key}'] = period_total
+                    if currency in currencies:
+                        starting[currency] += sign * (row.get(f'pre_{currency}_{key}') or 0)
+                        closing[currency] = closing.get(currency, 0) + sign * period_total
+
+        for currency in ContactLedgerService.CURRENCIES:
+            totals[f'starting_balance_{currency.lower()}'] = starting[currency]
+            totals[f'filtered_balance_{currency.lower()}'] = starting[currency] + closing.get(currency, 0)
+        return totals
+
+    @staticmethod
+    def cache_version(contact):
+        return CacheVersionService.get(CacheVersionService.ledger_name(contact._meta.model_name, contact.pk))
+
+    @staticmethod
+    def get_cached_totals(contact, sources, filter_type='all', start_date=None, end_date=None):
+        """get_totals, reused until the contact's ledger cache version changes"""
+        key = (
+            f"ledger_totals:{contact._meta.model_name}:{contact.pk}:{ContactLedgerService.cache_version(contact)}"
+            f":{filter_type}:{start_date}:{end_date}"
+        )
+        return cache.get_or_set(
+            key,
+            lambda: ContactLedgerService.get_totals(contact, sources, filter_type, start_date, end_date),
+            settings.FRAGMENT_CACHE_TIMEOUT,
+        )
+
+    @staticmethod
+    def get_checkpoint(contact, filter_type, before):
+        """Latest checkpoint at or before the given date for the filter's scope, or None"""
+        scope = ContactBalanceCheckpoint.Scope.UMRA if filter_type == 'umra' else ContactBalanceCheckpoint.Scope.ALL
+        return ContactBalanceCheckpoint.objects.filter(
+            contact_type=contact._meta.model_name,
+            contact_id=contact.pk,
+            scope=scope,
+            as_of__lte=before,
+        ).order_by('-as_of').first()
+
+    @staticmethod
+    def period_start(day, period='month'):
+        if period == 'week':
+            return day - timedelta(days=day.weekday())
+        return day.replace(day=1)
+
+    @staticmethod
+    def next_period_start(day, period='month'):
+        if period == 'week':
+            return day + timedelta(days=7)
+        return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+    @staticmethod
+    def build_checkpoints(contact, sources, scope, period='month', rebuild=False):
+        """
+        Extend a contact's checkpoints up to the start of the current period.
+
+        Continues from the latest surviving checkpoint, so only rows after it
+        are read: one GROUP BY period query per source. Returns the number of
+        checkpoints created.
+        """
+        checkpoints = ContactBalanceCheckpoint.objects.filter(
+            contact_type=contact._meta.model_name, contact_id=contact.pk, scope=scope,
+        )
+        if rebuild:
+            checkpoints.delete()
+            latest = None
+        else:
+            latest = checkpoints.order_by('-as_of').first()
+
+        current_start = ContactLedgerService.period_start(timezone.localdate(), period)
+        if latest and latest.as_of >= current_start:
+            return 0
+
+        buckets = {}
+        for source in sources:
+            queryset = ContactLedgerService._scoped_queryset(source, scope)
+            if queryset is None:
+                continue
+            date_field = source['date_field']
+            queryset = queryset.filter(**{f'{date_field}__lt': DateFilterService.day_start(current_start)})
+            if latest:
+                queryset = DateFilterService.filter_queryset(queryset, date_field, latest.as_of)
+
+            aggregates = {}
+            for key, amount, currency_field, _ in source['components']:
+                for currency in ContactLedgerService.CURRENCIES:
+                    aggregates[f'{currency}_{key}'] = Sum(amount, filter=Q(**{currency_field: currency}))
+            rows = queryset.order_by().annotate(
+                bucket=Trunc(date_field, period, output_field=DateField())
+            ).values('bucket').annotate(**aggregates)
+
+            for row in rows:
+                bucket = buckets.setdefault(row['bucket'], {currency: 0 for currency in ContactLedgerService.CURRENCIES})
+                for key, _, _, sign in source['components']:
+                    for currency in ContactLedgerService.CURRENCIES:
+                        bucket[currency] += sign * (row[f'{currency}_{key}'] or 0)
+
+        if latest:
+            period_cursor = latest.as_of
+            running = {'UZS': latest.balance_uzs, 'USD': latest.balance_usd}
+        elif buckets:
+            period_cursor = min(buckets)
+            running = {currency: 0 for currency in ContactLedgerService.CURRENCIES}
+        else:
+            return 0
+
+        pending = sorted(buckets)
+        new_checkpoints = []
+        while period_cursor < current_start:
+            period_cursor = ContactLedgerService.next_period_start(period_cursor, period)
+            while pending and pending[0] < period_cursor:
+                for currency, delta in buckets[pending.pop(0)].items():
+                    running[currency] += delta
+            new_checkpoints.append(ContactBalanceCheckpoint(
+                contact_type=contact._meta.model_name,
+                contact_id=contact.pk,
+                scope=scope,
+                as_of=period_cursor,
+                balance_uzs=running['UZS'],
+                balance_usd=running['USD'],
+            ))
+        ContactBalanceCheckpoint.objects.bulk_create(new_checkpoints)
+        return len(new_checkpoints)
+
+    @staticmethod
+    def currencies_for(filter_type):
+        if filter_type == 'uzs':
+            return ('UZS',)
+        if filter_type == 'usd':
+            return ('USD',)
+        return ContactLedgerService.CURRENCIES
+
+    @staticmethod
+    def _scoped_queryset(source, filter_type):
+        """Apply the UMRA restriction; None when the source is outside the filter"""
+        if filter_type != 'umra':
+            return source['queryset']
+        if source['umra_field'] is None:
+            return None
+        return source['queryset'].filter(**{source['umra_field']: 'UMRA'})
+
+    @staticmethod
+    def _period_q(date_field, start_date, end_date):
+        return DateFilterService.range_q(date_field, start_date, end_date)
+
+    @staticmethod
+    def get_statement(sources, filter_type='all', start_date=None, end_date=None,
+                      starting_balance_uzs=0, starting_balance_usd=0):
+        """
+        Lazy, paginator-compatible statement rows, oldest first.
+
+        Running balances are computed by the database; slicing fetches only
+        the requested rows.
+        """
+        return StatementRows(
+            sources, filter_type, start_date, end_date,
+            starting_balance_uzs, starting_balance_usd,
+        )
+
+
+class StatementRows:
+    """
+    Sequence-like view over the UNION ALL of a contact's sources.
+
+    count() runs a COUNT over the union, and slicing runs a windowed
+    SUM(...) OVER (ORDER BY date, source, id) with LIMIT/OFFSET, then loads
+    the model instances for that page only.
+    """
+
+    def __init__(self, sources, filter_type, start_date, end_date, starting_balance_uzs, starting_balance_usd):
+        self.sources = sources
+        self.starting_balance_uzs = starting_balance_uzs
+        self.starting_balance_usd = starting_balance_usd
+        self._count = None
+
+        currencies = ContactLedgerService.currencies_for(filter_type)
+        parts = []
+        for order, source in enumerate(sources):
+            queryset = ContactLedgerService._scoped_queryset(source, filter_type)
+            if queryset is None:
+                continue
+            row_date_field = source['date_field']
+            queryset = queryset.filter(
+                ContactLedgerService._period_q(source['date_field'], start_date, end_date)
+            )
+            if filter_type in ('uzs', 'usd'):
+                currency_q = Q()
+                for _, _, currency_field, _ in source['components']:
+                    currency_q |= Q(**{f'{currency_field}__in': currencies})
+                queryset = queryset.filter(currency_q)
+
+            deltas = {}
+            for currency in ContactLedgerService.CURRENCIES:
+                delta = Value(0, output_field=MONEY)
+                if currency in currencies:
+                    for _, amount, currency_field, sign in source['components']:
+                        delta = delta + Case(
+                            When(**{currency_field: currency},
+                                 then=ExpressionWrapper(amount * Value(sign), output_field=MONEY)),
+                            default=Value(0),
+                            output_field=MONEY,
+                        )
+                deltas[f'delta_{currency.lower()}'] = ExpressionWrapper(delta, output_field=MONEY)
+
+            parts.append(queryset.order_by().annotate(
+                row_date=F(row_date_field),
+                row_order=Value(order, output_field=IntegerField()),
+                row_id=F('id'),
+                **deltas,
+            ).values('row_date', 'row_order', 'row_id', 'delta_uzs', 'delta_usd'))
+
+        self.union = parts[0].union(*parts[1:], all=True) if parts else None
+
+    def count(self):
+        if self._count is None:
+            if self.union is None:
+                self._count = 0
+            else:
+                sql, params = self.union.query.sql_with_params()
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT COUNT(*) FROM ({sql}) statement', params)
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError('StatementRows only supports slicing')
+        offset = index.start or 0
+        limit = (index.stop if index.stop is not None else self.count()) - offset
+        if self.union is None or limit <= 0:
+            return []
+
+        sql, params = self.union.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT row_order, row_id,
+                       SUM(delta_uzs) OVER running AS balance_uzs,
+                       SUM(delta_usd) OVER running AS balance_usd
+                FROM ({sql}) statement
+                WINDOW running AS (ORDER BY row_date, row_order, row_id ROWS UNBOUNDED PRECEDING)
+                ORDER BY row_date, row_order, row_id
+                LIMIT %s OFFSET %s
+                """,
+                [*params, limit, offset],
+            )
+            rows = cursor.fetchall()
+        return self._hydrate(rows)
+
+    def _hydrate(self, rows):
+        """Load the page's model instances with one query per source type"""
+        ids_by_order = {}
+        for row_order, row_id, _, _ in rows:
+            ids_by_order.setdefault(row_order, []).append(row_id)
+
+        instances = {}
+        for row_order, ids in ids_by_order.items():
+            source = self.sources[row_order]
+            queryset = source['queryset'].select_related(*source['select_related'])
+            instances[row_order] = queryset.in_bulk(ids)
+
+        transactions = []
+        for row_order, row_id, balance_uzs, balance_usd in rows:
+            source = self.sources[row_order]
+            instance = instances[row_order][row_id]
+            transactions.append({
+                'date': getattr(instance, source['date_field']),
+                'type': source['type'],
+                source['type']: instance,
+                'balance_uzs': self.starting_balance_uzs + _to_decimal(balance_uzs),
+                'balance_usd': self.starting_balance_usd + _to_decimal(balance_usd),
+            })
+        return transactions
+
+
+def _to_decimal(value):
+    """Window sums come back as float/str on SQLite and Decimal on PostgreSQL"""
+    if value is None:
+        return Decimal('0')
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+class BalanceReconciliationService:
+    """
+    Expected agent and supplier balances recomputed from the statement sources.
+
+    Every source is summed per contact and currency with one GROUP BY query,
+    so reconciling the whole book costs one query per source however many
+    contacts there are.
+    """
+
+    TOLERANCE = Decimal('0.01')
+
+    @staticmethod
+    def contact_model(contact_type):
+        from .models import Agent, Supplier
+        return {'agent': Agent, 'supplier': Supplier}[contact_type]
+
+    @staticmethod
+    def expected_balances(contact_type, contact_ids=None):
+        """{contact_id: {'UZS': ..., 'USD': ...}}: initial balance plus the signed source totals"""
+        model = BalanceReconciliationService.contact_model(contact_type)
+        contacts = model.objects.all()
+        if contact_ids is not None:
+            contacts = contacts.filter(pk__in=contact_ids)
+        expected = {
+            pk: {'UZS': initial_uzs or 0, 'USD': initial_usd or 0}
+            for pk, initial_uzs, initial_usd in contacts.values_list('pk', 'initial_balance_uzs', 'initial_balance_usd')
+        }
+
+        if contact_type == 'agent':
+            sources = ContactLedgerService.agent_sources()
+        else:
+            sources = ContactLedgerService.supplier_sources()
+        for source in sources:
+            contact_field = source['contact_field']
+            queryset = source['queryset']
+            if contact_ids is not None:
+                queryset = queryset.filter(**{f'{contact_field}__in': contact_ids})
+            aggregates = {}
+            for key, amount, currency_field, _ in source['components']:
+                for currency in ContactLedgerService.CURRENCIES:
+                    aggregates[f'{currency}_{key}'] = Sum(amount, filter=Q(**{currency_field: currency}))
+            rows = queryset.order_by().values(contact_id=F(contact_field)).annotate(**aggregates)
+
+            for row in rows:
+                # Rows without a contact (direct sales) or for filtered-out contacts
+                balances = expected.get(row['contact_id'])
+                if balances is None:
+                    continue
+                for key, _, _, sign in source['components']:
+                    for currency in ContactLedgerService.CURRENCIES:
+                        balances[currency] += sign * (row[f'{currency}_{key}'] or 0)
+        return expected
+
+    @staticmethod
+    def touched_since(contact_type, since):
+        """Ids of contacts whose balance or statement rows changed at or after ``since``"""
+        model = BalanceReconciliationService.contact_model(contact_type)
+        touched = set(DateFilterService.changed_since(model.objects.all(), since).values_list('pk', flat=True))
+        if contact_type == 'agent':
+            sources = ContactLedgerService.agent_sources()
+        else:
+            sources = ContactLedgerService.supplier_sources()
+        for source in sources:
+            # Unfiltered manager, so rows that just left a source (soft deletes) are seen too
+            rows = DateFilterService.changed_since(source['queryset'].model.objects.all(), since)
+            touched.update(rows.order_by().values_list(source['contact_field'], flat=True).distinct())
+        touched.discard(None)
+        return touched
+
+    @staticmethod
+    def find_drift(contact_type, contact_ids=None, tolerance=TOLERANCE):
+        """
+        Contacts whose stored balance differs from the expected one by more than ``tolerance``.
+
+        Each item is {'id', 'name', 'stored', 'expected', 'diff'}, the last three keyed
+        by currency; diff is expected minus stored.
+        """
+        model = BalanceReconciliationService.contact_model(contact_type)
+        stored = model.objects.all()
+        if contact_ids is not None:
+            stored = stored.filter(pk__in=contact_ids)
+
+        with transaction.atomic():
+            stored = list(stored.order_by('pk').values_list('pk', 'name', 'balance_uzs', 'balance_usd'))
+            expected = BalanceReconciliationService.expected_balances(contact_type, contact_ids)
+
+        drifts = []
+        for pk, name, balance_uzs, balance_usd in stored:
+            current = {'UZS': balance_uzs, 'USD': balance_usd}
+            diff = {currency: expected[pk][currency] - current[currency] for currency in ContactLedgerService.CURRENCIES}
+            if any(abs(value) > tolerance for value in diff.values()):
+                drifts.append({'id': pk, 'name': name, 'stored': current, 'expected': expected[pk], 'diff': diff})
+        return drifts
+
+    @staticmethod
+    def apply_fixes(contact_type, drifts):
+        """
+        Shift the drifted balances by their diff with a single UPDATE.
+
+        The diff is added to the current value rather than overwriting it, so
+        postings made since find_drift ran are kept. Returns the number of
+        contacts updated.
+        """
+        if not drifts:
+            return 0
+        model = BalanceReconciliationService.contact_model(contact_type)
+        updates = {}
+        for currency, field in model.BALANCE_FIELDS.items():
+            whens = [When(pk=drift['id'], then=Value(drift['diff'][currency])) for drift in drifts if drift['diff'][currency]]
+            if whens:
+                updates[field] = F(field) + Case(*whens, default=Value(Decimal('0')), output_field=MONEY)
+
+        with transaction.atomic():
+            updated = model.objects.filter(pk__in=[drift['id'] for drift in drifts]).update(
+                **updates, updated_at=timezone.now()
+            )
+            CacheVersionService.bump_on_commit(*[
+                CacheVersionService.ledger_name(model._meta.model_name, drift['id']) for drift in drifts
+            ])
+        logger.info(f"Reconciled {updated} {model._meta.model_name} balances")
+        return updated
@@ -1,9 +1,127 @@
-from django.db.models.signals import post_delete
+from django.apps import apps
+from django.db.models import F, Min
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
+from apps.core.services import CacheVersionService
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Statement sources whose rows feed ContactBalanceCheckpoint balances
+CHECKPOINT_SENDERS = [
+    'inventory.Ticket', 'inventory.Acquisition', 'sales.Sale', 'sales.TicketReturn',
+    'contacts.SupplierPayment', 'contacts.AgentPayment', 'contacts.Commission',
+    'contacts.SupplierBalanceAdjustment', 'contacts.AgentBalanceAdjustment',
+]
+
+# Saves limited to these fields never change a statement amount or date
+CHECKPOINT_IGNORED_FIELDS = {'available_quantity', 'updated_at'}
+
+
+def _earliest_rows(queryset, contact_type, contact_field, date_field):
+    """(contact_type, contact_id, first row date) per contact of ``queryset``"""
+    return [
+        (contact_type, row['contact_id'], row['first_date'])
+        for row in queryset.values(contact_id=F(contact_field)).annotate(first_date=Min(date_field)).order_by()
+    ]
+
+
+def _return_rows(returns):
+    """Returns appear on both the agent's and the supplier's statement"""
+    return (
+        _earliest_rows(returns, 'agent', 'original_sale__agent', 'return_date') +
+        _earliest_rows(returns, 'supplier', 'original_sale__related_acquisition__supplier', 'return_date')
+    )
+
+
+def _checkpoint_rows(instance, dependents=True):
+    """
+    (contact_type, contact_id, row_date) for each statement the instance appears on.
+    With ``dependents``, also the rows whose amount or UMRA scope is read from an
+    acquisition or ticket: returns priced at the acquisition's unit price, and every
+    row under a ticket whose type decides the UMRA filter.
+    """
+    label = instance._meta.label
+    TicketReturn = apps.get_model('sales', 'TicketReturn')
+    if label == 'inventory.Ticket':
+        if not dependents:
+            return []
+        return (
+            _earliest_rows(instance.acquisitions.all(), 'supplier', 'supplier', 'acquisition_date') +
+            _earliest_rows(
+                apps.get_model('contacts', 'Commission').objects.filter(acquisition__ticket=instance),
+                'supplier', 'supplier', 'commission_date'
+            ) +
+            _earliest_rows(
+                apps.get_model('sales', 'Sale').objects.filter(related_acquisition__ticket=instance),
+                'agent', 'agent', 'sale_date'
+            ) +
+            _return_rows(TicketReturn.objects.filter(original_sale__related_acquisition__ticket=instance))
+        )
+    if label == 'inventory.Acquisition':
+        rows = [('supplier', instance.supplier_id, instance.acquisition_date)]
+        if dependents:
+            rows += _return_rows(TicketReturn.objects.filter(original_sale__related_acquisition=instance))
+        return rows
+    if label == 'sales.Sale':
+        return [('agent', instance.agent_id, instance.sale_date)]
+    if label == 'sales.TicketReturn':
+        sale = instance.original_sale
+        return [
+            ('agent', sale.agent_id, instance.return_date),
+            ('supplier', sale.related_acquisition.supplier_id, instance.return_date),
+        ]
+    if label == 'contacts.SupplierPayment':
+        return [('supplier', instance.supplier_id, instance.payment_date)]
+    if label == 'contacts.AgentPayment':
+        return [('agent', instance.agent_id, instance.payment_date)]
+    if label == 'contacts.Commission':
+        return [('supplier', instance.supplier_id, instance.commission_date)]
+    if label == 'contacts.SupplierBalanceAdjustment':
+        return [('supplier', instance.supplier_id, instance.adjustment_date)]
+    if label == 'contacts.AgentBalanceAdjustment':
+        return [('agent', instance.agent_id, instance.adjustment_date)]
+    return []
+
+
+def _invalidate_checkpoints(rows):
+    from .models import ContactBalanceCheckpoint
+    for contact_type, contact_id, row_date in rows:
+        ContactBalanceCheckpoint.invalidate(contact_type, contact_id, row_date)
+        if contact_id is not None:
+            CacheVersionService.bump_on_commit(CacheVersionService.ledger_name(contact_type, contact_id))
+
+
+def _skip_checkpoint_update(update_fields):
+    return update_fields is not None and set(update_fields) <= CHECKPOINT_IGNORED_FIELDS
+
+
+@receiver(pre_save)
+def remember_checkpoint_rows(sender, instance, update_fields=None, **kwargs):
+    # Keep the pre-edit contact/date so moving a row also invalidates its old position
+    if sender._meta.label not in CHECKPOINT_SENDERS or not instance.pk or _skip_checkpoint_update(update_fields):
+        return
+    previous = sender.objects.filter(pk=instance.pk).first()
+    # A ticket's dependent rows do not move when the ticket is edited; post_save covers them
+    dependents = sender._meta.label != 'inventory.Ticket'
+    instance._checkpoint_previous_rows = _checkpoint_rows(previous, dependents) if previous else []
+
+
+@receiver(post_save)
+def invalidate_checkpoints_on_save(sender, instance, created=False, update_fields=None, **kwargs):
+    if sender._meta.label not in CHECKPOINT_SENDERS or _skip_checkpoint_update(update_fields):
+        return
+    # Nothing can depend on a row that was just created
+    rows = _checkpoint_rows(instance, dependents=not created)
+    _invalidate_checkpoints(rows + getattr(instance, '_checkpoint_previous_rows', []))
+
+
+@receiver(post_delete)
+def invalidate_checkpoints_on_delete(sender, instance, **kwargs):
+    if sender._meta.label not in CHECKPOINT_SENDERS:
+        return
+    _invalidate_checkpoints(_checkpoint_rows(instance))
+
 
 @receiver(post_delete, sender='sales.Sale')
 def handle_sale_deleted(sender, instance, **kwargs):
@@ -18,4 +136,12 @@ def handle_sale_deleted(sender, instance, **kwargs):
 
 @receiver(post_delete, sender='contacts.Agent')
 def handle_agent_deleted(sender, instance, **kwargs):
-    logger.warning(f"Agent {instance.id} ({instance.name}) deleted. Check for orphaned sales and payments.") 
\ No newline at end of file
+    logger.warning(f"Agent {instance.id} ({instance.name}) deleted. Check for orphaned sales and payments.") 
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_contact_ledger_version(sender, instance, **kwargs):
+    # Statement headers and footers show the contact's name and stored balances
+    if sender._meta.label in ('contacts.Agent', 'contacts.Supplier'):
+        CacheVersionService.bump_on_commit(CacheVersionService.ledger_name(sender._meta.model_name, instance.pk))
@@ -0,0 +1,96 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.test import TestCase
+from django.utils import timezone
+from apps.accounting.models import FinancialAccount
+from apps.inventory.models import Acquisition, Ticket
+from apps.sales.models import Sale, TicketReturn
+from .models import Agent, Supplier, AgentPayment, AgentBalanceAdjustment, ContactBalanceCheckpoint
+from .services import ContactLedgerService
+
+
+class CheckpointParityTests(TestCase):
+    """Statement totals must not depend on whether a checkpoint shortens the prior-balance sum"""
+
+    FILTERS = ('all', 'uzs', 'usd', 'umra')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = Agent.objects.create(name='Agent', initial_balance_usd=Decimal('50'))
+        supplier = Supplier.objects.create(name="Ta'minotchi")
+        cls.account = FinancialAccount.objects.create(
+            name='Kassa USD', account_type='CASH_USD', currency='USD', current_balance=Decimal('0')
+        )
+        now = timezone.now()
+        acquisitions = {}
+        for ticket_type, currency, price in (('AIR', 'USD', '100'), ('UMRA', 'USD', '900'), ('AIR', 'UZS', '1200000')):
+            ticket = Ticket.objects.create(
+                ticket_type=ticket_type, description=f'{ticket_type} {currency}', departure_date_time=now + timedelta(days=30)
+            )
+            acquisitions[ticket_type, currency] = Acquisition.objects.create(
+                supplier=supplier, ticket=ticket, initial_quantity=50, unit_price=Decimal(price),
+                currency=currency, acquisition_date=now - timedelta(days=200),
+            )
+
+        # Rows spread over several months, so checkpoints land between them
+        for days_ago, key, quantity, price in ((150, ('AIR', 'USD'), 2, '120'), (110, ('UMRA', 'USD'), 1, '1000'),
+                                               (75, ('AIR', 'UZS'), 1, '1500000'), (40, ('UMRA', 'USD'), 2, '950'),
+                                               (5, ('AIR', 'USD'), 1, '130')):
+            acquisition = acquisitions[key]
+            sale = Sale.objects.create(
+                sale_date=now - timedelta(days=days_ago), related_acquisition=acquisition, agent=cls.agent,
+                quantity=quantity, unit_sale_price=Decimal(price), total_sale_amount=quantity * Decimal(price),
+                sale_currency=acquisition.currency, profit=quantity * (Decimal(price) - acquisition.unit_price),
+            )
+            if key == ('UMRA', 'USD') and days_ago == 40:
+                TicketReturn.objects.create(
+                    original_sale=sale, return_date=now - timedelta(days=33), quantity_returned=1,
+                    fine_amount=Decimal('25'), fine_currency='USD',
+                    supplier_fine_amount=Decimal('10'), supplier_fine_currency='USD',
+                )
+        for days_ago, amount in ((100, '150'), (60, '500'), (20, '300')):
+            AgentPayment.objects.create(
+                agent=cls.agent, payment_date=now - timedelta(days=days_ago), amount=Decimal(amount),
+                currency='USD', paid_to_account=cls.account,
+            )
+        AgentBalanceAdjustment.objects.create(
+            agent=cls.agent, adjustment_date=now - timedelta(days=90), amount=Decimal('-200000'), currency='UZS'
+        )
+
+    def sources(self):
+        return ContactLedgerService.agent_sources(self.agent)
+
+    def period_starts(self):
+        today = timezone.localdate()
+        return [today - timedelta(days=days) for days in (160, 121, 95, 61, 45, 32, 10, 0)]
+
+    def all_totals(self):
+        return {
+            (filter_type, start): ContactLedgerService.get_totals(
+                self.agent, self.sources(), filter_type, start, timezone.localdate()
+            )
+            for filter_type in self.FILTERS
+            for start in self.period_starts()
+        }
+
+    def build_checkpoints(self):
+        for scope in ContactBalanceCheckpoint.Scope.values:
+            ContactLedgerService.build_checkpoints(self.agent, self.sources(), scope)
+
+    def test_checkpoints_give_same_totals(self):
+        without_checkpoints = self.all_totals()
+        self.build_checkpoints()
+
+        self.assertTrue(ContactBalanceCheckpoint.objects.filter(contact_type='agent', contact_id=self.agent.pk).exists())
+        self.assertEqual(self.all_totals(), without_checkpoints)
+
+    def test_backdated_row_invalidates_later_checkpoints(self):
+        self.build_checkpoints()
+        AgentPayment.objects.create(
+            agent=self.agent, payment_date=timezone.now() - timedelta(days=130), amount=Decimal('40'),
+            currency='USD', paid_to_account=self.account,
+        )
+
+        with_checkpoints = self.all_totals()
+        ContactBalanceCheckpoint.objects.all().delete()
+        self.assertEqual(with_checkpoints, self.all_totals())
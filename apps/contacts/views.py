@@ -1,20 +1,26 @@
+from django.conf import settings
 from django.shortcuts import get_object_or_404, redirect
 from django.views.generic import DetailView, CreateView
 from django.urls import reverse_lazy
 from django.http import HttpResponseRedirect, JsonResponse
-from django.db.models import Sum, Q, Case, When, Value, IntegerField
+from django.db.models import Q, Case, When, Value, IntegerField
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.contrib import messages
 from django.db import transaction
-from django.utils import timezone
-from datetime import datetime, date
+from django.utils.functional import SimpleLazyObject
 import logging
 import re
 
 from .models import Agent, Supplier, AgentPayment, SupplierPayment, Commission, AgentBalanceAdjustment, SupplierBalanceAdjustment
 from .forms import AgentForm, SupplierForm, AgentPaymentForm, SupplierPaymentForm, CommissionForm, AgentAdjustmentForm, SupplierAdjustmentForm
+from apps.accounting.models import AccountLedgerEntry
+from apps.core.services import BalanceDeltaCollector, CacheVersionService, ReferenceDataService
+from apps.sales.models import SalesDailyRollup
+from .services import ContactLedgerService
 
 logger = logging.getLogger(__name__)
 
@@ -201,6 +207,21 @@ class SupplierListView(LoginRequiredMixin, CreateView):
         return HttpResponseRedirect(self.success_url)
 
 
+def statement_page(sources, filter_type, start_date, end_date, totals, page, per_page=20):
+    """One page of a contact statement, falling back to the first or last page"""
+    transactions = ContactLedgerService.get_statement(
+        sources, filter_type, start_date, end_date,
+        totals['starting_balance_uzs'], totals['starting_balance_usd'],
+    )
+    paginator = Paginator(transactions, per_page)
+    try:
+        return paginator.page(page)
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
+
+
 class SupplierDetailView(LoginRequiredMixin, DetailView):
     model = Supplier
     template_name = 'contacts/supplier_detail.html'
@@ -211,475 +232,28 @@ class SupplierDetailView(LoginRequiredMixin, DetailView):
         supplier = self.object
         
         # Get filter parameters from request
-        filter_type = self.request.GET.get('filter', 'all')
+        period = ContactLedgerService.parse_period(self.request.GET)
+        filter_type = period['filter_type']
         page = self.request.GET.get('page', 1)
-        start_date = self.request.GET.get('start_date', '')
-        end_date = self.request.GET.get('end_date', '')
-        
-        # Parse dates
-        start_date_obj = None
-        end_date_obj = None
-        
-        if start_date:
-            try:
-                start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-            except ValueError:
-                start_date = ''
-        
-        if end_date:
-            try:
-                end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-            except ValueError:
-                end_date = ''
-        elif start_date and not end_date:
-            # If only start date is provided, set end date to today
-            end_date_obj = timezone.now().date()
-            end_date = end_date_obj.strftime('%Y-%m-%d')
-        
-        # Get base querysets
-        acquisitions = supplier.acquisitions.select_related('ticket').order_by('-acquisition_date')
-        payments = supplier.payments.select_related('paid_from_account').order_by('-payment_date')
-        commissions = supplier.commissions.select_related('acquisition__ticket').order_by('-commission_date')
-        adjustments = supplier.adjustments.all().order_by('-adjustment_date')
-        
-        # Get ticket returns for this supplier
-        from apps.sales.models import TicketReturn
-        ticket_returns = TicketReturn.objects.filter(
-            original_sale__related_acquisition__supplier=supplier
-        ).select_related(
-            'original_sale__related_acquisition__ticket'
-        ).order_by('-return_date')
-        
-        # Apply date filtering
-        if start_date_obj:
-            acquisitions = acquisitions.filter(acquisition_date__gte=start_date_obj)
-            payments = payments.filter(payment_date__gte=start_date_obj)
-            commissions = commissions.filter(commission_date__gte=start_date_obj)
-            ticket_returns = ticket_returns.filter(return_date__date__gte=start_date_obj)
-            adjustments = adjustments.filter(adjustment_date__date__gte=start_date_obj)
-        
-        if end_date_obj:
-            acquisitions = acquisitions.filter(acquisition_date__lte=end_date_obj)
-            payments = payments.filter(payment_date__lte=end_date_obj)
-            commissions = commissions.filter(commission_date__lte=end_date_obj)
-            ticket_returns = ticket_returns.filter(return_date__date__lte=end_date_obj)
-            adjustments = adjustments.filter(adjustment_date__date__lte=end_date_obj)
-        
-        # Apply filtering based on filter_type
-        if filter_type == 'uzs':
-            acquisitions = acquisitions.filter(currency='UZS')
-            payments = payments.filter(currency='UZS')
-            commissions = commissions.filter(currency='UZS')
-            ticket_returns = ticket_returns.filter(supplier_fine_currency='UZS')
-            adjustments = adjustments.filter(currency='UZS')
-        elif filter_type == 'usd':
-            acquisitions = acquisitions.filter(currency='USD')
-            payments = payments.filter(currency='USD')
-            commissions = commissions.filter(currency='USD')
-            ticket_returns = ticket_returns.filter(supplier_fine_currency='USD')
-            adjustments = adjustments.filter(currency='USD')
-        elif filter_type == 'umra':
-            acquisitions = acquisitions.filter(ticket__ticket_type='UMRA')
-            payments = payments.none()  # No payments are specific to ticket type
-            commissions = commissions.filter(acquisition__ticket__ticket_type='UMRA')
-            ticket_returns = ticket_returns.filter(original_sale__related_acquisition__ticket__ticket_type='UMRA')
-            adjustments = adjustments.none()
-        
-        # Calculate pre-period (prior) balance if a start date is provided
-        prior_balance_uzs = 0
-        prior_balance_usd = 0
-        if start_date_obj:
-            # Start from initial balances for currency/all filters; for UMRA we don't include initial
-            if filter_type in ('uzs', 'usd', 'all'):
-                prior_balance_uzs = supplier.initial_balance_uzs or 0
-                prior_balance_usd = supplier.initial_balance_usd or 0
-            else:
-                prior_balance_uzs = 0
-                prior_balance_usd = 0
-
-            # Build pre-period querysets (before start_date)
-            pre_acquisitions = supplier.acquisitions.select_related('ticket').filter(
-                acquisition_date__lt=start_date_obj
-            )
-            pre_payments = supplier.payments.select_related('paid_from_account').filter(
-                payment_date__lt=start_date_obj
-            )
-            pre_commissions = supplier.commissions.select_related('acquisition__ticket').filter(
-                commission_date__lt=start_date_obj
-            )
-            from apps.sales.models import TicketReturn  # local import to avoid circular issues
-            pre_returns = TicketReturn.objects.filter(
-                original_sale__related_acquisition__supplier=supplier,
-                return_date__date__lt=start_date_obj,
-            ).select_related('original_sale__related_acquisition__ticket')
-
-            if filter_type == 'uzs':
-                # Only UZS side
-                pre_uzs_acq = pre_acquisitions.filter(currency='UZS').aggregate(total=Sum('total_amount'))['total'] or 0
-                pre_uzs_pay = pre_payments.filter(currency='UZS').aggregate(total=Sum('amount'))['total'] or 0
-                pre_uzs_comm = pre_commissions.filter(currency='UZS').aggregate(total=Sum('amount'))['total'] or 0
-                pre_uzs_returned = 0
-                pre_uzs_fines = 0
-                for r in pre_returns:
-                    if r.original_sale.related_acquisition.currency == 'UZS':
-                        pre_uzs_returned += r.returned_acquisition_amount
-                    if r.supplier_fine_currency == 'UZS':
-                        pre_uzs_fines += r.total_supplier_fine_amount
-                prior_balance_uzs += pre_uzs_acq - pre_uzs_comm - pre_uzs_pay - pre_uzs_returned + pre_uzs_fines
-                prior_balance_usd = 0
-
-            elif filter_type == 'usd':
-                # Only USD side
-                pre_usd_acq = pre_acquisitions.filter(currency='USD').aggregate(total=Sum('total_amount'))['total'] or 0
-                pre_usd_pay = pre_payments.filter(currency='USD').aggregate(total=Sum('amount'))['total'] or 0
-                pre_usd_comm = pre_commissions.filter(currency='USD').aggregate(total=Sum('amount'))['total'] or 0
-                pre_usd_returned = 0
-                pre_usd_fines = 0
-                for r in pre_returns:
-                    if r.original_sale.related_acquisition.currency == 'USD':
-                        pre_usd_returned += r.returned_acquisition_amount
-                    if r.supplier_fine_currency == 'USD':
-                        pre_usd_fines += r.total_supplier_fine_amount
-                prior_balance_usd += pre_usd_acq - pre_usd_comm - pre_usd_pay - pre_usd_returned + pre_usd_fines
-                prior_balance_uzs = 0
-
-            elif filter_type == 'umra':
-                # Restrict to UMRA tickets; payments are not considered for UMRA filter
-                pre_acq_umra = pre_acquisitions.filter(ticket__ticket_type='UMRA')
-                pre_comm_umra = pre_commissions.filter(acquisition__ticket__ticket_type='UMRA')
-                pre_returns_umra = pre_returns.filter(original_sale__related_acquisition__ticket__ticket_type='UMRA')
-
-                pre_uzs_acq = pre_acq_umra.filter(currency='UZS').aggregate(total=Sum('total_amount'))['total'] or 0
-                pre_usd_acq = pre_acq_umra.filter(currency='USD').aggregate(total=Sum('total_amount'))['total'] or 0
-                pre_uzs_comm = pre_comm_umra.filter(currency='UZS').aggregate(total=Sum('amount'))['total'] or 0
-                pre_usd_comm = pre_comm_umra.filter(currency='USD').aggregate(total=Sum('amount'))['total'] or 0
-
-                pre_uzs_returned = 0
-                pre_usd_returned = 0
-                pre_uzs_fines = 0
-                pre_usd_fines = 0
-                for r in pre_returns_umra:
-                    if r.original_sale.related_acquisition.currency == 'UZS':
-                        pre_uzs_returned += r.returned_acquisition_amount
-                    else:
-                        pre_usd_returned += r.returned_acquisition_amount
-                    if r.supplier_fine_currency == 'UZS':
-                        pre_uzs_fines += r.total_supplier_fine_amount
-                    else:
-                        pre_usd_fines += r.total_supplier_fine_amount
-                # payments are excluded for UMRA
-                prior_balance_uzs += pre_uzs_acq - pre_uzs_comm - 0 - pre_uzs_returned + pre_uzs_fines
-                prior_balance_usd += pre_usd_acq - pre_usd_comm - 0 - pre_usd_returned + pre_usd_fines
+        start_date = period['start_date']
+        end_date = period['end_date']
+        start_date_obj = period['start_date_obj']
+        end_date_obj = period['end_date_obj']
 
-            else:  # all
-                pre_uzs_acq = pre_acquisitions.filter(currency='UZS').aggregate(total=Sum('total_amount'))['total'] or 0
-                pre_usd_acq = pre_acquisitions.filter(currency='USD').aggregate(total=Sum('total_amount'))['total'] or 0
-                pre_uzs_pay = pre_payments.filter(currency='UZS').aggregate(total=Sum('amount'))['total'] or 0
-                pre_usd_pay = pre_payments.filter(currency='USD').aggregate(total=Sum('amount'))['total'] or 0
-                pre_uzs_comm = pre_commissions.filter(currency='UZS').aggregate(total=Sum('amount'))['total'] or 0
-                pre_usd_comm = pre_commissions.filter(currency='USD').aggregate(total=Sum('amount'))['total'] or 0
-                pre_uzs_returned = 0
-                pre_usd_returned = 0
-                pre_uzs_fines = 0
-                pre_usd_fines = 0
-                for r in pre_returns:
-                    if r.original_sale.related_acquisition.currency == 'UZS':
-                        pre_uzs_returned += r.returned_acquisition_amount
-                    else:
-                        pre_usd_returned += r.returned_acquisition_amount
-                    if r.supplier_fine_currency == 'UZS':
-                        pre_uzs_fines += r.total_supplier_fine_amount
-                    else:
-                        pre_usd_fines += r.total_supplier_fine_amount
-                prior_balance_uzs += pre_uzs_acq - pre_uzs_comm - pre_uzs_pay - pre_uzs_returned + pre_uzs_fines
-                prior_balance_usd += pre_usd_acq - pre_usd_comm - pre_usd_pay - pre_usd_returned + pre_usd_fines
+        # Prior balance, period totals and footer come from one aggregate query per source
+        sources = ContactLedgerService.supplier_sources(supplier)
+        totals = ContactLedgerService.get_cached_totals(supplier, sources, filter_type, start_date_obj, end_date_obj)
 
-        # Create transactions list including commissions and returns
-        transactions = []
-        for acq in acquisitions:
-            transactions.append({'date': acq.acquisition_date, 'type': 'acquisition', 'acquisition': acq})
-        for payment in payments:
-            transactions.append({'date': payment.payment_date, 'type': 'payment', 'payment': payment})
-        for commission in commissions:
-            transactions.append({'date': commission.commission_date, 'type': 'commission', 'commission': commission})
-        for return_instance in ticket_returns:
-            transactions.append({'date': return_instance.return_date, 'type': 'return', 'return': return_instance})
-        for adj in adjustments:
-            transactions.append({'date': adj.adjustment_date, 'type': 'adjustment', 'adjustment': adj})
-        
-        # Sort by date (oldest first for balance calculation)
-        transactions.sort(key=lambda x: x['date'])
-        
-        # Calculate running balances
-        # When a start date is provided, include pre-period balance as the starting point
-        if start_date_obj:
-            starting_balance_uzs = prior_balance_uzs
-            starting_balance_usd = prior_balance_usd
-            current_balance_uzs = prior_balance_uzs
-            current_balance_usd = prior_balance_usd
-        else:
-            starting_balance_uzs = supplier.initial_balance_uzs or 0
-            starting_balance_usd = supplier.initial_balance_usd or 0
-            current_balance_uzs = supplier.initial_balance_uzs or 0
-            current_balance_usd = supplier.initial_balance_usd or 0
-        
-        for transaction in transactions:
-            if transaction['type'] == 'acquisition':
-                # Acquisition increases our debt to supplier (positive balance)
-                if transaction['acquisition'].currency == 'UZS':
-                    current_balance_uzs += transaction['acquisition'].total_amount
-                else:
-                    current_balance_usd += transaction['acquisition'].total_amount
-            elif transaction['type'] == 'payment':
-                # Payment decreases our debt to supplier (negative balance)
-                if transaction['payment'].currency == 'UZS':
-                    current_balance_uzs -= transaction['payment'].amount
-                else:
-                    current_balance_usd -= transaction['payment'].amount
-            elif transaction['type'] == 'commission':
-                # Commission decreases our debt to supplier (negative balance)
-                if transaction['commission'].currency == 'UZS':
-                    current_balance_uzs -= transaction['commission'].amount
-                else:
-                    current_balance_usd -= transaction['commission'].amount
-            elif transaction['type'] == 'return':
-                # Return reduces our debt for returned tickets (negative balance)
-                # AND adds supplier fine (positive balance)
-                return_instance = transaction['return']
-                returned_amount = return_instance.returned_acquisition_amount
-                supplier_fine_amount = return_instance.total_supplier_fine_amount
-                
-                if return_instance.original_sale.related_acquisition.currency == 'UZS':
-                    current_balance_uzs -= returned_amount
-                else:
-                    current_balance_usd -= returned_amount
-                
-                if return_instance.supplier_fine_currency == 'UZS':
-                    current_balance_uzs += supplier_fine_amount
-                else:
-                    current_balance_usd += supplier_fine_amount
-            elif transaction['type'] == 'adjustment':
-                # Adjustment: signed amount added to supplier debt balance
-                adj = transaction['adjustment']
-                if adj.currency == 'UZS':
-                    current_balance_uzs += adj.amount
-                else:
-                    current_balance_usd += adj.amount
-            
-            # Store the balance after this transaction
-            transaction['balance_uzs'] = current_balance_uzs
-            transaction['balance_usd'] = current_balance_usd
-        
-        # Keep transactions sorted by oldest first for display
-        # transactions.sort(key=lambda x: x['date'], reverse=True)  # Remove this line
-        
-        # Paginate transactions
-        paginator = Paginator(transactions, 20)  # 20 transactions per page
-        try:
-            paginated_transactions = paginator.page(page)
-        except PageNotAnInteger:
-            paginated_transactions = paginator.page(1)
-        except EmptyPage:
-            paginated_transactions = paginator.page(paginator.num_pages)
-        
-        # Calculate totals for display in table footer - respect current filter and date range
-        if filter_type == 'uzs':
-            filtered_acquisitions = supplier.acquisitions.select_related('ticket').filter(currency='UZS')
-            filtered_payments = supplier.payments.select_related('paid_from_account').filter(currency='UZS')
-            filtered_commissions = supplier.commissions.filter(currency='UZS')
-            filtered_returns = ticket_returns.filter(supplier_fine_currency='UZS')
-            filtered_adjustments = supplier.adjustments.filter(currency='UZS')
-            
-            # Apply date filtering to totals
-            if start_date_obj:
-                filtered_acquisitions = filtered_acquisitions.filter(acquisition_date__gte=start_date_obj)
-                filtered_payments = filtered_payments.filter(payment_date__gte=start_date_obj)
-                filtered_commissions = filtered_commissions.filter(commission_date__gte=start_date_obj)
-                filtered_returns = filtered_returns.filter(return_date__date__gte=start_date_obj)
-                filtered_adjustments = filtered_adjustments.filter(adjustment_date__date__gte=start_date_obj)
-            if end_date_obj:
-                filtered_acquisitions = filtered_acquisitions.filter(acquisition_date__lte=end_date_obj)
-                filtered_payments = filtered_payments.filter(payment_date__lte=end_date_obj)
-                filtered_commissions = filtered_commissions.filter(commission_date__lte=end_date_obj)
-                filtered_returns = filtered_returns.filter(return_date__date__lte=end_date_obj)
-                filtered_adjustments = filtered_adjustments.filter(adjustment_date__date__lte=end_date_obj)
-            
-            uzs_acquisitions = filtered_acquisitions.aggregate(total=Sum('total_amount'))['total'] or 0
-            uzs_payments = filtered_payments.aggregate(total=Sum('amount'))['total'] or 0
-            uzs_commissions = filtered_commissions.aggregate(total=Sum('amount'))['total'] or 0
-            uzs_adjustments = filtered_adjustments.aggregate(total=Sum('amount'))['total'] or 0
-            
-            # Calculate return amounts
-            uzs_returned_amount = 0
-            uzs_supplier_fines = 0
-            for return_instance in filtered_returns:
-                if return_instance.original_sale.related_acquisition.currency == 'UZS':
-                    uzs_returned_amount += return_instance.returned_acquisition_amount
-                uzs_supplier_fines += return_instance.total_supplier_fine_amount
-            
-            usd_acquisitions = 0
-            usd_payments = 0
-            usd_commissions = 0
-            usd_returned_amount = 0
-            usd_supplier_fines = 0
-            
-            # Calculate filtered balance for UZS only
-            if start_date_obj:
-                filtered_balance_uzs = prior_balance_uzs + (uzs_acquisitions - uzs_commissions - uzs_payments - uzs_returned_amount + uzs_supplier_fines + uzs_adjustments)
-            else:
-                filtered_balance_uzs = uzs_acquisitions - uzs_commissions - uzs_payments - uzs_returned_amount + uzs_supplier_fines + uzs_adjustments + (supplier.initial_balance_uzs or 0)
-            filtered_balance_usd = 0
-            
-        elif filter_type == 'usd':
-            filtered_acquisitions = supplier.acquisitions.select_related('ticket').filter(currency='USD')
-            filtered_payments = supplier.payments.select_related('paid_from_account').filter(currency='USD')
-            filtered_commissions = supplier.commissions.filter(currency='USD')
-            filtered_returns = ticket_returns.filter(supplier_fine_currency='USD')
-            filtered_adjustments = supplier.adjustments.filter(currency='USD')
-            
-            # Apply date filtering to totals
-            if start_date_obj:
-                filtered_acquisitions = filtered_acquisitions.filter(acquisition_date__gte=start_date_obj)
-                filtered_payments = filtered_payments.filter(payment_date__gte=start_date_obj)
-                filtered_commissions = filtered_commissions.filter(commission_date__gte=start_date_obj)
-                filtered_returns = filtered_returns.filter(return_date__date__gte=start_date_obj)
-                filtered_adjustments = filtered_adjustments.filter(adjustment_date__date__gte=start_date_obj)
-            if end_date_obj:
-                filtered_acquisitions = filtered_acquisitions.filter(acquisition_date__lte=end_date_obj)
-                filtered_payments = filtered_payments.filter(payment_date__lte=end_date_obj)
-                filtered_commissions = filtered_commissions.filter(commission_date__lte=end_date_obj)
-                filtered_returns = filtered_returns.filter(return_date__date__lte=end_date_obj)
-                filtered_adjustments = filtered_adjustments.filter(adjustment_date__date__lte=end_date_obj)
-            
-            usd_acquisitions = filtered_acquisitions.aggregate(total=Sum('total_amount'))['total'] or 0
-            usd_payments = filtered_payments.aggregate(total=Sum('amount'))['total'] or 0
-            usd_commissions = filtered_commissions.aggregate(total=Sum('amount'))['total'] or 0
-            usd_adjustments = filtered_adjustments.aggregate(total=Sum('amount'))['total'] or 0
-            
-            # Calculate return amounts
-            usd_returned_amount = 0
-            usd_supplier_fines = 0
-            for return_instance in filtered_returns:
-                if return_instance.original_sale.related_acquisition.currency == 'USD':
-                    usd_returned_amount += return_instance.returned_acquisition_amount
-                usd_supplier_fines += return_instance.total_supplier_fine_amount
-            
-            uzs_acquisitions = 0
-            uzs_payments = 0
-            uzs_commissions = 0
-            uzs_returned_amount = 0
-            uzs_supplier_fines = 0
-            
-            # Calculate filtered balance for USD only
-            filtered_balance_uzs = 0
-            if start_date_obj:
-                filtered_balance_usd = prior_balance_usd + (usd_acquisitions - usd_commissions - usd_payments - usd_returned_amount + usd_supplier_fines + usd_adjustments)
-            else:
-                filtered_balance_usd = usd_acquisitions - usd_commissions - usd_payments - usd_returned_amount + usd_supplier_fines + usd_adjustments + (supplier.initial_balance_usd or 0)
-            
-        elif filter_type == 'umra':
-            filtered_acquisitions = supplier.acquisitions.select_related('ticket').filter(ticket__ticket_type='UMRA')
-            filtered_payments = supplier.payments.select_related('paid_from_account').none()  # No payments are specific to ticket type
-            filtered_commissions = supplier.commissions.filter(acquisition__ticket__ticket_type='UMRA')
-            filtered_returns = ticket_returns.filter(original_sale__related_acquisition__ticket__ticket_type='UMRA')
-            
-            # Apply date filtering to totals
-            if start_date_obj:
-                filtered_acquisitions = filtered_acquisitions.filter(acquisition_date__gte=start_date_obj)
-                filtered_commissions = filtered_commissions.filter(commission_date__gte=start_date_obj)
-                filtered_returns = filtered_returns.filter(return_date__date__gte=start_date_obj)
-            if end_date_obj:
-                filtered_acquisitions = filtered_acquisitions.filter(acquisition_date__lte=end_date_obj)
-                filtered_commissions = filtered_commissions.filter(commission_date__lte=end_date_obj)
-                filtered_returns = filtered_returns.filter(return_date__date__lte=end_date_obj)
-            
-            uzs_acquisitions = filtered_acquisitions.filter(currency='UZS').aggregate(total=Sum('total_amount'))['total'] or 0
-            usd_acquisitions = filtered_acquisitions.filter(currency='USD').aggregate(total=Sum('total_amount'))['total'] or 0
-            uzs_payments = 0
-            usd_payments = 0
-            uzs_commissions = filtered_commissions.filter(currency='UZS').aggregate(total=Sum('amount'))['total'] or 0
-            usd_commissions = filtered_commissions.filter(currency='USD').aggregate(total=Sum('amount'))['total'] or 0
-            
-            # Calculate return amounts
-            uzs_returned_amount = 0
-            usd_returned_amount = 0
-            uzs_supplier_fines = 0
-            usd_supplier_fines = 0
-            for return_instance in filtered_returns:
-                if return_instance.original_sale.related_acquisition.currency == 'UZS':
-                    uzs_returned_amount += return_instance.returned_acquisition_amount
-                else:
-                    usd_returned_amount += return_instance.returned_acquisition_amount
-                
-                if return_instance.supplier_fine_currency == 'UZS':
-                    uzs_supplier_fines += return_instance.total_supplier_fine_amount
-                else:
-                    usd_supplier_fines += return_instance.total_supplier_fine_amount
-            
-            # Calculate filtered balance for UMRA only
-            if start_date_obj:
-                filtered_balance_uzs = prior_balance_uzs + (uzs_acquisitions - uzs_commissions - uzs_payments - uzs_returned_amount + uzs_supplier_fines)
-                filtered_balance_usd = prior_balance_usd + (usd_acquisitions - usd_commissions - usd_payments - usd_returned_amount + usd_supplier_fines)
-            else:
-                filtered_balance_uzs = uzs_acquisitions - uzs_commissions - uzs_payments - uzs_returned_amount + uzs_supplier_fines
-                filtered_balance_usd = usd_acquisitions - usd_commissions - usd_payments - usd_returned_amount + usd_supplier_fines
-            
-        else:  # filter_type == 'all'
-            filtered_acquisitions = supplier.acquisitions.select_related('ticket')
-            filtered_payments = supplier.payments.select_related('paid_from_account')
-            filtered_commissions = supplier.commissions
-            filtered_returns = ticket_returns
-            filtered_adjustments = supplier.adjustments.all()
-            
-            # Apply date filtering to totals
-            if start_date_obj:
-                filtered_acquisitions = filtered_acquisitions.filter(acquisition_date__gte=start_date_obj)
-                filtered_payments = filtered_payments.filter(payment_date__gte=start_date_obj)
-                filtered_commissions = filtered_commissions.filter(commission_date__gte=start_date_obj)
-                filtered_returns = filtered_returns.filter(return_date__date__gte=start_date_obj)
-                filtered_adjustments = filtered_adjustments.filter(adjustment_date__date__gte=start_date_obj)
-            if end_date_obj:
-                filtered_acquisitions = filtered_acquisitions.filter(acquisition_date__lte=end_date_obj)
-                filtered_payments = filtered_payments.filter(payment_date__lte=end_date_obj)
-                filtered_commissions = filtered_commissions.filter(commission_date__lte=end_date_obj)
-                filtered_returns = filtered_returns.filter(return_date__date__lte=end_date_obj)
-                filtered_adjustments = filtered_adjustments.filter(adjustment_date__date__lte=end_date_obj)
-            
-            uzs_acquisitions = filtered_acquisitions.filter(currency='UZS').aggregate(total=Sum('total_amount'))['total'] or 0
-            usd_acquisitions = filtered_acquisitions.filter(currency='USD').aggregate(total=Sum('total_amount'))['total'] or 0
-            uzs_payments = filtered_payments.filter(currency='UZS').aggregate(total=Sum('amount'))['total'] or 0
-            usd_payments = filtered_payments.filter(currency='USD').aggregate(total=Sum('amount'))['total'] or 0
-            uzs_commissions = filtered_commissions.filter(currency='UZS').aggregate(total=Sum('amount'))['total'] or 0
-            usd_commissions = filtered_commissions.filter(currency='USD').aggregate(total=Sum('amount'))['total'] or 0
-            uzs_adjustments = filtered_adjustments.filter(currency='UZS').aggregate(total=Sum('amount'))['total'] or 0
-            usd_adjustments = filtered_adjustments.filter(currency='USD').aggregate(total=Sum('amount'))['total'] or 0
-            
-            # Calculate return amounts
-            uzs_returned_amount = 0
-            usd_returned_amount = 0
-            uzs_supplier_fines = 0
-            usd_supplier_fines = 0
-            for return_instance in filtered_returns:
-                if return_instance.original_sale.related_acquisition.currency == 'UZS':
-                    uzs_returned_amount += return_instance.returned_acquisition_amount
-                else:
-                    usd_returned_amount += return_instance.returned_acquisition_amount
-                
-                if return_instance.supplier_fine_currency == 'UZS':
-                    uzs_supplier_fines += return_instance.total_supplier_fine_amount
-                else:
-                    usd_supplier_fines += return_instance.total_supplier_fine_amount
-            
-            # Calculate total balance including commissions and returns for 'all' filter
-            if start_date_obj:
-                filtered_balance_uzs = prior_balance_uzs + (uzs_acquisitions - uzs_commissions - uzs_payments - uzs_returned_amount + uzs_supplier_fines + uzs_adjustments)
-                filtered_balance_usd = prior_balance_usd + (usd_acquisitions - usd_commissions - usd_payments - usd_returned_amount + usd_supplier_fines + usd_adjustments)
-            else:
-                filtered_balance_uzs = uzs_acquisitions - uzs_commissions - uzs_payments - uzs_returned_amount + uzs_supplier_fines + uzs_adjustments + (supplier.initial_balance_uzs or 0)
-                filtered_balance_usd = usd_acquisitions - usd_commissions - usd_payments - usd_returned_amount + usd_supplier_fines + usd_adjustments + (supplier.initial_balance_usd or 0)
+        # Rows and running balances are computed in SQL; only the requested page is loaded,
+        # and only when the cached ledger table fragment misses
+        paginated_transactions = SimpleLazyObject(lambda: statement_page(
+            sources, filter_type, start_date_obj, end_date_obj, totals, page
+        ))
         
         context.update({
             'transactions': paginated_transactions,
+            'ledger_cache_version': ContactLedgerService.cache_version(supplier),
+            'fragment_cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
             'acquisitions': supplier.acquisitions.select_related('ticket').order_by('-acquisition_date'),
             'payments': supplier.payments.select_related('paid_from_account').order_by('-payment_date'),
             'commissions': supplier.commissions.select_related('acquisition__ticket').order_by('-commission_date'),
@@ -689,21 +263,8 @@ class SupplierDetailView(LoginRequiredMixin, DetailView):
             'current_filter': filter_type,
             'start_date': start_date,
             'end_date': end_date,
-            'starting_balance_uzs': starting_balance_uzs,
-            'starting_balance_usd': starting_balance_usd,
-            # Table footer totals (always show complete totals)
-            'uzs_acquisitions': uzs_acquisitions,
-            'usd_acquisitions': usd_acquisitions,
-            'uzs_payments': uzs_payments,
-            'usd_payments': usd_payments,
-            'uzs_commissions': uzs_commissions,
-            'usd_commissions': usd_commissions,
-            'uzs_returned_amount': locals().get('uzs_returned_amount', 0),
-            'usd_returned_amount': locals().get('usd_returned_amount', 0),
-            'uzs_supplier_fines': locals().get('uzs_supplier_fines', 0),
-            'usd_supplier_fines': locals().get('usd_supplier_fines', 0),
-            'filtered_balance_uzs': filtered_balance_uzs,
-            'filtered_balance_usd': filtered_balance_usd,
+            # Starting balance, table footer totals and closing balance
+            **totals,
             # Check if user can deactivate (only admins)
             'can_deactivate': self.request.user.is_superuser,
         })
@@ -730,6 +291,7 @@ def create_commission(request, supplier_pk):
                     acquisition = form.cleaned_data['acquisition']
                     commission.currency = acquisition.currency
                     commission.save()
+                    SalesDailyRollup.record_commission(commission)
                     
                     # Reduce supplier debt (commission means supplier owes us, reducing what we owe them)
                     supplier.reduce_debt(commission.amount, commission.currency)
@@ -790,415 +352,33 @@ class AgentDetailView(DetailView):
         agent = self.object
         
         # Get filter parameters from request
-        filter_type = self.request.GET.get('filter', 'all')
+        period = ContactLedgerService.parse_period(self.request.GET)
+        filter_type = period['filter_type']
         page = self.request.GET.get('page', 1)
-        start_date = self.request.GET.get('start_date', '')
-        end_date = self.request.GET.get('end_date', '')
-        
-        # Parse dates
-        start_date_obj = None
-        end_date_obj = None
-        
-        if start_date:
-            try:
-                start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-            except ValueError:
-                start_date = ''
-        
-        if end_date:
-            try:
-                end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-            except ValueError:
-                end_date = ''
-        elif start_date and not end_date:
-            # If only start date is provided, set end date to today
-            end_date_obj = timezone.now().date()
-            end_date = end_date_obj.strftime('%Y-%m-%d')
-        
-        # Get base querysets
-        sales = agent.agent_sales.select_related('related_acquisition__ticket').order_by('-sale_date')
-        payments = agent.payments.select_related('paid_to_account').order_by('-payment_date')
-        adjustments = agent.adjustments.all().order_by('-adjustment_date')
-        
-        # Get ticket returns for this agent
-        from apps.sales.models import TicketReturn
-        ticket_returns = TicketReturn.objects.filter(
-            original_sale__agent=agent
-        ).select_related(
-            'original_sale__related_acquisition__ticket'
-        ).order_by('-return_date')
-        
-        # Apply date filtering
-        if start_date_obj:
-            sales = sales.filter(sale_date__gte=start_date_obj)
-            payments = payments.filter(payment_date__gte=start_date_obj)
-            ticket_returns = ticket_returns.filter(return_date__date__gte=start_date_obj)
-            adjustments = adjustments.filter(adjustment_date__date__gte=start_date_obj)
-        
-        if end_date_obj:
-            sales = sales.filter(sale_date__lte=end_date_obj)
-            payments = payments.filter(payment_date__lte=end_date_obj)
-            ticket_returns = ticket_returns.filter(return_date__date__lte=end_date_obj)
-            adjustments = adjustments.filter(adjustment_date__date__lte=end_date_obj)
-        
-        # Apply filtering based on filter_type
-        if filter_type == 'uzs':
-            sales = sales.filter(sale_currency='UZS')
-            payments = payments.filter(currency='UZS')
-            ticket_returns = ticket_returns.filter(fine_currency='UZS')
-            adjustments = adjustments.filter(currency='UZS')
-        elif filter_type == 'usd':
-            sales = sales.filter(sale_currency='USD')
-            payments = payments.filter(currency='USD')
-            ticket_returns = ticket_returns.filter(fine_currency='USD')
-            adjustments = adjustments.filter(currency='USD')
-        elif filter_type == 'umra':
-            sales = sales.filter(related_acquisition__ticket__ticket_type='UMRA')
-            payments = payments.none()  # No payments are specific to ticket type
-            ticket_returns = ticket_returns.filter(original_sale__related_acquisition__ticket__ticket_type='UMRA')
-            adjustments = adjustments.none()
-        
-        # Calculate pre-period (prior) balance if a start date is provided
-        prior_balance_uzs = 0
-        prior_balance_usd = 0
-        if start_date_obj:
-            # Start from initial balances for currency/all filters; exclude initial for UMRA
-            if filter_type in ('uzs', 'usd', 'all'):
-                prior_balance_uzs = agent.initial_balance_uzs or 0
-                prior_balance_usd = agent.initial_balance_usd or 0
-            else:
-                prior_balance_uzs = 0
-                prior_balance_usd = 0
-
-            # Build pre-period querysets (before start_date)
-            pre_sales = agent.agent_sales.select_related('related_acquisition__ticket').filter(
-                sale_date__lt=start_date_obj
-            )
-            pre_payments = agent.payments.select_related('paid_to_account').filter(
-                payment_date__lt=start_date_obj
-            )
-            pre_returns = TicketReturn.objects.filter(
-                original_sale__agent=agent,
-                return_date__date__lt=start_date_obj,
-            ).select_related('original_sale__related_acquisition__ticket')
-
-            if filter_type == 'uzs':
-                pre_uzs_sales = pre_sales.filter(sale_currency='UZS').aggregate(total=Sum('total_sale_amount'))['total'] or 0
-                pre_uzs_payments = pre_payments.filter(currency='UZS').aggregate(total=Sum('amount'))['total'] or 0
-                pre_uzs_returned = 0
-                pre_uzs_fines = 0
-                for r in pre_returns:
-                    if r.original_sale.related_acquisition.currency == 'UZS':
-                        pre_uzs_returned += r.returned_acquisition_amount
-                    if r.fine_currency == 'UZS':
-                        pre_uzs_fines += r.total_fine_amount
-                prior_balance_uzs += pre_uzs_sales - pre_uzs_payments - pre_uzs_returned + pre_uzs_fines
-                prior_balance_usd = 0
+        start_date = period['start_date']
+        end_date = period['end_date']
+        start_date_obj = period['start_date_obj']
+        end_date_obj = period['end_date_obj']
+
+        # Prior balance, period totals and footer come from one aggregate query per source
+        sources = ContactLedgerService.agent_sources(agent)
+        totals = ContactLedgerService.get_cached_totals(agent, sources, filter_type, start_date_obj, end_date_obj)
+
+        # Rows and running balances are computed in SQL; only the requested page is loaded,
+        # and only when the cached ledger table fragment misses
+        paginated_transactions = SimpleLazyObject(lambda: statement_page(
+            sources, filter_type, start_date_obj, end_date_obj, totals, page
+        ))
+        
+        if filter_type == 'all' and not start_date_obj:
+            # The unfiltered statement closes on the agent's stored balance
+            totals['filtered_balance_uzs'] = agent.balance_uzs
+            totals['filtered_balance_usd'] = agent.balance_usd
 
-            elif filter_type == 'usd':
-                pre_usd_sales = pre_sales.filter(sale_currency='USD').aggregate(total=Sum('total_sale_amount'))['total'] or 0
-                pre_usd_payments = pre_payments.filter(currency='USD').aggregate(total=Sum('amount'))['total'] or 0
-                pre_usd_returned = 0
-                pre_usd_fines = 0
-                for r in pre_returns:
-                    if r.original_sale.related_acquisition.currency == 'USD':
-                        pre_usd_returned += r.returned_acquisition_amount
-                    if r.fine_currency == 'USD':
-                        pre_usd_fines += r.total_fine_amount
-                prior_balance_usd += pre_usd_sales - pre_usd_payments - pre_usd_returned + pre_usd_fines
-                prior_balance_uzs = 0
-
-            elif filter_type == 'umra':
-                pre_sales_umra = pre_sales.filter(related_acquisition__ticket__ticket_type='UMRA')
-                pre_returns_umra = pre_returns.filter(original_sale__related_acquisition__ticket__ticket_type='UMRA')
-                pre_uzs_sales = pre_sales_umra.filter(sale_currency='UZS').aggregate(total=Sum('total_sale_amount'))['total'] or 0
-                pre_usd_sales = pre_sales_umra.filter(sale_currency='USD').aggregate(total=Sum('total_sale_amount'))['total'] or 0
-                pre_uzs_returned = 0
-                pre_usd_returned = 0
-                pre_uzs_fines = 0
-                pre_usd_fines = 0
-                for r in pre_returns_umra:
-                    if r.original_sale.related_acquisition.currency == 'UZS':
-                        pre_uzs_returned += r.returned_acquisition_amount
-                    else:
-                        pre_usd_returned += r.returned_acquisition_amount
-                    if r.fine_currency == 'UZS':
-                        pre_uzs_fines += r.total_fine_amount
-                    else:
-                        pre_usd_fines += r.total_fine_amount
-                # payments are excluded for UMRA
-                prior_balance_uzs += pre_uzs_sales - 0 - pre_uzs_returned + pre_uzs_fines
-                prior_balance_usd += pre_usd_sales - 0 - pre_usd_returned + pre_usd_fines
-
-            else:  # all
-                pre_uzs_sales = pre_sales.filter(sale_currency='UZS').aggregate(total=Sum('total_sale_amount'))['total'] or 0
-                pre_usd_sales = pre_sales.filter(sale_currency='USD').aggregate(total=Sum('total_sale_amount'))['total'] or 0
-                pre_uzs_payments = pre_payments.filter(currency='UZS').aggregate(total=Sum('amount'))['total'] or 0
-                pre_usd_payments = pre_payments.filter(currency='USD').aggregate(total=Sum('amount'))['total'] or 0
-                pre_uzs_returned = 0
-                pre_usd_returned = 0
-                pre_uzs_fines = 0
-                pre_usd_fines = 0
-                for r in pre_returns:
-                    if r.original_sale.related_acquisition.currency == 'UZS':
-                        pre_uzs_returned += r.returned_acquisition_amount
-                    else:
-                        pre_usd_returned += r.returned_acquisition_amount
-                    if r.fine_currency == 'UZS':
-                        pre_uzs_fines += r.total_fine_amount
-                    else:
-                        pre_usd_fines += r.total_fine_amount
-                prior_balance_uzs += pre_uzs_sales - pre_uzs_payments - pre_uzs_returned + pre_uzs_fines
-                prior_balance_usd += pre_usd_sales - pre_usd_payments - pre_usd_returned + pre_usd_fines
-
-        # Create transactions list
-        transactions = []
-        for sale in sales:
-            transactions.append({'date': sale.sale_date, 'type': 'sale', 'sale': sale})
-        for payment in payments:
-            transactions.append({'date': payment.payment_date, 'type': 'payment', 'payment': payment})
-        for return_instance in ticket_returns:
-            transactions.append({'date': return_instance.return_date, 'type': 'return', 'return': return_instance})
-        for adj in adjustments:
-            transactions.append({'date': adj.adjustment_date, 'type': 'adjustment', 'adjustment': adj})
-        
-        # Sort by date (oldest first for balance calculation)
-        transactions.sort(key=lambda x: x['date'])
-        
-        # Calculate running balances
-        # When a start date is provided, include pre-period balance as the starting point
-        if start_date_obj:
-            starting_balance_uzs = prior_balance_uzs
-            starting_balance_usd = prior_balance_usd
-            current_balance_uzs = prior_balance_uzs
-            current_balance_usd = prior_balance_usd
-        else:
-            starting_balance_uzs = agent.initial_balance_uzs or 0
-            starting_balance_usd = agent.initial_balance_usd or 0
-            current_balance_uzs = agent.initial_balance_uzs or 0
-            current_balance_usd = agent.initial_balance_usd or 0
-        
-        for transaction in transactions:
-            if transaction['type'] == 'sale':
-                # Sale increases our receivable from agent (positive balance)
-                if transaction['sale'].sale_currency == 'UZS':
-                    current_balance_uzs += transaction['sale'].total_sale_amount
-                else:
-                    current_balance_usd += transaction['sale'].total_sale_amount
-            elif transaction['type'] == 'payment':
-                # Payment decreases our receivable from agent (negative balance)
-                if transaction['payment'].currency == 'UZS':
-                    current_balance_uzs -= transaction['payment'].amount
-                else:
-                    current_balance_usd -= transaction['payment'].amount
-            elif transaction['type'] == 'return':
-                # Return reduces agent debt by original purchase price but adds fine
-                return_instance = transaction['return']
-                returned_amount = return_instance.returned_acquisition_amount  # Original purchase price
-                fine_amount = return_instance.total_fine_amount
-                
-                if return_instance.original_sale.related_acquisition.currency == 'UZS':
-                    current_balance_uzs -= returned_amount
-                else:
-                    current_balance_usd -= returned_amount
-                
-                if return_instance.fine_currency == 'UZS':
-                    current_balance_uzs += fine_amount
-                else:
-                    current_balance_usd += fine_amount
-            elif transaction['type'] == 'adjustment':
-                adj = transaction['adjustment']
-                if adj.currency == 'UZS':
-                    current_balance_uzs += adj.amount
-                else:
-                    current_balance_usd += adj.amount
-            
-            # Store the balance after this transaction
-            transaction['balance_uzs'] = current_balance_uzs
-            transaction['balance_usd'] = current_balance_usd
-        
-        # Keep transactions sorted by oldest first for display
-        # transactions.sort(key=lambda x: x['date'], reverse=True)  # Remove this line
-        
-        # Paginate transactions
-        paginator = Paginator(transactions, 20)  # 20 transactions per page
-        try:
-            paginated_transactions = paginator.page(page)
-        except PageNotAnInteger:
-            paginated_transactions = paginator.page(1)
-        except EmptyPage:
-            paginated_transactions = paginator.page(paginator.num_pages)
-        
-        # Calculate totals for display in table footer - respect current filter and date range
-        if filter_type == 'uzs':
-            filtered_sales = agent.agent_sales.filter(sale_currency='UZS')
-            filtered_payments = agent.payments.filter(currency='UZS')
-            filtered_returns = TicketReturn.objects.filter(
-                original_sale__agent=agent,
-                fine_currency='UZS'
-            )
-            filtered_adjustments = agent.adjustments.filter(currency='UZS')
-            
-            # Apply date filtering to totals
-            if start_date_obj:
-                filtered_sales = filtered_sales.filter(sale_date__gte=start_date_obj)
-                filtered_payments = filtered_payments.filter(payment_date__gte=start_date_obj)
-                filtered_returns = filtered_returns.filter(return_date__date__gte=start_date_obj)
-                filtered_adjustments = filtered_adjustments.filter(adjustment_date__date__gte=start_date_obj)
-            if end_date_obj:
-                filtered_sales = filtered_sales.filter(sale_date__lte=end_date_obj)
-                filtered_payments = filtered_payments.filter(payment_date__lte=end_date_obj)
-                filtered_returns = filtered_returns.filter(return_date__date__lte=end_date_obj)
-                filtered_adjustments = filtered_adjustments.filter(adjustment_date__date__lte=end_date_obj)
-            
-            uzs_sales = filtered_sales.aggregate(
-                total=Sum('total_sale_amount')
-            )['total'] or 0
-            uzs_payments = filtered_payments.aggregate(total=Sum('amount'))['total'] or 0
-            
-            # Calculate return amounts
-            uzs_returned_amount = 0
-            uzs_agent_fines = 0
-            for return_instance in filtered_returns:
-                if return_instance.original_sale.related_acquisition.currency == 'UZS':
-                    uzs_returned_amount += return_instance.returned_acquisition_amount  # Original purchase price
-                uzs_agent_fines += return_instance.total_fine_amount
-            uzs_adjustments = filtered_adjustments.aggregate(total=Sum('amount'))['total'] or 0
-            
-            usd_sales = 0
-            usd_payments = 0
-            
-            # Calculate filtered balance for UZS only
-            if start_date_obj:
-                filtered_balance_uzs = prior_balance_uzs + (uzs_sales - uzs_payments - uzs_returned_amount + uzs_agent_fines + uzs_adjustments)
-            else:
-                filtered_balance_uzs = uzs_sales - uzs_payments - uzs_returned_amount + uzs_agent_fines + uzs_adjustments + (agent.initial_balance_uzs or 0)
-            filtered_balance_usd = 0
-            
-        elif filter_type == 'usd':
-            filtered_sales = agent.agent_sales.filter(sale_currency='USD')
-            filtered_payments = agent.payments.filter(currency='USD')
-            filtered_returns = TicketReturn.objects.filter(
-                original_sale__agent=agent,
-                fine_currency='USD'
-            )
-            filtered_adjustments = agent.adjustments.filter(currency='USD')
-            
-            # Apply date filtering to totals
-            if start_date_obj:
-                filtered_sales = filtered_sales.filter(sale_date__gte=start_date_obj)
-                filtered_payments = filtered_payments.filter(payment_date__gte=start_date_obj)
-                filtered_returns = filtered_returns.filter(return_date__date__gte=start_date_obj)
-                filtered_adjustments = filtered_adjustments.filter(adjustment_date__date__gte=start_date_obj)
-            if end_date_obj:
-                filtered_sales = filtered_sales.filter(sale_date__lte=end_date_obj)
-                filtered_payments = filtered_payments.filter(payment_date__lte=end_date_obj)
-                filtered_returns = filtered_returns.filter(return_date__date__lte=end_date_obj)
-                filtered_adjustments = filtered_adjustments.filter(adjustment_date__date__lte=end_date_obj)
-            
-            usd_sales = filtered_sales.aggregate(
-                total=Sum('total_sale_amount')
-            )['total'] or 0
-            usd_payments = filtered_payments.aggregate(total=Sum('amount'))['total'] or 0
-            
-            # Calculate return amounts
-            usd_returned_amount = 0
-            usd_agent_fines = 0
-            for return_instance in filtered_returns:
-                if return_instance.original_sale.related_acquisition.currency == 'USD':
-                    usd_returned_amount += return_instance.returned_acquisition_amount  # Original purchase price
-                usd_agent_fines += return_instance.total_fine_amount
-            usd_adjustments = filtered_adjustments.aggregate(total=Sum('amount'))['total'] or 0
-            
-            uzs_sales = 0
-            uzs_payments = 0
-            
-            # Calculate filtered balance for USD only
-            filtered_balance_uzs = 0
-            if start_date_obj:
-                filtered_balance_usd = prior_balance_usd + (usd_sales - usd_payments - usd_returned_amount + usd_agent_fines + usd_adjustments)
-            else:
-                filtered_balance_usd = usd_sales - usd_payments - usd_returned_amount + usd_agent_fines + usd_adjustments + (agent.initial_balance_usd or 0)
-            
-        elif filter_type == 'umra':
-            filtered_sales = agent.agent_sales.filter(related_acquisition__ticket__ticket_type='UMRA')
-            filtered_payments = agent.payments.none()  # No payments are specific to ticket type
-            
-            # Apply date filtering to totals
-            if start_date_obj:
-                filtered_sales = filtered_sales.filter(sale_date__gte=start_date_obj)
-            if end_date_obj:
-                filtered_sales = filtered_sales.filter(sale_date__lte=end_date_obj)
-            
-            uzs_sales = filtered_sales.filter(sale_currency='UZS').aggregate(
-                total=Sum('total_sale_amount')
-            )['total'] or 0
-            usd_sales = filtered_sales.filter(sale_currency='USD').aggregate(
-                total=Sum('total_sale_amount')
-            )['total'] or 0
-            uzs_payments = 0
-            usd_payments = 0
-            
-            # Calculate filtered balance for UMRA only
-            if start_date_obj:
-                filtered_balance_uzs = prior_balance_uzs + (uzs_sales - uzs_payments)
-                filtered_balance_usd = prior_balance_usd + (usd_sales - usd_payments)
-            else:
-                filtered_balance_uzs = uzs_sales - uzs_payments
-                filtered_balance_usd = usd_sales - usd_payments
-            
-        else:  # filter_type == 'all'
-            filtered_sales = agent.agent_sales
-            filtered_payments = agent.payments
-            filtered_returns = ticket_returns
-            filtered_adjustments = agent.adjustments.all()
-            
-            # Apply date filtering to totals
-            if start_date_obj:
-                filtered_sales = filtered_sales.filter(sale_date__gte=start_date_obj)
-                filtered_payments = filtered_payments.filter(payment_date__gte=start_date_obj)
-                filtered_adjustments = filtered_adjustments.filter(adjustment_date__date__gte=start_date_obj)
-            if end_date_obj:
-                filtered_sales = filtered_sales.filter(sale_date__lte=end_date_obj)
-                filtered_payments = filtered_payments.filter(payment_date__lte=end_date_obj)
-                filtered_returns = filtered_returns.filter(return_date__date__lte=end_date_obj)
-                filtered_adjustments = filtered_adjustments.filter(adjustment_date__date__lte=end_date_obj)
-            
-            uzs_sales = filtered_sales.filter(sale_currency='UZS').aggregate(
-                total=Sum('total_sale_amount')
-            )['total'] or 0
-            usd_sales = filtered_sales.filter(sale_currency='USD').aggregate(
-                total=Sum('total_sale_amount')
-            )['total'] or 0
-            uzs_payments = filtered_payments.filter(currency='UZS').aggregate(total=Sum('amount'))['total'] or 0
-            usd_payments = filtered_payments.filter(currency='USD').aggregate(total=Sum('amount'))['total'] or 0
-            # Calculate return amounts and agent fines for 'all'
-            uzs_returned_amount = 0
-            usd_returned_amount = 0
-            uzs_agent_fines = 0
-            usd_agent_fines = 0
-            for return_instance in filtered_returns:
-                if return_instance.original_sale.related_acquisition.currency == 'UZS':
-                    uzs_returned_amount += return_instance.returned_acquisition_amount
-                else:
-                    usd_returned_amount += return_instance.returned_acquisition_amount
-                if return_instance.fine_currency == 'UZS':
-                    uzs_agent_fines += return_instance.total_fine_amount
-                else:
-                    usd_agent_fines += return_instance.total_fine_amount
-            uzs_adjustments = filtered_adjustments.filter(currency='UZS').aggregate(total=Sum('amount'))['total'] or 0
-            usd_adjustments = filtered_adjustments.filter(currency='USD').aggregate(total=Sum('amount'))['total'] or 0
-            
-            # Use pre-period + period delta for start-date filter; else actual agent balance
-            if start_date_obj:
-                filtered_balance_uzs = prior_balance_uzs + (uzs_sales - uzs_payments - uzs_returned_amount + uzs_agent_fines + uzs_adjustments)
-                filtered_balance_usd = prior_balance_usd + (usd_sales - usd_payments - usd_returned_amount + usd_agent_fines + usd_adjustments)
-            else:
-                filtered_balance_uzs = agent.balance_uzs
-                filtered_balance_usd = agent.balance_usd
-        
         context.update({
             'transactions': paginated_transactions,
+            'ledger_cache_version': ContactLedgerService.cache_version(agent),
+            'fragment_cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
             'sales': agent.agent_sales.select_related('related_acquisition__ticket').order_by('-sale_date'),
             'payments': agent.payments.select_related('paid_to_account').order_by('-payment_date'),
             'payment_form': AgentPaymentForm(),
@@ -1206,19 +386,8 @@ class AgentDetailView(DetailView):
             'current_filter': filter_type,
             'start_date': start_date,
             'end_date': end_date,
-            'starting_balance_uzs': starting_balance_uzs,
-            'starting_balance_usd': starting_balance_usd,
-            # Table footer totals (always show complete totals)
-            'uzs_sales': uzs_sales,
-            'usd_sales': usd_sales,
-            'uzs_payments': uzs_payments,
-            'usd_payments': usd_payments,
-            'uzs_returned_amount': locals().get('uzs_returned_amount', 0),
-            'usd_returned_amount': locals().get('usd_returned_amount', 0),
-            'uzs_agent_fines': locals().get('uzs_agent_fines', 0),
-            'usd_agent_fines': locals().get('usd_agent_fines', 0),
-            'filtered_balance_uzs': filtered_balance_uzs,
-            'filtered_balance_usd': filtered_balance_usd,
+            # Starting balance, table footer totals and closing balance
+            **totals,
         })
         return context
 
@@ -1238,42 +407,58 @@ def add_payment(request, contact_pk, contact_type):
         form = form_class(request.POST)
         if form.is_valid():
             try:
-                payment = form.save(commit=False)
-                if contact_type == 'agent':
-                    payment.agent = contact
-                    
-                    # Handle cross-currency payment for agents
-                    if form.cleaned_data.get('payment_type') == 'cross_currency':
-                        payment.original_amount = form.cleaned_data['original_amount']
-                        payment.original_currency = form.cleaned_data['original_currency']
-                        payment.exchange_rate = form.cleaned_data['exchange_rate']
-                        
-                        # For cross-currency payments:
-                        # - payment.amount = converted amount (for debt reduction)
-                        # - payment.currency = debt currency being paid
-                        # - but actual money goes to account matching original_currency
-                        
-                        # Save payment first
-                        payment.save()
-                        
-                        # Reduce debt using converted amount in the target currency
-                        contact.reduce_debt(payment.amount, payment.currency)
+                with transaction.atomic(), BalanceDeltaCollector():
+                    payment = form.save(commit=False)
+                    if contact_type == 'agent':
+                        payment.agent = contact
                         
-                        # Add actual money received to account in original currency
-                        payment.paid_to_account.current_balance += payment.original_amount
-                        payment.paid_to_account.save(update_fields=['current_balance', 'updated_at'])
+                        # Handle cross-currency payment for agents
+                        if form.cleaned_data.get('payment_type') == 'cross_currency':
+                            payment.original_amount = form.cleaned_data['original_amount']
+                            payment.original_currency = form.cleaned_data['original_currency']
+                            payment.exchange_rate = form.cleaned_data['exchange_rate']
+                            
+                            # For cross-currency payments:
+                            # - payment.amount = converted amount (for debt reduction)
+                            # - payment.currency = debt currency being paid
+                            # - but actual money goes to account matching original_currency
+                            
+                            # Save payment first
+                            payment.save()
+                            
+                            # Reduce debt using converted amount in the target currency
+                            contact.reduce_debt(payment.amount, payment.currency)
+                            
+                            # Add actual money received to account in original currency
+                            payment.paid_to_account.post_entry(
+                                payment.original_amount,
+                                AccountLedgerEntry.SourceType.AGENT_PAYMENT, payment.pk,
+                                entry_date=payment.payment_date,
+                                description=f"Agent: {contact.name}"[:255],
+                                conversion_rate=payment.exchange_rate,
+                                counter_amount=payment.amount,
+                                counter_currency=payment.currency,
+                            )
+                        else:
+                            # Normal same-currency payment
+                            payment.save()
+                            contact.reduce_debt(payment.amount, payment.currency)
+                            payment.paid_to_account.post_entry(
+                                payment.amount,
+                                AccountLedgerEntry.SourceType.AGENT_PAYMENT, payment.pk,
+                                entry_date=payment.payment_date,
+                                description=f"Agent: {contact.name}"[:255],
+                            )
                     else:
-                        # Normal same-currency payment
+                        payment.supplier = contact
                         payment.save()
                         contact.reduce_debt(payment.amount, payment.currency)
-                        payment.paid_to_account.current_balance += payment.amount
-                        payment.paid_to_account.save(update_fields=['current_balance', 'updated_at'])
-                else:
-                    payment.supplier = contact
-                    payment.save()
-                    contact.reduce_debt(payment.amount, payment.currency)
-                    payment.paid_from_account.current_balance -= payment.amount
-                    payment.paid_from_account.save(update_fields=['current_balance', 'updated_at'])
+                        payment.paid_from_account.post_entry(
+                            -payment.amount,
+                            AccountLedgerEntry.SourceType.SUPPLIER_PAYMENT, payment.pk,
+                            entry_date=payment.payment_date,
+                            description=f"Ta'minotchi: {contact.name}"[:255],
+                        )
                 
                 # Success - add success message and redirect
                 messages.success(request, f"To'lov muvaffaqiyatli qabul qilindi!")
@@ -1300,6 +485,8 @@ def add_supplier_payment(request, supplier_pk):
 
 
 @login_required(login_url='/core/login/')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=lambda request: CacheVersionService.etag(ReferenceDataService.VERSION))
 def api_agents_list(request):
     """API endpoint to get list of agents for dropdowns"""
     agents = Agent.objects.values('id', 'name').order_by('name')
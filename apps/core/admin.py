@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Salesperson
+from .models import ConsistencyReport, Salesperson
 
 
 @admin.register(Salesperson)
@@ -18,3 +18,16 @@ class SalespersonAdmin(admin.ModelAdmin):
             'fields': ('is_active', 'created_at', 'updated_at')
         }),
     )
+
+
+@admin.register(ConsistencyReport)
+class ConsistencyReportAdmin(admin.ModelAdmin):
+    list_display = ['started_at', 'since', 'agents_checked', 'suppliers_checked', 'accounts_checked', 'drift_count', 'fixed']
+    list_filter = ['fixed']
+    ordering = ['-started_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
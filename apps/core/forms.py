@@ -1,6 +1,8 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+from apps.core.services import ReferenceDataService
 
 
 class LoginForm(forms.Form):
@@ -93,4 +95,110 @@ class SalespersonForm(forms.Form):
             if password != password_confirm:
                 raise ValidationError("Parollar mos kelmaydi.")
         
-        return cleaned_data 
\ No newline at end of file
+        return cleaned_data 
+
+
+class ReferenceChoiceIterator(ModelChoiceIterator):
+    """Options from ReferenceDataService instead of iterating the field's queryset"""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        yield from ReferenceDataService.get(self.field.reference_kind)
+
+    def __len__(self):
+        return len(ReferenceDataService.get(self.field.reference_kind)) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(ReferenceDataService.get(self.field.reference_kind))
+
+
+class ReferenceChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField rendered from cached reference data.
+
+    The queryset is only used to validate the submitted pk.
+    """
+
+    iterator = ReferenceChoiceIterator
+
+    def __init__(self, kind, queryset, **kwargs):
+        self.reference_kind = kind
+        super().__init__(queryset, **kwargs)
+
+    @classmethod
+    def replacing(cls, field, kind, queryset=None):
+        """Copy of a generated ModelChoiceField that keeps its label, widget and required flag"""
+        return cls(
+            kind,
+            field.queryset if queryset is None else queryset,
+            label=field.label,
+            help_text=field.help_text,
+            required=field.required,
+            widget=field.widget,
+            empty_label=field.empty_label,
+        )
+
+
+class PreloadedChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField that validates against rows loaded up front.
+
+    Bulk imports load every pk a chunk references with one query and swap this in for
+    the form's own field, so validating a row does not query per choice.
+    """
+
+    def __init__(self, field, objects):
+        super().__init__(field.queryset, label=field.label, required=field.required)
+        self.objects = objects
+
+    @staticmethod
+    def pk_of(value):
+        """Integer pk from a submitted or spreadsheet value, None when it is not one"""
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        try:
+            return int(str(value).strip())
+        except (TypeError, ValueError):
+            return None
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        obj = self.objects.get(self.pk_of(value))
+        if obj is None:
+            raise ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value}
+            )
+        return obj
+
+
+class ImportFormMixin:
+    """
+    ModelForm mixin for bulk import rows whose choice fields were loaded up front.
+
+    ``preloaded`` maps a field name to its ``{pk: object}`` rows; those fields become
+    PreloadedChoiceFields. They are already checked against their querysets, so the
+    model's full_clean skips them instead of re-querying each foreign key row by row.
+    """
+
+    def __init__(self, *args, preloaded=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.preloaded = preloaded or {}
+        for name, objects in self.preloaded.items():
+            self.fields[name] = PreloadedChoiceField(self.fields[name], objects)
+
+    def _get_validation_exclusions(self):
+        return super()._get_validation_exclusions() | set(self.preloaded)
+
+
+def form_error_messages(form):
+    """Flat list of a bound form's errors, each prefixed with its field label"""
+    messages = []
+    for field, field_errors in form.errors.items():
+        for error in field_errors:
+            if field == '__all__':
+                messages.append(str(error))
+            else:
+                messages.append(f"{form.fields[field].label or field}: {error}")
+    return messages
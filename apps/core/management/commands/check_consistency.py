@@ -0,0 +1,41 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.core.services import ConsistencyCheckService, DateFilterService
+
+
+class Command(BaseCommand):
+    help = "Re-verify agent, supplier and account balances touched since the last run and store a ConsistencyReport."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Check rows changed at or after this date/datetime instead of the stored watermark')
+        parser.add_argument('--full', action='store_true', help='Check every balance regardless of the watermark')
+        parser.add_argument('--tolerance', type=Decimal, default=Decimal('0.01'), help='Ignore differences up to this amount')
+        parser.add_argument('--fix', action='store_true', help='Correct drifted balances')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = DateFilterService.parse_moment(options['since'])
+            if since is None:
+                raise CommandError("--since must be an ISO date or datetime")
+
+        report = ConsistencyCheckService.run(
+            since=since, full=options['full'], fix=options['fix'], tolerance=options['tolerance'],
+        )
+
+        scope = f"since {timezone.localtime(report.since):%Y-%m-%d %H:%M}" if report.since else "full"
+        self.stdout.write(
+            f"Checked ({scope}): {report.agents_checked} agents, {report.suppliers_checked} suppliers, "
+            f"{report.accounts_checked} accounts in {(report.finished_at - report.started_at).total_seconds():.1f}s"
+        )
+        for drift in report.drifts:
+            diff = ', '.join(f"{currency} {value}" for currency, value in drift['diff'].items())
+            self.stdout.write(self.style.ERROR(f"  {drift['type']} {drift['id']} ({drift['name']}): {diff}"))
+
+        if not report.drift_count:
+            self.stdout.write(self.style.SUCCESS(f"No drift found (report {report.pk})"))
+        elif report.fixed:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {report.drift_count} drifted balances (report {report.pk})"))
+        else:
+            self.stdout.write(self.style.WARNING(f"Found {report.drift_count} drifted balances (report {report.pk})"))
@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from apps.accounting.models import AccountLedgerEntry, Expenditure, FinancialAccount
+from apps.contacts.models import Agent, Supplier
+from apps.contacts.services import ContactLedgerService
+from apps.core.dashboard_service import DashboardService
+from apps.core.models import Salesperson
+from apps.core.services import DateFilterService
+from apps.inventory.models import Acquisition
+from apps.sales.forms import available_acquisitions, returnable_sales
+from apps.sales.models import Sale, TicketReturn
+
+
+class Command(BaseCommand):
+    help = "Print the database query plan of the dashboard, ledger and list queries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Only explain queries whose name starts with one of these')
+        parser.add_argument('--period', choices=['day', 'week', 'month'], default='month',
+                            help='Date window used by the filtered lists')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Run the queries and report actual timings (PostgreSQL only)')
+
+    def handle(self, *args, **options):
+        explain_options = {}
+        if options['analyze']:
+            if connection.vendor != 'postgresql':
+                raise CommandError("--analyze is only supported on PostgreSQL")
+            explain_options = {'analyze': True, 'buffers': True}
+
+        queries = self.get_queries(options['period'])
+        if options['names']:
+            queries = [(name, qs) for name, qs in queries if name.startswith(tuple(options['names']))]
+            if not queries:
+                raise CommandError("No query matches the given names")
+
+        for name, queryset in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"== {name}"))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write('')
+
+    def get_queries(self, period):
+        """(name, queryset) pairs shaped like the ones the views run"""
+        start_date, end_date = DateFilterService.get_date_range(period)
+        in_period = lambda queryset, field: DateFilterService.filter_queryset(queryset, field, start_date, end_date)
+
+        # Sample ids; missing rows still produce a valid plan
+        account_id = FinancialAccount.objects.values_list('pk', flat=True).first() or 0
+        agent = Agent.objects.first() or Agent(pk=0)
+        supplier = Supplier.objects.first() or Supplier(pk=0)
+        salesperson_id = Salesperson.objects.values_list('pk', flat=True).first() or 0
+        sale_id = Sale.objects.values_list('pk', flat=True).first() or 0
+        acquisition_id = Acquisition.objects.values_list('pk', flat=True).first() or 0
+
+        ledger = AccountLedgerEntry.objects.values(*DashboardService.LEDGER_FIELDS)
+        sales = Sale.objects.order_by('-sale_date', '-created_at')
+        queries = [
+            ('dashboard.recent_transactions', DashboardService.get_recent_all_transactions(limit=20)),
+            ('dashboard.account_transactions', DashboardService.get_account_transactions(account_id, limit=20)),
+            ('dashboard.account_transactions_before', ledger.filter(account_id=account_id).filter(
+                entry_date__lt=DateFilterService.day_start(start_date)).order_by('-entry_date', '-id')[:21]),
+            ('list.sales', in_period(sales, 'sale_date')[:20]),
+            ('list.sales_by_agent', in_period(sales.filter(agent=agent), 'sale_date')[:20]),
+            ('list.sales_direct', in_period(sales.filter(agent__isnull=True), 'sale_date')[:20]),
+            ('list.sales_direct_by_account', sales.filter(agent__isnull=True, paid_to_account_id=account_id)),
+            ('list.sales_by_acquisition', sales.filter(related_acquisition_id=acquisition_id)),
+            ('list.salesperson_sales', in_period(sales.filter(salesperson_id=salesperson_id), 'sale_date')[:20]),
+            ('list.returns', in_period(TicketReturn.objects.order_by('-return_date'), 'return_date')[:20]),
+            ('list.returns_by_sale', TicketReturn.objects.filter(original_sale_id=sale_id).order_by('return_date')),
+            ('list.acquisitions', in_period(
+                Acquisition.objects.filter(is_active=True, salesperson_id=salesperson_id), 'acquisition_date'
+            ).order_by('-acquisition_date')[:20]),
+            ('list.expenditures', in_period(Expenditure.objects.order_by('-expenditure_date'), 'expenditure_date')[:20]),
+            ('picker.available_acquisitions', available_acquisitions().filter(salesperson_id=salesperson_id)[:21]),
+            ('picker.returnable_sales', returnable_sales().order_by('-sale_date')[:21]),
+        ]
+
+        for label, contact, sources in (
+            ('supplier', supplier, ContactLedgerService.supplier_sources(supplier)),
+            ('agent', agent, ContactLedgerService.agent_sources(agent)),
+        ):
+            for source in sources:
+                queryset = source['queryset'].filter(
+                    ContactLedgerService._period_q(source['date_field'], start_date, end_date)
+                ).order_by(source['date_field'])
+                queries.append((f"ledger.{label}_{source['type']}", queryset))
+        return queries
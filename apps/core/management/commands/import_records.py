@@ -0,0 +1,62 @@
+import csv
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from apps.core.utils import StreamingTableReader
+from apps.inventory.services import AcquisitionImportService
+from apps.sales.services import SaleImportService
+
+IMPORTERS = {
+    'acquisitions': AcquisitionImportService,
+    'sales': SaleImportService,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Import acquisitions or sales from an .xlsx or .csv file whose first row names the form fields. "
+        "Rows are validated and written in chunks; invalid rows are skipped and reported by row number."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS), help='What the file contains')
+        parser.add_argument('path', help='.xlsx or .csv file')
+        parser.add_argument('--user', required=True, help='Username the records are entered as (salesperson or superuser)')
+        parser.add_argument('--dry-run', action='store_true', help='Validate every row without writing anything')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help=f'Rows validated and written per transaction (default {AcquisitionImportService.CHUNK_SIZE})')
+        parser.add_argument('--errors', help='Write the row-level error report to this CSV file instead of the console')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named '{options['user']}'")
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive")
+        try:
+            reader = StreamingTableReader(options['path'])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        importer = IMPORTERS[options['kind']](user, dry_run=options['dry_run'], chunk_size=options['chunk_size'])
+        try:
+            imported, errors = importer.run(reader.rows())
+        except FileNotFoundError:
+            raise CommandError(f"File not found: {options['path']}")
+
+        if errors and options['errors']:
+            with open(options['errors'], 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['row', 'errors'])
+                for row_number, messages in errors:
+                    writer.writerow([row_number, '; '.join(messages)])
+        else:
+            for row_number, messages in errors:
+                self.stdout.write(self.style.ERROR(f"  row {row_number}: {'; '.join(messages)}"))
+
+        verb = "valid (dry run, nothing written)" if options['dry_run'] else "imported"
+        self.stdout.write(f"{options['kind'].capitalize()}: {imported} rows {verb}, {len(errors)} rows rejected")
+        if errors and options['errors']:
+            self.stdout.write(self.style.WARNING(f"Error report written to {options['errors']}"))
+        elif not errors:
+            self.stdout.write(self.style.SUCCESS("No errors"))
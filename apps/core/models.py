@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 
 class Salesperson(models.Model):
@@ -25,3 +26,32 @@ class Salesperson(models.Model):
         ordering = ['user__first_name', 'user__last_name']
 
 
+
+
+class ConsistencyReport(models.Model):
+    """
+    Outcome of one check_consistency run.
+
+    The start of the latest run is the watermark of the next one, which only
+    re-verifies balances whose rows changed after it.
+    """
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField()
+    since = models.DateTimeField(null=True, blank=True, help_text="Rows changed from this moment were checked; empty for a full check")
+    agents_checked = models.PositiveIntegerField(default=0)
+    suppliers_checked = models.PositiveIntegerField(default=0)
+    accounts_checked = models.PositiveIntegerField(default=0)
+    drift_count = models.PositiveIntegerField(default=0)
+    drifts = models.JSONField(default=list, blank=True, help_text="[{type, id, name, diff}] of every drifted balance")
+    fixed = models.BooleanField(default=False, help_text="Drifted balances were corrected")
+
+    def __str__(self):
+        return f"{timezone.localtime(self.started_at):%Y-%m-%d %H:%M} - {self.drift_count} ta farq"
+
+    class Meta:
+        verbose_name = "Muvofiqlik hisoboti"
+        verbose_name_plural = "Muvofiqlik hisobotlari"
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['-started_at'], name='consistency_started_idx'),
+        ]
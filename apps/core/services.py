@@ -1,5 +1,19 @@
+import logging
+import threading
+from abc import ABC, abstractmethod
+from itertools import islice
+from time import time_ns
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, models, transaction
+from django.db.models import F, Q
 from django.utils import timezone
-from datetime import timedelta
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+logger = logging.getLogger(__name__)
 
 
 class DateFilterService:
@@ -40,6 +54,70 @@ class DateFilterService:
             # Default to today
             return today, today
     
+    @staticmethod
+    def day_start(day):
+        """Aware datetime for local midnight at the start of ``day``"""
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    @staticmethod
+    def to_datetime_bounds(start_date=None, end_date=None):
+        """
+        Half-open aware bounds ``[start 00:00, end + 1 day 00:00)`` in local time.
+
+        Either date may be None, leaving that side of the range open.
+        """
+        start = DateFilterService.day_start(start_date) if start_date else None
+        end = DateFilterService.day_start(end_date + timedelta(days=1)) if end_date else None
+        return start, end
+
+    @staticmethod
+    def get_datetime_range(filter_period, date_filter=None, start_date=None, end_date=None):
+        """Same periods as get_date_range, as half-open aware datetime bounds"""
+        return DateFilterService.to_datetime_bounds(
+            *DateFilterService.get_date_range(filter_period, date_filter, start_date, end_date)
+        )
+
+    @staticmethod
+    def filter_queryset(queryset, field, start_date=None, end_date=None):
+        """
+        Restrict a DateTimeField to whole local days with ``field__gte`` / ``field__lt``.
+
+        Compares the raw column, so an index on ``field`` stays usable, unlike ``field__date``.
+        """
+        return queryset.filter(DateFilterService.range_q(field, start_date, end_date))
+
+    @staticmethod
+    def range_q(field, start_date=None, end_date=None):
+        """Q for the half-open day range on ``field``; empty when both dates are None"""
+        start, end = DateFilterService.to_datetime_bounds(start_date, end_date)
+        q = Q()
+        if start:
+            q &= Q(**{f'{field}__gte': start})
+        if end:
+            q &= Q(**{f'{field}__lt': end})
+        return q
+
+    @staticmethod
+    def parse_moment(value):
+        """Aware datetime from an ISO datetime, or the start of an ISO date; None if invalid"""
+        try:
+            moment = parse_datetime(value)
+            day = parse_date(value) if moment is None else None
+        except ValueError:
+            return None
+        if moment is None:
+            return DateFilterService.day_start(day) if day else None
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    @staticmethod
+    def changed_since(queryset, since):
+        """Rows created or edited at or after ``since``; by created_at for models without updated_at"""
+        field_names = {field.name for field in queryset.model._meta.get_fields()}
+        field = 'updated_at' if 'updated_at' in field_names else 'created_at'
+        return queryset.filter(**{f'{field}__gte': since})
+
     @staticmethod
     def get_filter_context(filter_period, date_filter, start_date, end_date):
         """
@@ -60,4 +138,352 @@ class DateFilterService:
             today = timezone.localdate()
             context['current_date_filter'] = today.strftime('%Y-%m-%d')
         
-        return context 
\ No newline at end of file
+        return context 
+
+class BalanceDeltaCollector:
+    """
+    Coalesces balance deltas while active and writes one UPDATE per row when the block exits.
+
+    Use inside ``transaction.atomic()``::
+
+        with transaction.atomic(), BalanceDeltaCollector():
+            account.post_entry(...)
+            supplier.reduce_debt(...)
+            supplier.add_debt(...)
+
+    ``adjust_balance`` on contacts and accounts defers to the active collector instead of
+    issuing its own UPDATE. Nested collectors join the outermost one. Pending deltas are
+    dropped if the block raises.
+    """
+
+    _state = threading.local()
+
+    def __init__(self):
+        self.deltas = {}
+        self._outer = None
+
+    @classmethod
+    def current(cls):
+        return getattr(cls._state, 'collector', None)
+
+    @classmethod
+    def pending_delta(cls, model, pk, field):
+        """Delta for ``model.field`` of row ``pk`` collected but not yet written"""
+        collector = cls.current()
+        if collector is None:
+            return 0
+        return collector.deltas.get((model, pk), {}).get(field, 0)
+
+    def add(self, instance, field, amount):
+        """Queue ``amount`` for ``field`` and mirror it on the in-memory instance"""
+        fields = self.deltas.setdefault((type(instance), instance.pk), {})
+        fields[field] = fields.get(field, 0) + amount
+        setattr(instance, field, getattr(instance, field) + amount)
+
+    def flush(self):
+        now = timezone.now()
+        for (model, pk), fields in self.deltas.items():
+            changes = {field: F(field) + amount for field, amount in fields.items() if amount}
+            if not changes:
+                continue
+            if any(f.name == 'updated_at' for f in model._meta.concrete_fields):
+                changes['updated_at'] = now
+            model.objects.filter(pk=pk).update(**changes)
+            logger.info(f"Flushed balance deltas for {model.__name__} {pk}: {fields}")
+        self.deltas = {}
+
+    def __enter__(self):
+        self._outer = self.current()
+        if self._outer is None:
+            self._state.collector = self
+        return self._outer or self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._outer is not None:
+            return False
+        self._state.collector = None
+        if exc_type is None:
+            self.flush()
+        return False
+
+
+class CacheVersionService:
+    """
+    Named version numbers for namespacing cache entries.
+
+    Entries built on a version are keyed by it, so replacing the version orphans all of
+    them at once; they are never read again and simply expire.
+    """
+
+    KEY_PREFIX = 'cache_version:'
+    # Financial account list and balances (dashboard)
+    ACCOUNTS = 'accounts'
+    # Salesperson rows and their rolled-up sales (salesperson list)
+    SALESPEOPLE = 'salespeople'
+    # Acquisitions and their stock (acquisition dropdown API)
+    ACQUISITIONS = 'acquisitions'
+
+    @staticmethod
+    def get(name):
+        key = CacheVersionService.KEY_PREFIX + name
+        version = cache.get(key)
+        if version is None:
+            # A fresh value rather than 1, so entries from before an eviction are not reused
+            version = time_ns()
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+        return version
+
+    @staticmethod
+    def bump(*names):
+        cache.set_many({CacheVersionService.KEY_PREFIX + name: time_ns() for name in names}, None)
+
+    @staticmethod
+    def bump_on_commit(*names):
+        """Bump once the current transaction commits, so nothing re-caches rows that are about to change"""
+        transaction.on_commit(lambda: CacheVersionService.bump(*names))
+
+    # Versions kept here live in one process only; each worker would hand out its own ETag
+    PER_PROCESS_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+    @staticmethod
+    def etag(*names, scope=None):
+        """
+        ETag for a response built only from rows covered by these versions (and ``scope``).
+
+        None (no ETag, the view always runs) unless the cache is shared by every worker.
+        """
+        if settings.CACHES['default']['BACKEND'] in CacheVersionService.PER_PROCESS_BACKENDS:
+            return None
+        parts = [str(CacheVersionService.get(name)) for name in names]
+        if scope is not None:
+            parts.append(str(scope))
+        return '-'.join(parts)
+
+    @staticmethod
+    def ledger_name(contact_type, contact_id):
+        """Version of one agent's or supplier's statement"""
+        return f'ledger:{contact_type}:{contact_id}'
+
+
+class ReferenceDataService:
+    """
+    Cached ``(id, label)`` tuples for the agent, supplier, salesperson and account dropdowns.
+
+    Entries are keyed by the ``reference_data`` cache version, which core.signals bumps
+    whenever one of the source rows is saved or deleted.
+    """
+
+    VERSION = 'reference_data'
+    TIMEOUT = 60 * 60 * 24
+    KINDS = ('agents', 'suppliers', 'active_suppliers', 'salespeople', 'active_salespeople', 'active_accounts')
+
+    @staticmethod
+    def get(kind):
+        if kind not in ReferenceDataService.KINDS:
+            raise ValueError(f"Unknown reference data kind: {kind}")
+        key = f"reference_data:{CacheVersionService.get(ReferenceDataService.VERSION)}:{kind}"
+        data = cache.get(key)
+        if data is None:
+            data = ReferenceDataService._load(kind)
+            cache.set(key, data, ReferenceDataService.TIMEOUT)
+        return data
+
+    @staticmethod
+    def _load(kind):
+        from apps.accounting.models import FinancialAccount
+        from apps.contacts.models import Agent, Supplier
+        from apps.core.constants import AccountTypeChoices
+        from apps.core.models import Salesperson
+
+        if kind == 'agents':
+            return tuple(Agent.objects.order_by('name').values_list('pk', 'name'))
+        if kind in ('suppliers', 'active_suppliers'):
+            suppliers = Supplier.objects.order_by('name')
+            if kind == 'active_suppliers':
+                suppliers = suppliers.filter(is_active=True)
+            return tuple(suppliers.values_list('pk', 'name'))
+        if kind in ('salespeople', 'active_salespeople'):
+            salespeople = Salesperson.objects.select_related('user').order_by('user__first_name', 'user__last_name')
+            if kind == 'active_salespeople':
+                salespeople = salespeople.filter(is_active=True)
+            return tuple((salesperson.pk, salesperson.full_name) for salesperson in salespeople)
+        # Live balances stay out of the labels: they change without a save signal
+        accounts = FinancialAccount.objects.filter(is_active=True).order_by('name')
+        # Like get_account_type_display(): a legacy type outside the choices shows as stored
+        type_labels = dict(AccountTypeChoices.choices)
+        return tuple(
+            (pk, f"{name} ({type_labels.get(account_type, account_type)} - {currency})")
+            for pk, name, account_type, currency in accounts.values_list('pk', 'name', 'account_type', 'currency')
+        )
+
+
+class ConsistencyCheckService:
+    """
+    Incremental balance verification for agents, suppliers and financial accounts.
+
+    Only balances whose rows changed since the previous run are reconciled, so a
+    nightly run costs in proportion to the day's activity rather than the history.
+    """
+
+    # Re-read a little before the last start so rows committed by transactions
+    # that were still open at that moment are not skipped
+    WATERMARK_OVERLAP = timedelta(minutes=10)
+
+    @staticmethod
+    def watermark():
+        """Where the next run starts from; None when no run has completed yet"""
+        from .models import ConsistencyReport
+        last_start = ConsistencyReport.objects.values_list('started_at', flat=True).first()
+        return last_start - ConsistencyCheckService.WATERMARK_OVERLAP if last_start else None
+
+    @staticmethod
+    def run(since=None, full=False, fix=False, tolerance=Decimal('0.01')):
+        """
+        Reconcile everything touched since ``since`` (default: the stored watermark),
+        or every balance when ``full`` is set or no watermark exists yet.
+        Returns the saved ConsistencyReport.
+        """
+        from apps.accounting.models import FinancialAccount
+        from apps.accounting.services import AccountReconciliationService
+        from apps.contacts.services import BalanceReconciliationService
+        from .models import ConsistencyReport
+
+        started_at = timezone.now()
+        if full:
+            since = None
+        elif since is None:
+            since = ConsistencyCheckService.watermark()
+
+        checked = {}
+        drifts = []
+        for contact_type in ('agent', 'supplier'):
+            model = BalanceReconciliationService.contact_model(contact_type)
+            ids = None if since is None else BalanceReconciliationService.touched_since(contact_type, since)
+            checked[contact_type] = model.objects.count() if ids is None else len(ids)
+            found = BalanceReconciliationService.find_drift(contact_type, ids, tolerance) if checked[contact_type] else []
+            if fix:
+                BalanceReconciliationService.apply_fixes(contact_type, found)
+            drifts.extend({
+                'type': contact_type, 'id': drift['id'], 'name': drift['name'],
+                'diff': {currency: str(value) for currency, value in drift['diff'].items() if value},
+            } for drift in found)
+
+        ids = None if since is None else AccountReconciliationService.touched_since(since)
+        checked['account'] = FinancialAccount.objects.count() if ids is None else len(ids)
+        found = AccountReconciliationService.find_drift(ids, tolerance) if checked['account'] else []
+        if fix:
+            AccountReconciliationService.apply_fixes(found)
+        drifts.extend({
+            'type': 'account', 'id': drift['id'], 'name': drift['name'],
+            'diff': {drift['currency']: str(drift['diff'])}, 'ledger': str(drift['ledger']),
+        } for drift in found)
+
+        report = ConsistencyReport.objects.create(
+            started_at=started_at,
+            finished_at=timezone.now(),
+            since=since,
+            agents_checked=checked['agent'],
+            suppliers_checked=checked['supplier'],
+            accounts_checked=checked['account'],
+            drift_count=len(drifts),
+            drifts=drifts,
+            fixed=fix and bool(drifts),
+        )
+        if drifts:
+            logger.warning(f"Consistency check found {len(drifts)} drifted balances (report {report.pk})")
+        return report
+
+
+class BulkImportService(ABC):
+    """
+    Chunked import of table rows such as StreamingTableReader yields.
+
+    Each chunk is validated and written in one transaction. Subclasses build the
+    row's form in ``build_form``, turn a valid form into unsaved records in
+    ``build_records`` and insert a chunk's records with ``write``, which bulk-creates
+    them and applies stock and balance changes once per chunk. Invalid rows are
+    skipped and reported by row number; with ``dry_run`` nothing is written.
+    """
+
+    CHUNK_SIZE = 200
+
+    def __init__(self, user, dry_run=False, chunk_size=None):
+        self.user = user
+        self.dry_run = dry_run
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.imported = 0
+        self.errors = []
+        self.objects = {}
+
+    @abstractmethod
+    def build_form(self, data):
+        """Bound ImportFormMixin form validating one row's ``data`` against ``self.objects``"""
+
+    @abstractmethod
+    def build_records(self, form):
+        """Unsaved record(s) for a valid form; may raise ValidationError"""
+
+    @abstractmethod
+    def write(self, records):
+        """Insert one chunk's records and apply their stock and balance changes"""
+
+    @staticmethod
+    def insert(model, objects):
+        """
+        Insert unsaved ``objects`` and return them with their primary keys set.
+
+        bulk_create only sets them where the database returns inserted rows; elsewhere the
+        rows go in one by one through the base Model.save, which like bulk_create skips the
+        model's own save() bookkeeping that ``write`` does per chunk.
+        """
+        if connection.features.can_return_rows_from_bulk_insert:
+            return model.objects.bulk_create(objects)
+        for obj in objects:
+            models.Model.save(obj, force_insert=True)
+        return objects
+
+    def choices_queryset(self, name, queryset):
+        """Queryset the pks of choice field ``name`` are loaded from, once per chunk"""
+        return queryset
+
+    def run(self, rows):
+        """Import (row_number, data) pairs. Returns (imported row count, [(row_number, [messages])])."""
+        rows = iter(rows)
+        while chunk := list(islice(rows, self.chunk_size)):
+            self._import_chunk(chunk)
+        return self.imported, self.errors
+
+    def _import_chunk(self, chunk):
+        from .forms import form_error_messages
+
+        with transaction.atomic(), BalanceDeltaCollector():
+            self.preload([data for _, data in chunk])
+            records = []
+            for row_number, data in chunk:
+                form = self.build_form(data)
+                if not form.is_valid():
+                    self.errors.append((row_number, form_error_messages(form)))
+                    continue
+                try:
+                    records.append(self.build_records(form))
+                except ValidationError as error:
+                    self.errors.append((row_number, error.messages))
+            if records and not self.dry_run:
+                self.write(records)
+        self.imported += len(records)
+        logger.info(
+            f"{type(self).__name__}: {len(records)} of {len(chunk)} rows valid"
+            f"{' (dry run)' if self.dry_run else ''}"
+        )
+
+    def preload(self, rows):
+        """Load every object the chunk references, one query per choice field"""
+        from django.forms import ModelChoiceField
+        from .forms import PreloadedChoiceField
+
+        self.objects = {}
+        for name, field in self.build_form({}).fields.items():
+            if isinstance(field, ModelChoiceField):
+                ids = {PreloadedChoiceField.pk_of(row.get(name)) for row in rows} - {None}
+                self.objects[name] = self.choices_queryset(name, field.queryset).in_bulk(ids) if ids else {}
@@ -0,0 +1,46 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from apps.core.services import CacheVersionService, ReferenceDataService
+
+# Models whose rows appear in the cached dropdown data
+REFERENCE_SENDERS = {
+    'contacts.Agent', 'contacts.Supplier', 'core.Salesperson', 'auth.User', 'accounting.FinancialAccount',
+}
+
+# Saves limited to these fields never change a dropdown label or membership
+REFERENCE_IGNORED_FIELDS = {'balance_uzs', 'balance_usd', 'current_balance', 'updated_at', 'last_login'}
+
+# Cache versions of the fragments and API responses that render these models directly
+FRAGMENT_VERSIONS = {
+    'accounting.FinancialAccount': CacheVersionService.ACCOUNTS,
+    'core.Salesperson': CacheVersionService.SALESPEOPLE,
+    'auth.User': CacheVersionService.SALESPEOPLE,
+    'inventory.Acquisition': CacheVersionService.ACQUISITIONS,
+    'inventory.Ticket': CacheVersionService.ACQUISITIONS,
+}
+
+
+def _versions_for(sender, update_fields=None):
+    label = sender._meta.label
+    names = []
+    if label in REFERENCE_SENDERS and not (
+        update_fields is not None and set(update_fields) <= REFERENCE_IGNORED_FIELDS
+    ):
+        names.append(ReferenceDataService.VERSION)
+    if label in FRAGMENT_VERSIONS and not (update_fields is not None and set(update_fields) <= {'last_login'}):
+        names.append(FRAGMENT_VERSIONS[label])
+    return names
+
+
+@receiver(post_save)
+def bump_cache_versions_on_save(sender, instance, update_fields=None, **kwargs):
+    names = _versions_for(sender, update_fields)
+    if names:
+        CacheVersionService.bump_on_commit(*names)
+
+
+@receiver(post_delete)
+def bump_cache_versions_on_delete(sender, instance, **kwargs):
+    names = _versions_for(sender)
+    if names:
+        CacheVersionService.bump_on_commit(*names)
@@ -1,3 +1,80 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.utils import timezone
+from apps.accounting.models import FinancialAccount, AccountLedgerEntry
+from .dashboard_service import DashboardService
 
-# Create your tests here.
+
+class LedgerPageTestCase(TestCase):
+    PAGE_SIZE = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = FinancialAccount.objects.create(
+            name='Kassa UZS', account_type='CASH_UZS', currency='UZS', current_balance=Decimal('0')
+        )
+        # 25 rows on three timestamps, so every page boundary falls inside a tie
+        cls.moments = [timezone.now().replace(microsecond=0) - timedelta(hours=hours) for hours in (1, 2, 3)]
+        AccountLedgerEntry.objects.bulk_create([
+            AccountLedgerEntry(
+                account=cls.account, entry_date=cls.moments[i % 3], amount=Decimal(i + 1), currency='UZS',
+                source_type=AccountLedgerEntry.SourceType.DEPOSIT, source_id=i + 1,
+            )
+            for i in range(25)
+        ])
+
+    def entries(self):
+        return DashboardService.get_account_transactions(self.account)
+
+
+class DashboardCursorTests(LedgerPageTestCase):
+    def walk(self):
+        pages, cursor = [], None
+        while True:
+            page, next_cursor = DashboardService.get_transactions_before(self.entries(), cursor, self.PAGE_SIZE)
+            pages.append([entry['id'] for entry in page])
+            if next_cursor is None:
+                return pages
+            cursor = DashboardService.parse_cursor(next_cursor)
+
+    def test_pages_cover_every_row_once_across_ties(self):
+        pages = self.walk()
+
+        expected = list(self.entries().values_list('id', flat=True))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([entry_id for page in pages for entry_id in page], expected)
+
+    def test_full_last_page_has_no_next_cursor(self):
+        AccountLedgerEntry.objects.filter(pk__in=list(self.entries().values_list('id', flat=True))[20:]).delete()
+
+        self.assertEqual([len(page) for page in self.walk()], [10, 10])
+
+    def test_cursor_round_trip(self):
+        entry = self.entries()[0]
+
+        self.assertEqual(
+            DashboardService.parse_cursor(DashboardService.make_cursor(entry)),
+            (entry['entry_date'], entry['source_type'], entry['id']),
+        )
+
+    def test_malformed_cursors_are_ignored(self):
+        for value in (None, '', 'abc', '2025-01-01T10:00:00,NOPE,5', '2025-01-01T10:00:00,DEPOSIT,x'):
+            self.assertIsNone(DashboardService.parse_cursor(value), value)
+
+
+class DashboardViewPaginationTests(LedgerPageTestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'parol123'))
+
+    def test_older_link_continues_after_page_number_page(self):
+        response = self.client.get('/core/dashboard/', {'account_id': self.account.pk, 'page': 2})
+        page_ids = [entry['id'] for entry in response.context['transactions_page_obj'].object_list]
+        cursor = response.context['transactions_next_cursor']
+
+        response = self.client.get('/core/dashboard/', {'account_id': self.account.pk, 'before': cursor})
+        self.assertTrue(response.context['transactions_cursor_mode'])
+        expected = list(self.entries().values_list('id', flat=True))
+        self.assertEqual(page_ids, expected[10:20])
+        self.assertEqual(len(response.context['transactions']), 5)
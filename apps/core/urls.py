@@ -4,7 +4,7 @@ from .views import (
     SalespersonListView, SalespersonDetailView, 
     salesperson_export_excel, salesperson_edit, 
     salesperson_toggle_status, transfer_money, 
-    get_transfer_form, deposit_money
+    get_transfer_form, deposit_money, post_batch
 )
 
 app_name = 'core'
@@ -18,6 +18,7 @@ urlpatterns = [
     path('transfer/', transfer_money, name='transfer-money'),
     path('transfer/form/', get_transfer_form, name='transfer-form'),
     path('deposit/', deposit_money, name='deposit-money'),
+    path('transfer/batch/', post_batch, name='post-batch'),
     
     # Salesperson URLs
     path('salesperson/', SalespersonListView.as_view(), name='salesperson-list'),
@@ -1,67 +1,163 @@
-from openpyxl import Workbook
+import csv
+import os
+import tempfile
+from itertools import count
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill
 from openpyxl.utils import get_column_letter
-from django.http import HttpResponse
+from django.http import FileResponse
 from django.utils import timezone
 
 
+class StreamingExcelExport:
+    """
+    Constant-memory Excel export built on a write-only workbook.
+
+    ``columns`` is a list of (header, getter) pairs; each getter turns one source row
+    (model instance, values() dict, ...) into a cell value. Column widths are measured
+    incrementally over the first ``width_sample_rows`` rows, which are the only rows held
+    in memory, because a write-only sheet needs its widths before the first row.
+    The file is assembled in a temporary file and streamed back with FileResponse.
+    """
+
+    HEADER_FONT = Font(bold=True, color="FFFFFF")
+    HEADER_FILL = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="center")
+    CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    def __init__(self, title, columns, max_width=50, width_sample_rows=1000):
+        self.title = title
+        self.columns = columns
+        self.max_width = max_width
+        self.width_sample_rows = width_sample_rows
+        self.widths = [len(str(header)) for header, _ in columns]
+
+    def _measure(self, values):
+        for index, value in enumerate(values):
+            length = len(str(value)) if value is not None else 0
+            if length > self.widths[index]:
+                self.widths[index] = length
+
+    def _header_cells(self, ws):
+        cells = []
+        for header, _ in self.columns:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font = self.HEADER_FONT
+            cell.fill = self.HEADER_FILL
+            cell.alignment = self.HEADER_ALIGNMENT
+            cells.append(cell)
+        return cells
+
+    def write(self, rows, footer_lines=()):
+        """Write ``rows`` to a temporary file and return it positioned at the start"""
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title=self.title)
+
+        getters = [getter for _, getter in self.columns]
+        rows = iter(rows)
+        sample = []
+        for row in rows:
+            values = [getter(row) for getter in getters]
+            self._measure(values)
+            sample.append(values)
+            if len(sample) >= self.width_sample_rows:
+                break
+
+        for index, width in enumerate(self.widths, 1):
+            ws.column_dimensions[get_column_letter(index)].width = min(width + 2, self.max_width)
+
+        ws.append(self._header_cells(ws))
+        for values in sample:
+            ws.append(values)
+        del sample
+        for row in rows:
+            ws.append([getter(row) for getter in getters])
+
+        if footer_lines:
+            ws.append([])
+            for line in footer_lines:
+                ws.append([line])
+
+        output = tempfile.TemporaryFile()
+        wb.save(output)
+        output.seek(0)
+        return output
+
+    def response(self, rows, filename, footer_lines=()):
+        return FileResponse(
+            self.write(rows, footer_lines),
+            as_attachment=True,
+            filename=filename,
+            content_type=self.CONTENT_TYPE,
+        )
+
+
+class StreamingTableReader:
+    """
+    Constant-memory reader for .xlsx and .csv tables.
+
+    The first row holds the column names. ``rows()`` yields (row_number, {column: value})
+    for every non-empty row, ``row_number`` being the line in the source file so errors can
+    point back at it. Workbooks are opened read-only and only their first sheet is read;
+    CSV files may be comma or semicolon separated.
+    """
+
+    EXTENSIONS = ('.xlsx', '.csv')
+
+    def __init__(self, path):
+        self.path = path
+        self.extension = os.path.splitext(path)[1].lower()
+        if self.extension not in self.EXTENSIONS:
+            raise ValueError(f"Unsupported file type '{self.extension}', expected one of {', '.join(self.EXTENSIONS)}")
+
+    def rows(self):
+        columns = None
+        source = self._xlsx_values() if self.extension == '.xlsx' else self._csv_values()
+        for row_number, values in enumerate(source, 1):
+            values = [value.strip() if isinstance(value, str) else value for value in values]
+            if columns is None:
+                columns = [str(value).lower() if value is not None else '' for value in values]
+                continue
+            if all(value in (None, '') for value in values):
+                continue
+            yield row_number, {column: value for column, value in zip(columns, values) if column}
+
+    def _xlsx_values(self):
+        wb = load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            yield from wb.worksheets[0].iter_rows(values_only=True)
+        finally:
+            wb.close()
+
+    def _csv_values(self):
+        with open(self.path, newline='', encoding='utf-8-sig') as f:
+            first_line = f.readline()
+            f.seek(0)
+            delimiter = ';' if first_line.count(';') > first_line.count(',') else ','
+            yield from csv.reader(f, delimiter=delimiter)
+
+
 class ExcelExportService:
     @staticmethod
     def export_salespeople(queryset, start_date, end_date):
         """Export salesperson data to Excel format"""
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Sotuvchilar Hisoboti"
-
-        # Headers
-        headers = [
-            "№", "To'liq Ism", "Foydalanuvchi Nomi", "Telefon", 
-            "Sotuvlar Soni", "Jami Sotuv (UZS)", "Jami Sotuv (USD)",
-            "Holat", "Yaratilgan Sana"
-        ]
-        
-        # Write headers with styling
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-
-        # Write data
-        for row_idx, salesperson in enumerate(queryset, 2):
-            row_data = [
-                row_idx - 1,  # Row number
-                salesperson.user.get_full_name() or "N/A",
-                salesperson.user.username,
-                salesperson.phone_number or "N/A",
-                salesperson.total_sales_count or 0,
-                float(salesperson.total_sales_uzs or 0),
-                float(salesperson.total_sales_usd or 0),
-                "Faol" if salesperson.is_active else "Faol emas",
-                salesperson.created_at.strftime('%d.%m.%Y %H:%M') if salesperson.created_at else "N/A"
-            ]
-            
-            for col, value in enumerate(row_data, 1):
-                ws.cell(row=row_idx, column=col, value=value)
-
-        # Auto-adjust column widths
-        for col in range(1, len(headers) + 1):
-            column_letter = get_column_letter(col)
-            max_length = max(
-                len(str(ws.cell(row=1, column=col).value)),
-                max(len(str(ws.cell(row=row, column=col).value or "")) for row in range(2, ws.max_row + 1)) if ws.max_row > 1 else 0
-            )
-            ws.column_dimensions[column_letter].width = min(max_length + 2, 50)
-
-        # Add filter information
-        filter_info = f"Filtrlash davri: {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}"
-        ws.cell(row=ws.max_row + 2, column=1, value=filter_info)
+        row_numbers = count(1)
+        export = StreamingExcelExport("Sotuvchilar Hisoboti", [
+            ("№", lambda sp: next(row_numbers)),
+            ("To'liq Ism", lambda sp: sp.user.get_full_name() or "N/A"),
+            ("Foydalanuvchi Nomi", lambda sp: sp.user.username),
+            ("Telefon", lambda sp: sp.phone_number or "N/A"),
+            ("Sotuvlar Soni", lambda sp: sp.total_sales_count or 0),
+            ("Jami Sotuv (UZS)", lambda sp: float(sp.total_sales_uzs or 0)),
+            ("Jami Sotuv (USD)", lambda sp: float(sp.total_sales_usd or 0)),
+            ("Holat", lambda sp: "Faol" if sp.is_active else "Faol emas"),
+            ("Yaratilgan Sana", lambda sp: sp.created_at.strftime('%d.%m.%Y %H:%M') if sp.created_at else "N/A"),
+        ])
 
-        # Create response
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        filter_info = f"Filtrlash davri: {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}"
+        return export.response(
+            queryset.iterator(chunk_size=500),
+            f'sotuvchilar_hisoboti_{timezone.now().strftime("%Y%m%d_%H%M")}.xlsx',
+            footer_lines=[filter_info],
         )
-        response['Content-Disposition'] = f'attachment; filename="sotuvchilar_hisoboti_{timezone.now().strftime("%Y%m%d_%H%M")}.xlsx"'
-        
-        wb.save(response)
-        return response 
\ No newline at end of file
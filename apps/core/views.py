@@ -1,3 +1,6 @@
+import json
+from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
@@ -6,21 +9,24 @@ from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views import View
 from django.views.generic import ListView
 from django.urls import reverse_lazy
-from django.db.models import Q, Count, Sum, Case, When, Value, DecimalField
+from django.db.models import Q, Count, Sum, Value
 from django.utils import timezone
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
 from django.db import transaction
 from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_http_methods
 from .forms import LoginForm, SalespersonForm
 from .models import Salesperson
-from apps.sales.models import Sale
-from .services import DateFilterService
+from apps.sales.models import Sale, SalesDailyRollup
+from .services import CacheVersionService, DateFilterService
 from .dashboard_service import DashboardService
 from .utils import ExcelExportService
 from apps.accounting.models import FinancialAccount, Transfer
 from apps.accounting.forms import TransferForm, DepositForm
+from apps.accounting.services import PostingBatchService
 
 
 class LoginView(View):
@@ -68,58 +74,7 @@ class SalespersonListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
             self.sales_start_date = start_date
             self.sales_end_date = end_date
             
-            queryset = queryset.annotate(
-                total_sales_count=Count(
-                    'sales_made',
-                    filter=Q(sales_made__sale_date__date__range=[start_date, end_date])
-                ),
-                total_sales_uzs=Sum(
-                    Case(
-                        When(
-                            sales_made__sale_date__date__range=[start_date, end_date],
-                            sales_made__sale_currency='UZS',
-                            then='sales_made__total_sale_amount'
-                        ),
-                        default=Value(0),
-                        output_field=DecimalField()
-                    )
-                ),
-                total_sales_usd=Sum(
-                    Case(
-                        When(
-                            sales_made__sale_date__date__range=[start_date, end_date],
-                            sales_made__sale_currency='USD',
-                            then='sales_made__total_sale_amount'
-                        ),
-                        default=Value(0),
-                        output_field=DecimalField()
-                    )
-                ),
-                total_commission_uzs=Sum(
-                    Case(
-                        When(
-                            acquisitions_made__commissions__commission_date__date__range=[start_date, end_date],
-                            acquisitions_made__commissions__currency='UZS',
-                            then='acquisitions_made__commissions__amount'
-                        ),
-                        default=Value(0),
-                        output_field=DecimalField()
-                    ),
-                    distinct=True
-                ),
-                total_commission_usd=Sum(
-                    Case(
-                        When(
-                            acquisitions_made__commissions__commission_date__date__range=[start_date, end_date],
-                            acquisitions_made__commissions__currency='USD',
-                            then='acquisitions_made__commissions__amount'
-                        ),
-                        default=Value(0),
-                        output_field=DecimalField()
-                    ),
-                    distinct=True
-                )
-            )
+            queryset = queryset.annotate(**SalesDailyRollup.totals_for_salespeople(start_date, end_date))
         except ValueError:
             today = timezone.localdate()
             self.sales_start_date = self.sales_end_date = today
@@ -147,24 +102,15 @@ class SalespersonListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
         )
         context.update(filter_context)
 
-        filtered_queryset = self.get_queryset()
-        
-        total_sales_uzs = sum(sp.total_sales_uzs or 0 for sp in filtered_queryset)
-        total_sales_usd = sum(sp.total_sales_usd or 0 for sp in filtered_queryset)
-        total_sales_count = sum(sp.total_sales_count or 0 for sp in filtered_queryset)
-        total_commission_uzs = sum(sp.total_commission_uzs or 0 for sp in filtered_queryset)
-        total_commission_usd = sum(sp.total_commission_usd or 0 for sp in filtered_queryset)
-        
-        context['stats'] = {
-            'total_salespeople': filtered_queryset.count(),
-            'active_salespeople': filtered_queryset.filter(is_active=True).count(),
-            'inactive_salespeople': filtered_queryset.filter(is_active=False).count(),
-            'total_sales_uzs': total_sales_uzs,
-            'total_sales_usd': total_sales_usd,
-            'total_sales_count': total_sales_count,
-            'total_commission_uzs': total_commission_uzs,
-            'total_commission_usd': total_commission_usd,
-        }
+        # Stats and the table fragment are reused until a salesperson or the sales rollup changes
+        salespeople_cache_version = CacheVersionService.get(CacheVersionService.SALESPEOPLE)
+        context['stats'] = cache.get_or_set(
+            f'salesperson_stats:{salespeople_cache_version}:{self.sales_start_date}:{self.sales_end_date}',
+            self.get_stats,
+            settings.FRAGMENT_CACHE_TIMEOUT,
+        )
+        context['salespeople_cache_version'] = salespeople_cache_version
+        context['fragment_cache_timeout'] = settings.FRAGMENT_CACHE_TIMEOUT
         
         context['sales_date_range'] = f"{self.sales_start_date.strftime('%d.%m.%Y')} - {self.sales_end_date.strftime('%d.%m.%Y')}"
         
@@ -175,6 +121,27 @@ class SalespersonListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
         
         return context
 
+    def get_stats(self):
+        salespeople = Salesperson.objects.aggregate(
+            total=Count('id'),
+            active=Count('id', filter=Q(is_active=True)),
+        )
+        rollup_totals = SalesDailyRollup.objects.filter(
+            salesperson__isnull=False, date__range=(self.sales_start_date, self.sales_end_date)
+        ).aggregate(
+            total_sales_count=Sum('sale_count'),
+            total_sales_uzs=Sum('amount', filter=Q(currency='UZS')),
+            total_sales_usd=Sum('amount', filter=Q(currency='USD')),
+            total_commission_uzs=Sum('commission', filter=Q(currency='UZS')),
+            total_commission_usd=Sum('commission', filter=Q(currency='USD')),
+        )
+        return {
+            'total_salespeople': salespeople['total'],
+            'active_salespeople': salespeople['active'],
+            'inactive_salespeople': salespeople['total'] - salespeople['active'],
+            **{key: value or 0 for key, value in rollup_totals.items()},
+        }
+
     def post(self, request, *args, **kwargs):
         form = SalespersonForm(request.POST)
         if form.is_valid():
@@ -223,22 +190,46 @@ def dashboard_view(request):
     transactions_per_page = 10
     
     if selected_account:
-        all_transactions = DashboardService.get_account_transactions(selected_account)
+        ledger_entries = DashboardService.get_account_transactions(selected_account)
     else:
-        all_transactions = DashboardService.get_recent_all_transactions()
+        ledger_entries = DashboardService.get_recent_all_transactions()
     
-    transactions_paginator = Paginator(all_transactions, transactions_per_page)
-    transactions_page_obj = transactions_paginator.get_page(transactions_page)
-    transactions = transactions_page_obj.object_list
+    # Cursor mode (?before=<timestamp>,<source>,<id>) avoids COUNT/OFFSET on deep pages;
+    # the page-number paginator stays as the default, and its "older" link switches to the cursor
+    transactions_paginator = None
+    transactions_page_obj = None
+    cursor = DashboardService.parse_cursor(request.GET.get('before'))
+    if cursor:
+        page_entries, transactions_next_cursor = DashboardService.get_transactions_before(
+            ledger_entries, cursor, transactions_per_page
+        )
+    else:
+        transactions_paginator = Paginator(ledger_entries, transactions_per_page)
+        transactions_page_obj = transactions_paginator.get_page(transactions_page)
+        page_entries = list(transactions_page_obj.object_list)
+        transactions_next_cursor = (
+            DashboardService.make_cursor(page_entries[-1]) if transactions_page_obj.has_next() else None
+        )
+    transactions = DashboardService.format_ledger_entries(page_entries)
     
-    stats = DashboardService.calculate_account_statistics(accounts)
+    # Account list, balances and stats are reused until a balance or account changes
+    accounts_cache_version = CacheVersionService.get(CacheVersionService.ACCOUNTS)
+    stats = cache.get_or_set(
+        f'dashboard_stats:{accounts_cache_version}',
+        lambda: DashboardService.calculate_account_statistics(accounts),
+        settings.FRAGMENT_CACHE_TIMEOUT,
+    )
     
     context = {
         'accounts': accounts,
+        'accounts_cache_version': accounts_cache_version,
+        'fragment_cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
         'selected_account': selected_account,
         'transactions': transactions,
         'transactions_paginator': transactions_paginator,
         'transactions_page_obj': transactions_page_obj,
+        'transactions_cursor_mode': cursor is not None,
+        'transactions_next_cursor': transactions_next_cursor,
         'stats': stats,
         'page_title': 'Boshqaruv Paneli'
     }
@@ -271,58 +262,7 @@ def salesperson_export_excel(request):
             today = timezone.localdate()
             start_date_obj = end_date_obj = today
         
-        queryset = queryset.annotate(
-            total_sales_count=Count(
-                'sales_made',
-                filter=Q(sales_made__sale_date__date__range=[start_date_obj, end_date_obj])
-            ),
-            total_sales_uzs=Sum(
-                Case(
-                    When(
-                        sales_made__sale_date__date__range=[start_date_obj, end_date_obj],
-                        sales_made__sale_currency='UZS',
-                        then='sales_made__total_sale_amount'
-                    ),
-                    default=Value(0),
-                    output_field=DecimalField()
-                )
-            ),
-            total_sales_usd=Sum(
-                Case(
-                    When(
-                        sales_made__sale_date__date__range=[start_date_obj, end_date_obj],
-                        sales_made__sale_currency='USD',
-                        then='sales_made__total_sale_amount'
-                    ),
-                    default=Value(0),
-                    output_field=DecimalField()
-                )
-            ),
-            total_commission_uzs=Sum(
-                Case(
-                    When(
-                        acquisitions_made__commissions__commission_date__date__range=[start_date_obj, end_date_obj],
-                        acquisitions_made__commissions__currency='UZS',
-                        then='acquisitions_made__commissions__amount'
-                    ),
-                    default=Value(0),
-                    output_field=DecimalField()
-                ),
-                distinct=True
-            ),
-            total_commission_usd=Sum(
-                Case(
-                    When(
-                        acquisitions_made__commissions__commission_date__date__range=[start_date_obj, end_date_obj],
-                        acquisitions_made__commissions__currency='USD',
-                        then='acquisitions_made__commissions__amount'
-                    ),
-                    default=Value(0),
-                    output_field=DecimalField()
-                ),
-                distinct=True
-            )
-        )
+        queryset = queryset.annotate(**SalesDailyRollup.totals_for_salespeople(start_date_obj, end_date_obj))
 
         return ExcelExportService.export_salespeople(queryset, start_date_obj, end_date_obj)
         
@@ -425,10 +365,10 @@ class SalespersonDetailView(LoginRequiredMixin, UserPassesTestMixin, ListView):
                 self.request.GET.get('start_date'),
                 self.request.GET.get('end_date')
             )
-            queryset = queryset.filter(sale_date__date__range=[start_date, end_date])
+            queryset = DateFilterService.filter_queryset(queryset, 'sale_date', start_date, end_date)
         except ValueError:
             today = timezone.localdate()
-            queryset = queryset.filter(sale_date__date=today)
+            queryset = DateFilterService.filter_queryset(queryset, 'sale_date', today, today)
         
         return queryset
 
@@ -444,15 +384,16 @@ class SalespersonDetailView(LoginRequiredMixin, UserPassesTestMixin, ListView):
         )
         context.update(filter_context)
         
-        filtered_sales = self.get_queryset()
-        context['stats'] = {
-            'total_sales': filtered_sales.count(),
-            'total_quantity': sum(sale.quantity for sale in filtered_sales),
-            'total_amount_uzs': sum(sale.total_sale_amount for sale in filtered_sales if sale.sale_currency == 'UZS'),
-            'total_amount_usd': sum(sale.total_sale_amount for sale in filtered_sales if sale.sale_currency == 'USD'),
-            'total_profit_uzs': sum(sale.profit for sale in filtered_sales if sale.sale_currency == 'UZS'),
-            'total_profit_usd': sum(sale.profit for sale in filtered_sales if sale.sale_currency == 'USD'),
-        }
+        # Reuse the list's queryset; the stats are a single aggregate, no Sale rows are loaded
+        stats = self.object_list.order_by().aggregate(
+            total_sales=Count('id'),
+            total_quantity=Sum('quantity'),
+            total_amount_uzs=Sum('total_sale_amount', filter=Q(sale_currency='UZS')),
+            total_amount_usd=Sum('total_sale_amount', filter=Q(sale_currency='USD')),
+            total_profit_uzs=Sum('profit', filter=Q(sale_currency='UZS')),
+            total_profit_usd=Sum('profit', filter=Q(sale_currency='USD')),
+        )
+        context['stats'] = {key: value or 0 for key, value in stats.items()}
         
         query_params = self.request.GET.copy()
         if 'page' in query_params:
@@ -505,7 +446,16 @@ def transfer_money(request):
         }, status=500)
 
 
+def transfer_form_etag(request):
+    # Non-admins get no ETag, so they always reach the permission check
+    if request.user.is_superuser:
+        return CacheVersionService.etag(CacheVersionService.ACCOUNTS)
+    return None
+
+
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=transfer_form_etag)
 def get_transfer_form(request):
     if not request.user.is_superuser:
         return JsonResponse({'error': 'Bu funktsiyaga faqat administratorlar kirish huquqiga ega.'}, status=403)
@@ -558,3 +508,38 @@ def deposit_money(request):
             return JsonResponse({'success': False, 'errors': errors}, status=400)
     except Exception as e:
         return JsonResponse({'success': False, 'error': f'Kutilmagan xatolik: {str(e)}'}, status=500)
+
+
+@require_http_methods(["POST"])
+@login_required
+def post_batch(request):
+    """
+    Post many transfers and deposits at once, all or nothing.
+    Body: {"operations": [{"type": "transfer"|"deposit", <form fields>}, ...]}
+    """
+    if not request.user.is_superuser:
+        return JsonResponse({'success': False, 'error': 'Bu funktsiyaga faqat administratorlar kirish huquqiga ega.'}, status=403)
+
+    try:
+        operations = json.loads(request.body).get('operations')
+    except (ValueError, AttributeError):
+        return JsonResponse({'success': False, 'error': "So'rov JSON formatida bo'lishi kerak"}, status=400)
+    if not isinstance(operations, list):
+        return JsonResponse({'success': False, 'error': "'operations' ro'yxat bo'lishi kerak"}, status=400)
+
+    try:
+        transfers, deposits = PostingBatchService.post(operations)
+    except ValidationError as error:
+        if hasattr(error, 'error_dict'):
+            errors = [{'index': index, 'errors': messages} for index, messages in sorted(error.message_dict.items())]
+            return JsonResponse({'success': False, 'errors': errors}, status=400)
+        return JsonResponse({'success': False, 'error': ' '.join(error.messages)}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'Kutilmagan xatolik: {str(e)}'}, status=500)
+
+    return JsonResponse({
+        'success': True,
+        'message': f"{len(transfers)} ta transfer va {len(deposits)} ta kirim saqlandi.",
+        'transfer_ids': [transfer.pk for transfer in transfers],
+        'deposit_ids': [deposit.pk for deposit in deposits],
+    })
@@ -1,6 +1,7 @@
 from django import forms
 from .models import Acquisition, Ticket
 from apps.core.models import Salesperson
+from apps.core.forms import ImportFormMixin, ReferenceChoiceField
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
@@ -49,6 +50,7 @@ class AcquisitionForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         self.current_user = kwargs.pop('current_user', None)
         super().__init__(*args, **kwargs)
+        self.fields['supplier'] = ReferenceChoiceField.replacing(self.fields['supplier'], 'suppliers')
         # Set current datetime as default for both acquisition and ticket departure
         current_time = timezone.now().strftime('%Y-%m-%dT%H:%M')
         self.fields['acquisition_date'].initial = current_time
@@ -67,4 +69,8 @@ class AcquisitionForm(forms.ModelForm):
                 if not self.current_user.is_superuser:
                     raise ValidationError("Faqat sotuvchilar xarid amalga oshira oladi.")
         
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+
+
+class AcquisitionImportForm(ImportFormMixin, AcquisitionForm):
+    """AcquisitionForm for one row of an AcquisitionImportService chunk"""
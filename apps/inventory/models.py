@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Collate
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from apps.core.constants import CurrencyChoices
@@ -19,6 +21,12 @@ class Ticket(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Case-insensitive prefix search (typeahead); SQLite's LIKE only uses a NOCASE index
+            models.Index(Collate('description', 'NOCASE'), name='ticket_description_nocase_idx'),
+        ]
+
     def __str__(self):
         return f"{self.get_ticket_type_display()} - {self.description}"
 
@@ -62,6 +70,20 @@ class Acquisition(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['supplier', 'acquisition_date'], name='acq_supplier_date_idx'),
+            models.Index(fields=['supplier', 'currency', 'acquisition_date'], name='acq_supplier_cur_date_idx'),
+            models.Index(fields=['salesperson', 'acquisition_date'], name='acq_salesperson_date_idx'),
+            # Acquisitions that can still be sold from
+            models.Index(
+                fields=['salesperson', 'acquisition_date'],
+                condition=Q(is_active=True, available_quantity__gt=0),
+                name='acq_active_stock_idx',
+            ),
+            models.Index(fields=['updated_at'], name='acq_updated_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         # Calculate total amount
         self.total_amount = self.unit_price * self.initial_quantity
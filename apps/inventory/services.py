@@ -1,8 +1,11 @@
 from django.db import transaction
 from django.core.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
+from apps.contacts.models import ContactBalanceCheckpoint
+from apps.core.services import BulkImportService, CacheVersionService
+from apps.sales.models import SalesDailyRollup
 from .models import Acquisition, Ticket
-from .forms import AcquisitionForm
+from .forms import AcquisitionImportForm
 
 
 class AcquisitionService:
@@ -62,6 +65,9 @@ class AcquisitionService:
     def update_acquisition(original_acquisition, form):
         """Update acquisition with complete business logic handling"""
         with transaction.atomic():
+            # The bound form has already set its values on original_acquisition; the rollup keys need the stored ones
+            stored_acquisition = Acquisition.objects.get(pk=original_acquisition.pk)
+
             # Store original values
             original_supplier = original_acquisition.supplier
             original_total_amount = original_acquisition.total_amount
@@ -97,6 +103,13 @@ class AcquisitionService:
             updated_acquisition.available_quantity = original_acquisition.available_quantity + quantity_diff
             
             updated_acquisition.save()
+
+            # Sales and returns are rolled up under the acquisition's supplier, commissions under its salesperson
+            if (stored_acquisition.supplier_id, stored_acquisition.salesperson_id) != (
+                updated_acquisition.supplier_id, updated_acquisition.salesperson_id
+            ):
+                SalesDailyRollup.record_acquisition(stored_acquisition, sign=-1)
+                SalesDailyRollup.record_acquisition(updated_acquisition)
             
             # Handle supplier debt changes
             AcquisitionService._handle_supplier_changes(
@@ -130,4 +143,56 @@ class AcquisitionService:
             else:
                 # Currency changed - remove old debt, add new debt
                 original_supplier.reduce_debt(original_total_amount, original_currency)
-                original_supplier.add_debt(new_total_amount, new_currency) 
\ No newline at end of file
+                original_supplier.add_debt(new_total_amount, new_currency)
+
+
+class AcquisitionImportService(BulkImportService):
+    """
+    Bulk import of acquisitions, one per row, with the AcquisitionForm columns:
+    supplier (id), acquisition_date, ticket_type, ticket_description,
+    ticket_departure_date_time, ticket_arrival_date_time, initial_quantity,
+    unit_price, currency, notes.
+    """
+
+    def build_form(self, data):
+        return AcquisitionImportForm(data, current_user=self.user, preloaded=self.objects)
+
+    def build_records(self, form):
+        ticket = Ticket(
+            ticket_type=form.cleaned_data['ticket_type'],
+            description=form.cleaned_data['ticket_description'],
+            departure_date_time=form.cleaned_data['ticket_departure_date_time'],
+            arrival_date_time=form.cleaned_data.get('ticket_arrival_date_time')
+        )
+        acquisition = form.save(commit=False)
+        acquisition.salesperson = form.cleaned_data.get('salesperson')
+        # What Acquisition.save() would set; bulk_create skips it
+        acquisition.available_quantity = acquisition.initial_quantity
+        acquisition.total_amount = acquisition.unit_price * acquisition.initial_quantity
+        return ticket, acquisition
+
+    def write(self, records):
+        tickets = self.insert(Ticket, [ticket for ticket, _ in records])
+        acquisitions = []
+        for ticket, (_, acquisition) in zip(tickets, records):
+            acquisition.ticket = ticket
+            acquisitions.append(acquisition)
+        self.insert(Acquisition, acquisitions)
+
+        # One debt change per supplier and currency
+        suppliers = {}
+        debts = {}
+        earliest = {}
+        for acquisition in acquisitions:
+            supplier_id = acquisition.supplier_id
+            suppliers[supplier_id] = acquisition.supplier
+            key = (supplier_id, acquisition.currency)
+            debts[key] = debts.get(key, 0) + acquisition.total_amount
+            earliest[supplier_id] = min(earliest.get(supplier_id, acquisition.acquisition_date), acquisition.acquisition_date)
+        for (supplier_id, currency), amount in debts.items():
+            suppliers[supplier_id].add_debt(amount, currency)
+
+        # bulk_create sends no post_save, so do what the signal handlers would
+        for supplier_id, acquisition_date in earliest.items():
+            ContactBalanceCheckpoint.invalidate('supplier', supplier_id, acquisition_date)
+        CacheVersionService.bump_on_commit(CacheVersionService.ACQUISITIONS)
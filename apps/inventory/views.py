@@ -3,12 +3,13 @@ from django.urls import reverse_lazy
 from django.views.generic import ListView
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from .models import Acquisition
 from .forms import AcquisitionForm
 from .services import AcquisitionService
-from apps.core.services import DateFilterService
+from apps.core.services import CacheVersionService, DateFilterService, ReferenceDataService
 from apps.core.models import Salesperson
-from apps.contacts.models import Supplier
 from django.utils import timezone
 
 
@@ -80,11 +81,11 @@ class AcquisitionListView(ListView):
                 start_date,
                 end_date
             )
-            queryset = queryset.filter(acquisition_date__date__range=[start_date_obj, end_date_obj])
+            queryset = DateFilterService.filter_queryset(queryset, 'acquisition_date', start_date_obj, end_date_obj)
         except ValueError:
             # Fall back to today's data on error
             today = timezone.localdate()
-            queryset = queryset.filter(acquisition_date__date=today)
+            queryset = DateFilterService.filter_queryset(queryset, 'acquisition_date', today, today)
         
         return queryset
 
@@ -94,15 +95,9 @@ class AcquisitionListView(ListView):
         
         # Add filter options for admin users
         if self.request.user.is_superuser:
-            # Get salespeople for dropdown (optimized query)
-            context['salespeople'] = Salesperson.objects.select_related('user').filter(
-                is_active=True
-            ).order_by('user__first_name', 'user__last_name')
-            
-            # Get suppliers for dropdown (optimized query)
-            context['suppliers'] = Supplier.objects.filter(
-                is_active=True
-            ).order_by('name')
+            # Dropdown options from the reference data cache
+            context['salespeople'] = ReferenceDataService.get('active_salespeople')
+            context['suppliers'] = ReferenceDataService.get('active_suppliers')
             
             # Add current filter values
             context['current_salesperson_filter'] = self.request.GET.get('salesperson', '')
@@ -137,7 +132,26 @@ class AcquisitionListView(ListView):
 
 
 
+def acquisitions_scope(user):
+    """Salesperson whose acquisitions the user sees; 'all' for superusers without a profile, None for nobody"""
+    try:
+        return user.salesperson_profile
+    except Salesperson.DoesNotExist:
+        return 'all' if user.is_superuser else None
+
+
+def acquisitions_list_etag(request):
+    scope = acquisitions_scope(request.user)
+    # Labels include the supplier name, which is covered by the reference data version
+    return CacheVersionService.etag(
+        CacheVersionService.ACQUISITIONS, ReferenceDataService.VERSION,
+        scope=getattr(scope, 'pk', scope),
+    )
+
+
 @login_required(login_url='/core/login/')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=acquisitions_list_etag)
 def api_acquisitions_list(request):
     """API endpoint to get list of available acquisitions for dropdowns - optimized queries"""
     queryset = Acquisition.objects.filter(
@@ -148,13 +162,11 @@ def api_acquisitions_list(request):
     )
     
     # Filter by current salesperson - only show acquisitions made by this salesperson
-    try:
-        current_salesperson = request.user.salesperson_profile
-        queryset = queryset.filter(salesperson=current_salesperson)
-    except Salesperson.DoesNotExist:
-        # If user is not a salesperson but is superuser, show all acquisitions
-        if not request.user.is_superuser:
-            queryset = queryset.none()
+    scope = acquisitions_scope(request.user)
+    if scope is None:
+        queryset = queryset.none()
+    elif scope != 'all':
+        queryset = queryset.filter(salesperson=scope)
     
     acquisitions = queryset.values(
         'id', 'ticket__description', 'available_quantity', 'currency', 
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.core.exceptions import ValidationError
 from django.contrib import messages
 from django.contrib.admin import actions
-from .models import Sale, TicketReturn
+from .models import Sale, TicketReturn, SalesDailyRollup
 from .services import SaleService
 import logging
 
@@ -23,6 +23,19 @@ class SaleAdmin(admin.ModelAdmin):
             'agent', 'related_acquisition__ticket', 'related_acquisition__supplier', 'salesperson'
         )
 
+    # An edit here can change the sale's salesperson, agent or date; move it and its returns to the new rollup key
+    def save_model(self, request, obj, form, change):
+        stored = Sale.objects.select_related('related_acquisition').get(pk=obj.pk) if change else None
+        super().save_model(request, obj, form, change)
+        sale_returns = list(obj.returns.all())
+        if stored:
+            SalesDailyRollup.record_sale(stored, sign=-1)
+            for sale_return in sale_returns:
+                SalesDailyRollup.record_return(sale_return, sign=-1, sale=stored)
+        SalesDailyRollup.record_sale(obj)
+        for sale_return in sale_returns:
+            SalesDailyRollup.record_return(sale_return, sale=obj)
+
 
 @admin.register(TicketReturn)
 class TicketReturnAdmin(admin.ModelAdmin):
@@ -1,38 +1,95 @@
 from django import forms
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from django.urls import reverse_lazy
+from django.db.models import F
 from .models import Sale, TicketReturn
 from apps.inventory.models import Acquisition
 from apps.accounting.models import FinancialAccount
-from apps.contacts.models import Agent
 from apps.core.models import Salesperson
+from apps.core.forms import ImportFormMixin, ReferenceChoiceField
 from decimal import Decimal
 
 
+def available_acquisitions(user=None):
+    """Acquisitions with stock left that ``user`` may sell from"""
+    queryset = Acquisition.objects.filter(
+        is_active=True, available_quantity__gt=0
+    ).select_related('ticket', 'supplier')
+    if user:
+        try:
+            # Filter by current salesperson - only show acquisitions made by this salesperson
+            queryset = queryset.filter(salesperson=user.salesperson_profile)
+        except Salesperson.DoesNotExist:
+            # If user is not a salesperson but is superuser, show all acquisitions
+            if not user.is_superuser:
+                queryset = queryset.none()
+    return queryset
+
+
+def returnable_sales():
+    """Sales that still have tickets left to return"""
+    return Sale.objects.filter(
+        quantity__gt=0, returned_quantity__lt=F('quantity')
+    ).select_related('agent', 'related_acquisition__ticket', 'related_acquisition__supplier')
+
+
+def acquisition_label(obj):
+    currency_symbol = "UZS" if obj.currency == 'UZS' else "$"
+    departure_date = obj.ticket.departure_date_time.strftime('%d.%m.%y %H:%M') if obj.ticket.departure_date_time else 'Noma\'lum'
+    ticket_type = obj.ticket.get_ticket_type_display()
+    
+    return (f"[{departure_date}] {ticket_type} - {obj.ticket.description[:40]} | "
+            f"Mavjud: {obj.available_quantity}/{obj.initial_quantity} | "
+            f"Narx: {obj.unit_price} {currency_symbol} | "
+            f"Ta'minotchi: {obj.supplier.name}")
+
+
+def sale_label(obj):
+    buyer = obj.agent.name if obj.agent else obj.client_full_name
+    return f"#{obj.id} - {obj.related_acquisition.ticket.description} - {buyer} ({obj.remaining_quantity} dona qolgan)"
+
+
+class AsyncSelect(forms.Select):
+    """
+    Select that renders only the chosen option. The rest are searched from ``search_url``
+    by sales/js/async_select.js, so the page never lists the whole table.
+    """
+
+    def __init__(self, search_url, attrs=None):
+        super().__init__(attrs)
+        self.search_url = search_url
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-search-url'] = str(self.search_url)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        choices = self.choices
+        queryset = getattr(choices, 'queryset', None)
+        if queryset is not None:
+            selected = [v for v in value if v not in (None, '')]
+            try:
+                objects = list(queryset.filter(pk__in=selected)) if selected else []
+            except (ValueError, TypeError, ValidationError):
+                objects = []
+            empty = [('', choices.field.empty_label)] if choices.field.empty_label is not None else []
+            self.choices = empty + [choices.choice(obj) for obj in objects]
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = choices
+
+
 class AcquisitionChoiceField(forms.ModelChoiceField):
     def label_from_instance(self, obj):
-        currency_symbol = "UZS" if obj.currency == 'UZS' else "$"
-        departure_date = obj.ticket.departure_date_time.strftime('%d.%m.%y %H:%M') if obj.ticket.departure_date_time else 'Noma\'lum'
-        ticket_type = obj.ticket.get_ticket_type_display()
-        
-        return (f"[{departure_date}] {ticket_type} - {obj.ticket.description[:40]} | "
-                f"Mavjud: {obj.available_quantity}/{obj.initial_quantity} | "
-                f"Narx: {obj.unit_price} {currency_symbol} | "
-                f"Ta'minotchi: {obj.supplier.name}")
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # Make the select field wider to accommodate more information
-        if 'widget' in kwargs:
-            kwargs['widget'].attrs.update({'style': 'min-width: 600px;'})
-        else:
-            self.widget.attrs.update({'style': 'min-width: 600px;'})
+        return acquisition_label(obj)
 
 
 class SaleChoiceField(forms.ModelChoiceField):
     def label_from_instance(self, obj):
-        buyer = obj.agent.name if obj.agent else obj.client_full_name
-        return f"#{obj.id} - {obj.related_acquisition.ticket.description} - {buyer} ({obj.remaining_quantity} dona qolgan)"
+        return sale_label(obj)
 
 
 class SaleForm(forms.ModelForm):
@@ -75,32 +132,24 @@ class SaleForm(forms.ModelForm):
         self.current_user = kwargs.pop('current_user', None)
         super().__init__(*args, **kwargs)
 
-        # Get base queryset for acquisitions
-        base_queryset = Acquisition.objects.filter(available_quantity__gt=0).select_related('ticket', 'supplier')
-        
-        # Filter by current salesperson - only show acquisitions made by this salesperson
-        if self.current_user:
-            try:
-                current_salesperson = self.current_user.salesperson_profile
-                base_queryset = base_queryset.filter(salesperson=current_salesperson)
-            except Salesperson.DoesNotExist:
-                # If user is not a salesperson but is superuser, show all acquisitions
-                if not self.current_user.is_superuser:
-                    base_queryset = base_queryset.none()
-
-        # Custom acquisition field with better display
+        # Custom acquisition field; options are searched asynchronously, only the submitted pk is validated
         original_field = self.fields['related_acquisition']
         self.fields['related_acquisition'] = AcquisitionChoiceField(
-            queryset=base_queryset.order_by('-acquisition_date', '-created_at'),
+            queryset=available_acquisitions(self.current_user).order_by('-acquisition_date', '-created_at'),
             label=original_field.label,
             help_text=original_field.help_text,
             required=original_field.required,
-            widget=forms.Select(attrs={'class': 'form-select form-select-sm', 'style': 'min-width: 600px;'})
+            widget=AsyncSelect(
+                reverse_lazy('sales:api-acquisition-search'),
+                attrs={'class': 'form-select form-select-sm', 'style': 'min-width: 600px;'}
+            )
         )
         
         # Set up other fields
-        self.fields['agent'].queryset = Agent.objects.all().order_by('name')
-        self.fields['paid_to_account'].queryset = FinancialAccount.objects.filter(is_active=True).order_by('name')
+        self.fields['agent'] = ReferenceChoiceField.replacing(self.fields['agent'], 'agents')
+        self.fields['paid_to_account'] = ReferenceChoiceField.replacing(
+            self.fields['paid_to_account'], 'active_accounts', FinancialAccount.objects.filter(is_active=True)
+        )
         self.fields['paid_to_account'].required = False
         self.fields['client_full_name'].required = False
         self.fields['client_id_number'].required = False
@@ -182,6 +231,10 @@ class SaleForm(forms.ModelForm):
         return cleaned_data 
 
 
+class SaleImportForm(ImportFormMixin, SaleForm):
+    """SaleForm for one row of a SaleImportService chunk"""
+
+
 class TicketReturnForm(forms.ModelForm):
     # Override fine_paid_to_account field to be completely optional
     fine_paid_to_account = forms.ModelChoiceField(
@@ -212,13 +265,11 @@ class TicketReturnForm(forms.ModelForm):
         # Use custom choice field for better display
         original_field = self.fields['original_sale']
         self.fields['original_sale'] = SaleChoiceField(
-            queryset=Sale.objects.filter(
-                quantity__gt=0
-            ).select_related('agent', 'related_acquisition__ticket', 'related_acquisition__supplier').order_by('-sale_date'),
+            queryset=returnable_sales().order_by('-sale_date'),
             label=original_field.label,
             help_text=original_field.help_text,
             required=original_field.required,
-            widget=forms.Select(attrs={'class': 'form-control'})
+            widget=AsyncSelect(reverse_lazy('sales:api-sale-search'), attrs={'class': 'form-control'})
         )
         
         # Set initial values for fine amounts
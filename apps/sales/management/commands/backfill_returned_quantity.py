@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from apps.sales.models import Sale, TicketReturn
+
+
+class Command(BaseCommand):
+    help = "Populate Sale.returned_quantity from existing ticket returns."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report sales whose stored value is out of date')
+
+    def handle(self, *args, **options):
+        returned = TicketReturn.objects.filter(
+            original_sale=OuterRef('pk')
+        ).order_by().values('original_sale').annotate(total=Sum('quantity_returned')).values('total')
+        actual = Coalesce(Subquery(returned, output_field=IntegerField()), Value(0))
+
+        stale = Sale.objects.annotate(actual_returned=actual).exclude(returned_quantity=F('actual_returned'))
+        stale_count = stale.count()
+        if options['dry_run']:
+            for sale in stale.values('id', 'returned_quantity', 'actual_returned')[:50]:
+                self.stdout.write(f"Sale #{sale['id']}: stored {sale['returned_quantity']}, actual {sale['actual_returned']}")
+            self.stdout.write(self.style.WARNING(f"Out of date: {stale_count} sales (dry run, nothing changed)"))
+            return
+
+        with transaction.atomic():
+            updated = Sale.objects.filter(pk__in=stale.values('pk')).update(returned_quantity=actual)
+
+        self.stdout.write(self.style.SUCCESS(f"Returned quantities backfilled. Updated: {updated} sales"))
@@ -62,48 +62,31 @@ class Command(BaseCommand):
             self.stdout.write(f"\n--- Processing Agent: {agent.name} (ID: {agent.pk}) ---")
             
             # Get all returns for this agent
-            returns = TicketReturn.objects.filter(
-                original_sale__agent=agent
-            ).select_related('original_sale__related_acquisition')
+            returns = TicketReturn.objects.filter(original_sale__agent=agent)
+            return_count = returns.count()
             
-            if not returns.exists():
+            if not return_count:
                 self.stdout.write("No returns found for this agent")
                 continue
             
-            self.stdout.write(f"Found {returns.count()} returns to process")
+            self.stdout.write(f"Found {return_count} returns to process")
             
-            # Calculate adjustment needed
-            uzs_adjustment = 0
-            usd_adjustment = 0
-            
-            for return_instance in returns:
-                sale = return_instance.original_sale
-                acquisition = sale.related_acquisition
-                
-                # What we incorrectly calculated (using sale amount)
-                old_returned_amount = return_instance.returned_sale_amount
-                old_currency = sale.sale_currency
-                
-                # What we should have calculated (using acquisition amount)
-                new_returned_amount = return_instance.returned_acquisition_amount
-                new_currency = acquisition.currency
-                
-                # Calculate the difference
-                difference = old_returned_amount - new_returned_amount
-                
+            # Old logic reduced debt by the sale amount, the correct one uses the
+            # acquisition amount; both are summed per currency in one query.
+            # Sale currency always equals the acquisition currency.
+            totals = returns.totals_by_currency()
+            old_amounts = totals['returned_sale_amount']
+            new_amounts = totals['returned_acquisition_amount']
+            for currency in ('UZS', 'USD'):
                 self.stdout.write(
-                    f"  Return #{return_instance.pk}: "
-                    f"Old: {old_returned_amount} {old_currency}, "
-                    f"New: {new_returned_amount} {new_currency}, "
-                    f"Difference: {difference}"
+                    f"  {currency}: Old: {old_amounts[currency]}, "
+                    f"New: {new_amounts[currency]}, "
+                    f"Difference: {old_amounts[currency] - new_amounts[currency]}"
                 )
-                
-                # Add the difference to adjustment
-                # We need to add back the difference because we over-reduced the debt
-                if new_currency == 'UZS':
-                    uzs_adjustment += difference
-                else:
-                    usd_adjustment += difference
+            
+            # We need to add back the difference because we over-reduced the debt
+            uzs_adjustment = old_amounts['UZS'] - new_amounts['UZS']
+            usd_adjustment = old_amounts['USD'] - new_amounts['USD']
             
             # Show current and new balances
             current_uzs = agent.balance_uzs
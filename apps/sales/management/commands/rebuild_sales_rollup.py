@@ -0,0 +1,85 @@
+from datetime import datetime
+from collections import defaultdict
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from apps.contacts.models import Commission
+from apps.core.services import CacheVersionService
+from apps.sales.models import Sale, TicketReturn, SalesDailyRollup
+
+
+class Command(BaseCommand):
+    help = "Recompute the SalesDailyRollup table from sales, returns and commissions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days from this date on (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("--since must be YYYY-MM-DD")
+
+        rows = defaultdict(lambda: dict.fromkeys(SalesDailyRollup.METRICS, 0))
+        day = lambda field: TruncDate(field, tzinfo=timezone.get_current_timezone())
+
+        sales = Sale.objects.annotate(day=day('sale_date')).values(
+            'day', 'salesperson_id', 'agent_id', 'related_acquisition__supplier_id', 'sale_currency'
+        ).annotate(
+            sale_count=Count('id'), quantity_sum=Sum('quantity'),
+            amount_sum=Sum('total_sale_amount'), profit_sum=Sum('profit'),
+        ).order_by()
+        returns = TicketReturn.objects.annotate(day=day('return_date')).values(
+            'day', 'original_sale__salesperson_id', 'original_sale__agent_id',
+            'original_sale__related_acquisition__supplier_id', 'original_sale__sale_currency'
+        ).annotate(
+            quantity_sum=Sum('quantity_returned'),
+            amount_sum=Sum(F('quantity_returned') * F('original_sale__unit_sale_price')),
+        ).order_by()
+        commissions = Commission.objects.annotate(day=day('commission_date')).values(
+            'day', 'acquisition__salesperson_id', 'supplier_id', 'currency'
+        ).annotate(amount_sum=Sum('amount')).order_by()
+
+        if since:
+            sales = sales.filter(day__gte=since)
+            returns = returns.filter(day__gte=since)
+            commissions = commissions.filter(day__gte=since)
+
+        for row in sales:
+            totals = rows[(row['day'], row['salesperson_id'], row['agent_id'],
+                           row['related_acquisition__supplier_id'], row['sale_currency'])]
+            totals.update(sale_count=row['sale_count'], quantity=row['quantity_sum'],
+                          amount=row['amount_sum'], profit=row['profit_sum'])
+        for row in returns:
+            totals = rows[(row['day'], row['original_sale__salesperson_id'], row['original_sale__agent_id'],
+                           row['original_sale__related_acquisition__supplier_id'], row['original_sale__sale_currency'])]
+            totals.update(returned_quantity=row['quantity_sum'], returned_amount=row['amount_sum'])
+        for row in commissions:
+            totals = rows[(row['day'], row['acquisition__salesperson_id'], None, row['supplier_id'], row['currency'])]
+            totals['commission'] += row['amount_sum']
+
+        with transaction.atomic():
+            existing = SalesDailyRollup.objects.all()
+            if since:
+                existing = existing.filter(date__gte=since)
+            deleted, _ = existing.delete()
+            SalesDailyRollup.objects.bulk_create(
+                [
+                    SalesDailyRollup(
+                        date=key[0], salesperson_id=key[1], agent_id=key[2],
+                        supplier_id=key[3], currency=key[4], **totals
+                    )
+                    for key, totals in rows.items()
+                ],
+                batch_size=options['batch_size'],
+            )
+            CacheVersionService.bump_on_commit(CacheVersionService.SALESPEOPLE)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sales rollup rebuilt. Removed: {deleted}, created: {len(rows)} rows"
+        ))
@@ -1,8 +1,13 @@
-from django.db import models
+from collections import defaultdict
+from datetime import datetime
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce, Collate
 from django.utils import timezone
 from apps.inventory.models import Acquisition
 from apps.accounting.models import FinancialAccount
 from apps.core.models import Salesperson
+from apps.core.services import CacheVersionService
 from decimal import Decimal
 from django.core.exceptions import ValidationError
 
@@ -73,6 +78,12 @@ class Sale(models.Model):
         help_text="Account that received the payment for direct sales to clients."
     )
 
+    returned_quantity = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Qaytarilgan chiptalar soni (TicketReturn yozuvlaridan yuritiladi)"
+    )
+
     notes = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -87,13 +98,6 @@ class Sale(models.Model):
             # For direct client sales, check if payment account is set
             return self.paid_to_account is not None
 
-    @property
-    def returned_quantity(self):
-        """Get total quantity returned for this sale"""
-        return self.returns.aggregate(
-            total=models.Sum('quantity_returned')
-        )['total'] or 0
-
     @property
     def remaining_quantity(self):
         """Get remaining quantity that can be returned"""
@@ -102,14 +106,35 @@ class Sale(models.Model):
     @property
     def has_returns(self):
         """Check if this sale has any returns"""
-        return self.returns.exists()
+        if 'returns' in getattr(self, '_prefetched_objects_cache', {}):
+            return bool(self._prefetched_objects_cache['returns'])
+        return self.returned_quantity > 0
+
+    def adjust_returned_quantity(self, delta):
+        """
+        Atomically move returned_quantity by ``delta``.
+        Refuses to return more than was sold, even under concurrent returns.
+        """
+        updated = Sale.objects.filter(
+            pk=self.pk,
+            returned_quantity__gte=max(-delta, 0),
+            returned_quantity__lte=models.F('quantity') - delta,
+        ).update(returned_quantity=models.F('returned_quantity') + delta)
+        if not updated:
+            raise ValidationError("Qaytarilgan miqdor sotilgan miqdordan oshib ketdi.")
+        self.refresh_from_db(fields=['returned_quantity'])
+
+    def ledger_details(self):
+        ticket = self.related_acquisition.ticket if self.related_acquisition_id else None
+        ticket_desc = ticket.get_ticket_type_display() if ticket else "Unknown Ticket"
+        return {'description': f"{ticket_desc} - {self.client_full_name or 'N/A'}"[:255]}
 
     def clean(self):
         """Basic model validation - detailed validation handled by forms"""
         super().clean()
         
         # Set sale currency from acquisition
-        if self.related_acquisition:
+        if self.related_acquisition_id:
             self.sale_currency = self.related_acquisition.currency
 
     def save(self, *args, **kwargs):
@@ -132,6 +157,81 @@ class Sale(models.Model):
         verbose_name = "Sale"
         verbose_name_plural = "Sales"
         ordering = ['-sale_date', '-created_at']
+        indexes = [
+            models.Index(fields=['-sale_date', '-created_at'], name='sale_date_idx'),
+            models.Index(fields=['agent', 'sale_date'], name='sale_agent_date_idx'),
+            models.Index(fields=['salesperson', 'sale_date'], name='sale_salesperson_date_idx'),
+            models.Index(fields=['related_acquisition', 'sale_date'], name='sale_acquisition_date_idx'),
+            # Direct client sales paid into an account
+            models.Index(
+                fields=['paid_to_account', 'sale_date'],
+                condition=Q(agent__isnull=True),
+                name='sale_direct_account_idx',
+            ),
+            models.Index(fields=['updated_at'], name='sale_updated_idx'),
+            # Case-insensitive prefix search on the client (return form typeahead)
+            models.Index(Collate('client_full_name', 'NOCASE'), name='sale_client_name_nocase_idx'),
+            models.Index(Collate('client_id_number', 'NOCASE'), name='sale_client_id_nocase_idx'),
+        ]
+
+
+class TicketReturnQuerySet(models.QuerySet):
+    """Return amounts as SQL expressions so they can be summed in the database"""
+
+    CURRENCIES = ('UZS', 'USD')
+
+    @staticmethod
+    def amount_expressions():
+        """
+        name -> (amount expression, currency field), mirroring the
+        TicketReturn properties of the same name.
+        """
+        money = models.DecimalField(max_digits=20, decimal_places=2)
+        quantity = models.F('quantity_returned')
+        return {
+            'returned_acquisition_amount': (
+                models.ExpressionWrapper(quantity * models.F('original_sale__related_acquisition__unit_price'), output_field=money),
+                'original_sale__related_acquisition__currency',
+            ),
+            'returned_sale_amount': (
+                models.ExpressionWrapper(quantity * models.F('original_sale__unit_sale_price'), output_field=money),
+                'original_sale__sale_currency',
+            ),
+            'total_fine_amount': (
+                models.ExpressionWrapper(quantity * models.F('fine_amount'), output_field=money),
+                'fine_currency',
+            ),
+            'total_supplier_fine_amount': (
+                models.ExpressionWrapper(quantity * models.F('supplier_fine_amount'), output_field=money),
+                'supplier_fine_currency',
+            ),
+        }
+
+    def with_amounts(self):
+        """Annotate each return with <property>_value columns computed in SQL"""
+        return self.annotate(**{
+            f'{name}_value': expression
+            for name, (expression, _) in self.amount_expressions().items()
+        })
+
+    def totals_by_currency(self):
+        """
+        Sum every return amount per currency in a single query.
+
+        Returns {'returned_acquisition_amount': {'UZS': ..., 'USD': ...}, ...}.
+        """
+        expressions = self.amount_expressions()
+        aggregates = {}
+        for name, (expression, currency_field) in expressions.items():
+            for currency in self.CURRENCIES:
+                aggregates[f'{name}__{currency}'] = models.Sum(
+                    expression, filter=models.Q(**{currency_field: currency})
+                )
+        row = self.aggregate(**aggregates)
+        return {
+            name: {currency: row[f'{name}__{currency}'] or Decimal('0') for currency in self.CURRENCIES}
+            for name in expressions
+        }
 
 
 class TicketReturn(models.Model):
@@ -190,16 +290,27 @@ class TicketReturn(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = TicketReturnQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Chipta qaytarishi"
         verbose_name_plural = "Chipta qaytarishlari"
         ordering = ['-return_date', '-created_at']
+        indexes = [
+            models.Index(fields=['-return_date', '-created_at'], name='return_date_idx'),
+            models.Index(fields=['original_sale', 'return_date'], name='return_sale_date_idx'),
+            models.Index(fields=['updated_at'], name='return_updated_idx'),
+        ]
     
     def clean(self):
         super().clean()
-        if self.quantity_returned > self.original_sale.remaining_quantity:
+        available = self.original_sale.remaining_quantity
+        if self.pk:
+            # returned_quantity already counts this return once it has been saved
+            available += TicketReturn.objects.filter(pk=self.pk).values_list('quantity_returned', flat=True).first() or 0
+        if self.quantity_returned > available:
             raise ValidationError(
-                f"Qaytarilgan miqdor ({self.quantity_returned}) qolgan miqdordan ({self.original_sale.remaining_quantity}) ko'p bo'lishi mumkin emas."
+                f"Qaytarilgan miqdor ({self.quantity_returned}) qolgan miqdordan ({available}) ko'p bo'lishi mumkin emas."
             )
         
         if self.fine_amount < 0:
@@ -238,9 +349,157 @@ class TicketReturn(models.Model):
     @property
     def returned_sale_amount(self):
         """Amount that was returned (original sale price * quantity returned)"""
+        if hasattr(self, 'returned_sale_amount_value'):
+            return self.returned_sale_amount_value
         return self.original_sale.unit_sale_price * self.quantity_returned
     
     @property
     def returned_acquisition_amount(self):
         """Amount that was returned based on original acquisition price (what we paid to supplier)"""
-        return self.original_sale.related_acquisition.unit_price * self.quantity_returned
\ No newline at end of file
+        if hasattr(self, 'returned_acquisition_amount_value'):
+            return self.returned_acquisition_amount_value
+        return self.original_sale.related_acquisition.unit_price * self.quantity_returned
+
+class SalesDailyRollup(models.Model):
+    """
+    Per-day sales totals keyed by (date, salesperson, agent, supplier, currency).
+
+    Maintained incrementally by SaleService, TicketReturnService, acquisition edits, commission
+    creation and the sale and commission admins;
+    ``rebuild_sales_rollup`` recomputes it from scratch. Each key has exactly one row.
+    """
+    date = models.DateField()
+    salesperson = models.ForeignKey(
+        Salesperson, on_delete=models.CASCADE, null=True, blank=True, related_name='sales_rollups'
+    )
+    agent = models.ForeignKey(
+        'contacts.Agent', on_delete=models.CASCADE, null=True, blank=True, related_name='sales_rollups'
+    )
+    supplier = models.ForeignKey(
+        'contacts.Supplier', on_delete=models.CASCADE, null=True, blank=True, related_name='sales_rollups'
+    )
+    currency = models.CharField(max_length=3, choices=Sale.SaleCurrency.choices)
+
+    sale_count = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0.00'))
+    profit = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0.00'))
+    returned_quantity = models.IntegerField(default=0)
+    returned_amount = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0.00'))
+    commission = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0.00'))
+
+    METRICS = ('sale_count', 'quantity', 'amount', 'profit', 'returned_quantity', 'returned_amount', 'commission')
+
+    class Meta:
+        verbose_name = "Kunlik sotuv yig'indisi"
+        verbose_name_plural = "Kunlik sotuv yig'indilari"
+        indexes = [
+            models.Index(fields=['date', 'salesperson'], name='rollup_date_salesperson_idx'),
+            models.Index(fields=['salesperson', 'date'], name='rollup_salesperson_date_idx'),
+        ]
+        constraints = [
+            # NULL ids coalesced so client sales (no agent) and commissions share one row per key too
+            models.UniqueConstraint(
+                'date', Coalesce('salesperson', Value(0)), Coalesce('agent', Value(0)),
+                Coalesce('supplier', Value(0)), 'currency',
+                name='unique_sales_rollup_key',
+            ),
+        ]
+
+    @classmethod
+    def apply(cls, when, salesperson_id, agent_id, supplier_id, currency, **deltas):
+        """Add ``deltas`` (metric=amount) to the row for this key, creating it when missing"""
+        key = {
+            'date': timezone.localdate(when) if isinstance(when, datetime) else when,
+            'salesperson_id': salesperson_id,
+            'agent_id': agent_id,
+            'supplier_id': supplier_id,
+            'currency': currency,
+        }
+        row = cls.objects.filter(**key)
+        changes = {metric: models.F(metric) + value for metric, value in deltas.items()}
+        if not row.update(**changes):
+            try:
+                with transaction.atomic():
+                    cls.objects.create(**key, **deltas)
+            except IntegrityError:
+                # A concurrent first posting for this key created the row
+                row.update(**changes)
+        CacheVersionService.bump_on_commit(CacheVersionService.SALESPEOPLE)
+
+    @classmethod
+    def record_sale(cls, sale, sign=1):
+        """Count ``sale`` in (sign=1) or out of (sign=-1) its day"""
+        cls.apply(
+            sale.sale_date, sale.salesperson_id, sale.agent_id,
+            sale.related_acquisition.supplier_id, sale.sale_currency,
+            sale_count=sign, quantity=sign * sale.quantity,
+            amount=sign * sale.total_sale_amount, profit=sign * sale.profit,
+        )
+
+    @classmethod
+    def record_return(cls, return_instance, sign=1, sale=None):
+        """Count a return against the key of its sale (or ``sale``, e.g. as stored before an edit)"""
+        sale = sale or return_instance.original_sale
+        cls.apply(
+            return_instance.return_date, sale.salesperson_id, sale.agent_id,
+            sale.related_acquisition.supplier_id, sale.sale_currency,
+            returned_quantity=sign * return_instance.quantity_returned,
+            returned_amount=sign * sale.unit_sale_price * return_instance.quantity_returned,
+        )
+
+    @classmethod
+    def record_commission(cls, commission, sign=1):
+        cls.apply(
+            commission.commission_date, commission.acquisition.salesperson_id, None,
+            commission.supplier_id, commission.currency,
+            commission=sign * commission.amount,
+        )
+
+    @classmethod
+    def record_acquisition(cls, acquisition, sign=1):
+        """
+        Count every sale, return and commission of ``acquisition`` under the supplier and
+        salesperson it has (e.g. as stored before an edit), summed into one update per key
+        """
+        rows = defaultdict(lambda: dict.fromkeys(cls.METRICS, 0))
+        for sale in acquisition.sales_from_this_batch.prefetch_related('returns'):
+            key = (sale.salesperson_id, sale.agent_id, acquisition.supplier_id, sale.sale_currency)
+            totals = rows[(timezone.localdate(sale.sale_date), *key)]
+            totals['sale_count'] += sign
+            totals['quantity'] += sign * sale.quantity
+            totals['amount'] += sign * sale.total_sale_amount
+            totals['profit'] += sign * sale.profit
+            for sale_return in sale.returns.all():
+                totals = rows[(timezone.localdate(sale_return.return_date), *key)]
+                totals['returned_quantity'] += sign * sale_return.quantity_returned
+                totals['returned_amount'] += sign * sale.unit_sale_price * sale_return.quantity_returned
+        for commission in acquisition.commissions.all():
+            key = (acquisition.salesperson_id, None, commission.supplier_id, commission.currency)
+            rows[(timezone.localdate(commission.commission_date), *key)]['commission'] += sign * commission.amount
+        for key, totals in rows.items():
+            cls.apply(*key, **totals)
+
+    @classmethod
+    def totals_for_salespeople(cls, start_date, end_date):
+        """
+        Salesperson annotations equivalent to the old per-request joins over
+        sales_made and acquisitions_made__commissions.
+        """
+        in_range = Q(sales_rollups__date__range=(start_date, end_date))
+        money = models.DecimalField(max_digits=20, decimal_places=2)
+        zero = models.Value(Decimal('0'), output_field=money)
+        return {
+            'total_sales_count': Coalesce(models.Sum('sales_rollups__sale_count', filter=in_range), 0),
+            'total_sales_uzs': Coalesce(models.Sum(
+                'sales_rollups__amount', filter=in_range & Q(sales_rollups__currency='UZS')), zero),
+            'total_sales_usd': Coalesce(models.Sum(
+                'sales_rollups__amount', filter=in_range & Q(sales_rollups__currency='USD')), zero),
+            'total_commission_uzs': Coalesce(models.Sum(
+                'sales_rollups__commission', filter=in_range & Q(sales_rollups__currency='UZS')), zero),
+            'total_commission_usd': Coalesce(models.Sum(
+                'sales_rollups__commission', filter=in_range & Q(sales_rollups__currency='USD')), zero),
+        }
+
+    def __str__(self):
+        return f"{self.date} {self.salesperson_id}/{self.agent_id}/{self.supplier_id} {self.currency}"
@@ -1,9 +1,14 @@
 from django.db import transaction
+from django.db.models import F
 from django.core.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
-from .models import Sale, TicketReturn
-from .forms import SaleForm
-from apps.contacts.models import AgentPayment
+from django.utils import timezone
+from .models import Sale, TicketReturn, SalesDailyRollup
+from .forms import SaleImportForm
+from apps.contacts.models import AgentPayment, ContactBalanceCheckpoint
+from apps.accounting.models import AccountLedgerEntry
+from apps.core.services import BalanceDeltaCollector, BulkImportService, CacheVersionService
+from apps.inventory.models import Acquisition
 import logging
 
 logger = logging.getLogger(__name__)
@@ -33,6 +38,7 @@ class SaleService:
                 sale.salesperson = form.cleaned_data['salesperson']
             
             sale.save()
+            SalesDailyRollup.record_sale(sale)
             
             # Update stock
             acquisition = sale.related_acquisition
@@ -46,11 +52,20 @@ class SaleService:
             # Handle client payment (customers pay immediately)
             elif sale.paid_to_account:
                 account = sale.paid_to_account
-                account.current_balance += sale.total_sale_amount
-                account.save(update_fields=['current_balance', 'updated_at'])
+                SaleService._post_to_account(account, sale.total_sale_amount, sale, entry_date=sale.sale_date)
             
             return sale
 
+    @staticmethod
+    def _post_to_account(account, amount, sale, entry_date=None):
+        """Apply a client-sale balance change to the receiving account and journal it"""
+        account.post_entry(
+            amount,
+            AccountLedgerEntry.SourceType.SALE, sale.pk,
+            entry_date=entry_date,
+            **sale.ledger_details()
+        )
+
     @staticmethod
     def delete_sale(sale_id, user):
         """Delete sale with complete transaction rollback"""
@@ -87,8 +102,9 @@ class SaleService:
             elif sale.paid_to_account:
                 logger.info(f"Reversing client payment from account {sale.paid_to_account.name}")
                 account = sale.paid_to_account
-                account.current_balance -= sale.total_sale_amount
-                account.save(update_fields=['current_balance', 'updated_at'])
+                SaleService._post_to_account(account, -sale.total_sale_amount, sale)
+            
+            SalesDailyRollup.record_sale(sale, sign=-1)
             
             # Delete the sale
             logger.info(f"Deleting sale {sale_id} from database")
@@ -100,7 +116,14 @@ class SaleService:
     @staticmethod
     def update_sale(original_sale, form):
         """Update sale with complete business logic handling"""
-        with transaction.atomic():
+        with transaction.atomic(), BalanceDeltaCollector():
+            # Take the sale and its returns out of the rollup as stored, before the form's values apply
+            stored_sale = Sale.objects.select_related('related_acquisition').get(pk=original_sale.pk)
+            sale_returns = list(stored_sale.returns.all())
+            SalesDailyRollup.record_sale(stored_sale, sign=-1)
+            for sale_return in sale_returns:
+                SalesDailyRollup.record_return(sale_return, sign=-1, sale=stored_sale)
+            
             # Store original values
             original_quantity = original_sale.quantity
             original_agent = original_sale.agent
@@ -151,6 +174,9 @@ class SaleService:
             
             # Save the updated sale
             new_sale.save()
+            SalesDailyRollup.record_sale(new_sale)
+            for sale_return in sale_returns:
+                SalesDailyRollup.record_return(sale_return, sale=new_sale)
             
             return new_sale
 
@@ -165,8 +191,7 @@ class SaleService:
         
         # Remove original client payment
         elif original_paid_account:
-            original_paid_account.current_balance -= original_total_amount
-            original_paid_account.save(update_fields=['current_balance', 'updated_at'])
+            SaleService._post_to_account(original_paid_account, -original_total_amount, original_sale)
         
         # Add new agent debt (no initial payment)
         if new_agent:
@@ -174,8 +199,7 @@ class SaleService:
         
         # Add new client payment (customers pay immediately)
         elif new_paid_account:
-            new_paid_account.current_balance += new_sale.total_sale_amount
-            new_paid_account.save(update_fields=['current_balance', 'updated_at'])
+            SaleService._post_to_account(new_paid_account, new_sale.total_sale_amount, new_sale)
 
     @staticmethod
     def _handle_amount_changes(original_sale, original_agent, original_total_amount, 
@@ -192,8 +216,7 @@ class SaleService:
             # Adjust account balance
             amount_diff = new_sale.total_sale_amount - original_total_amount
             if amount_diff != 0:
-                original_paid_account.current_balance += amount_diff
-                original_paid_account.save(update_fields=['current_balance', 'updated_at']) 
+                SaleService._post_to_account(original_paid_account, amount_diff, new_sale)
 
 
 class TicketReturnService:
@@ -202,7 +225,7 @@ class TicketReturnService:
     @staticmethod
     def create_return(form, user):
         """Create ticket return with complete business logic"""
-        with transaction.atomic():
+        with transaction.atomic(), BalanceDeltaCollector():
             return_instance = form.save(commit=False)
             
             # Set currencies from original sale
@@ -210,6 +233,8 @@ class TicketReturnService:
             return_instance.supplier_fine_currency = return_instance.original_sale.sale_currency
             
             return_instance.save()
+            return_instance.original_sale.adjust_returned_quantity(return_instance.quantity_returned)
+            SalesDailyRollup.record_return(return_instance)
             
             # Restore inventory
             acquisition = return_instance.original_sale.related_acquisition
@@ -233,24 +258,30 @@ class TicketReturnService:
         if sale.paid_to_account:
             refund_amount = return_instance.returned_acquisition_amount  # Original purchase price from supplier
             account = sale.paid_to_account
-            account.current_balance -= refund_amount
-            account.save(update_fields=['current_balance', 'updated_at'])
+            TicketReturnService._post_to_account(
+                account, -refund_amount, return_instance,
+                AccountLedgerEntry.SourceType.RETURN_REFUND, entry_date=return_instance.return_date
+            )
             logger.info(f"Refunded original purchase price {refund_amount} {sale.related_acquisition.currency} to customer account {account.name}")
         
         # 2. Collect fine from customer (subtract from the account where they paid)
         if sale.paid_to_account and return_instance.total_fine_amount > 0:
             fine_amount = return_instance.total_fine_amount
             account = sale.paid_to_account
-            account.current_balance -= fine_amount  # Take fine from customer
-            account.save(update_fields=['current_balance', 'updated_at'])
+            TicketReturnService._post_to_account(
+                account, -fine_amount, return_instance,
+                AccountLedgerEntry.SourceType.RETURN_FINE, entry_date=return_instance.return_date
+            )
             logger.info(f"Collected fine {fine_amount} {return_instance.fine_currency} from customer account {account.name}")
         
         # 3. If fine is paid to a different account, add it there
         if return_instance.fine_paid_to_account and return_instance.fine_paid_to_account != sale.paid_to_account:
             fine_amount = return_instance.total_fine_amount
             account = return_instance.fine_paid_to_account
-            account.current_balance += fine_amount
-            account.save(update_fields=['current_balance', 'updated_at'])
+            TicketReturnService._post_to_account(
+                account, fine_amount, return_instance,
+                AccountLedgerEntry.SourceType.RETURN_FINE, entry_date=return_instance.return_date
+            )
             logger.info(f"Added fine {fine_amount} {return_instance.fine_currency} to account {account.name}")
         
         # 4. Reduce supplier debt for returned tickets (based on what we originally paid them)
@@ -267,6 +298,18 @@ class TicketReturnService:
         supplier.add_debt(supplier_fine_amount, return_instance.supplier_fine_currency)
         logger.info(f"Added supplier fine {supplier_fine_amount} {return_instance.supplier_fine_currency} to supplier {supplier.name}")
     
+    @staticmethod
+    def _post_to_account(account, amount, return_instance, source_type, entry_date=None):
+        """Apply a return refund or fine to the affected account and journal it"""
+        sale = return_instance.original_sale
+        buyer = sale.client_full_name or 'N/A'
+        account.post_entry(
+            amount,
+            source_type, return_instance.pk,
+            entry_date=entry_date,
+            description=f"Qaytarish #{return_instance.pk} - {buyer}"[:255],
+        )
+    
     @staticmethod
     def _handle_agent_return(return_instance):
         """Handle agent return business logic"""
@@ -306,12 +349,14 @@ class TicketReturnService:
         return_instance = get_object_or_404(TicketReturn, pk=return_id)
         logger.info(f"Starting deletion of return {return_id}")
         
-        with transaction.atomic():
+        with transaction.atomic(), BalanceDeltaCollector():
             # Reverse inventory restoration
             acquisition = return_instance.original_sale.related_acquisition
             acquisition.available_quantity -= return_instance.quantity_returned
             acquisition.save(update_fields=['available_quantity', 'updated_at'])
             logger.info(f"Reversed inventory restoration for {return_instance.quantity_returned} units")
+            return_instance.original_sale.adjust_returned_quantity(-return_instance.quantity_returned)
+            SalesDailyRollup.record_return(return_instance, sign=-1)
             
             # Reverse business logic based on return type
             if return_instance.is_customer_return:
@@ -335,24 +380,27 @@ class TicketReturnService:
         if sale.paid_to_account:
             refund_amount = return_instance.returned_acquisition_amount  # Original purchase price from supplier
             account = sale.paid_to_account
-            account.current_balance += refund_amount
-            account.save(update_fields=['current_balance', 'updated_at'])
+            TicketReturnService._post_to_account(
+                account, refund_amount, return_instance, AccountLedgerEntry.SourceType.RETURN_REFUND
+            )
             logger.info(f"Reversed customer refund {refund_amount} {sale.related_acquisition.currency}")
         
         # 2. Reverse fine collection (give back the fine we collected)
         if sale.paid_to_account and return_instance.total_fine_amount > 0:
             fine_amount = return_instance.total_fine_amount
             account = sale.paid_to_account
-            account.current_balance += fine_amount  # Give back fine to customer
-            account.save(update_fields=['current_balance', 'updated_at'])
+            TicketReturnService._post_to_account(
+                account, fine_amount, return_instance, AccountLedgerEntry.SourceType.RETURN_FINE
+            )
             logger.info(f"Reversed fine collection {fine_amount} {return_instance.fine_currency}")
         
         # 3. Reverse fine payment to different account
         if return_instance.fine_paid_to_account and return_instance.fine_paid_to_account != sale.paid_to_account:
             fine_amount = return_instance.total_fine_amount
             account = return_instance.fine_paid_to_account
-            account.current_balance -= fine_amount
-            account.save(update_fields=['current_balance', 'updated_at'])
+            TicketReturnService._post_to_account(
+                account, -fine_amount, return_instance, AccountLedgerEntry.SourceType.RETURN_FINE
+            )
             logger.info(f"Reversed fine payment {fine_amount} {return_instance.fine_currency}")
         
         # 4. Reverse supplier debt reduction and supplier fine
@@ -395,4 +443,101 @@ class TicketReturnService:
         
         # Reverse supplier fine
         supplier.reduce_debt(supplier_fine_amount, return_instance.supplier_fine_currency)
-        logger.info(f"Reversed supplier fine {supplier_fine_amount} {return_instance.supplier_fine_currency}") 
\ No newline at end of file
+        logger.info(f"Reversed supplier fine {supplier_fine_amount} {return_instance.supplier_fine_currency}")
+
+
+class SaleImportService(BulkImportService):
+    """
+    Bulk import of sales, one per row, with the SaleForm columns: sale_date,
+    related_acquisition (id), quantity, unit_sale_price, agent (id) or
+    client_full_name and client_id_number, paid_to_account (id), notes.
+
+    Stock is checked against the running quantity of each acquisition, so rows
+    of one file cannot oversell it between them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Quantity validated but not written, carried over chunks in a dry run
+        self.pending_stock = {}
+
+    def build_form(self, data):
+        data = dict(data)
+        if not data.get('sale_date'):
+            data['sale_date'] = timezone.now()
+        return SaleImportForm(data, current_user=self.user, preloaded=self.objects)
+
+    def choices_queryset(self, name, queryset):
+        if name == 'related_acquisition':
+            # Locked in primary key order until the chunk commits, like a single sale's stock update.
+            # write() reads the ticket (ledger description) and supplier (rollup key) of every sale
+            return queryset.select_related('ticket', 'supplier').select_for_update(of=('self',)).order_by('pk')
+        return queryset
+
+    def preload(self, rows):
+        super().preload(rows)
+        for acquisition in self.objects['related_acquisition'].values():
+            acquisition.available_quantity -= self.pending_stock.get(acquisition.pk, 0)
+
+    def build_records(self, form):
+        sale = form.save(commit=False)
+        acquisition = sale.related_acquisition
+        sale.salesperson = form.cleaned_data.get('salesperson')
+        sale.sale_currency = acquisition.currency
+        sale.total_sale_amount = sale.quantity * sale.unit_sale_price
+        sale.profit = sale.total_sale_amount - sale.quantity * acquisition.unit_price
+
+        # Later rows of the chunk validate against what is left
+        acquisition.available_quantity -= sale.quantity
+        if self.dry_run:
+            self.pending_stock[acquisition.pk] = self.pending_stock.get(acquisition.pk, 0) + sale.quantity
+        return sale
+
+    def write(self, sales):
+        self.insert(Sale, sales)
+
+        stock = {}
+        agents = {}
+        debts = {}
+        earliest = {}
+        rollup = {}
+        entries = []
+        for sale in sales:
+            acquisition = sale.related_acquisition
+            stock[acquisition.pk] = stock.get(acquisition.pk, 0) + sale.quantity
+
+            key = (timezone.localdate(sale.sale_date), sale.salesperson_id, sale.agent_id,
+                   acquisition.supplier_id, sale.sale_currency)
+            totals = rollup.setdefault(key, {'sale_count': 0, 'quantity': 0, 'amount': 0, 'profit': 0})
+            totals['sale_count'] += 1
+            totals['quantity'] += sale.quantity
+            totals['amount'] += sale.total_sale_amount
+            totals['profit'] += sale.profit
+
+            if sale.agent:
+                agents[sale.agent_id] = sale.agent
+                debt_key = (sale.agent_id, sale.sale_currency)
+                debts[debt_key] = debts.get(debt_key, 0) + sale.total_sale_amount
+                earliest[sale.agent_id] = min(earliest.get(sale.agent_id, sale.sale_date), sale.sale_date)
+            elif sale.paid_to_account:
+                entries.append(AccountLedgerEntry(
+                    account=sale.paid_to_account, entry_date=sale.sale_date, amount=sale.total_sale_amount,
+                    currency=sale.paid_to_account.currency, source_type=AccountLedgerEntry.SourceType.SALE,
+                    source_id=sale.pk, **sale.ledger_details()
+                ))
+
+        now = timezone.now()
+        for acquisition_id, quantity in stock.items():
+            Acquisition.objects.filter(pk=acquisition_id).update(
+                available_quantity=F('available_quantity') - quantity, updated_at=now
+            )
+        for (agent_id, currency), amount in debts.items():
+            agents[agent_id].add_debt(amount, currency)
+        AccountLedgerEntry.post_many(entries)
+        for key, totals in rollup.items():
+            SalesDailyRollup.apply(*key, **totals)
+
+        # bulk_create sends no post_save, so do what the signal handlers would
+        for agent_id, sale_date in earliest.items():
+            ContactBalanceCheckpoint.invalidate('agent', agent_id, sale_date)
+        CacheVersionService.bump_on_commit(CacheVersionService.ACQUISITIONS)
@@ -0,0 +1,72 @@
+/**
+ * Async select
+ * Fills <select data-search-url="..."> from a paginated JSON search endpoint
+ * ({results: [{id, text}], has_more}) instead of rendering every option server-side.
+ */
+
+document.addEventListener('DOMContentLoaded', function () {
+    const DEBOUNCE_MS = 250;
+
+    function buildOption(value, text) {
+        const option = document.createElement('option');
+        option.value = value;
+        option.textContent = text;
+        return option;
+    }
+
+    function initAsyncSelect(select) {
+        const searchUrl = select.dataset.searchUrl;
+        const searchInput = document.createElement('input');
+        searchInput.type = 'search';
+        searchInput.className = 'form-control form-control-sm mb-1';
+        searchInput.placeholder = "Qidirish (ID, nomi, chipta, agent)...";
+        searchInput.autocomplete = 'off';
+        select.parentNode.insertBefore(searchInput, select);
+
+        let timer = null;
+        let requestId = 0;
+
+        async function load(query) {
+            const currentRequest = ++requestId;
+            const url = `${searchUrl}?q=${encodeURIComponent(query)}`;
+            try {
+                const response = await fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } });
+                if (!response.ok || currentRequest !== requestId) {
+                    return;
+                }
+                const data = await response.json();
+                if (currentRequest !== requestId) {
+                    return;
+                }
+
+                const selected = select.options[select.selectedIndex];
+                const selectedValue = select.value;
+                select.innerHTML = '';
+                select.appendChild(buildOption('', '---------'));
+
+                // Keep the current choice even when it is not in this page of results
+                if (selectedValue && !data.results.some(item => String(item.id) === selectedValue)) {
+                    select.appendChild(buildOption(selectedValue, selected.textContent));
+                }
+                data.results.forEach(item => select.appendChild(buildOption(item.id, item.text)));
+                if (data.has_more) {
+                    const more = buildOption('', "Yana natijalar bor - qidiruvni aniqlashtiring");
+                    more.disabled = true;
+                    select.appendChild(more);
+                }
+                select.value = selectedValue;
+            } catch (error) {
+                console.error('Async select search failed:', error);
+            }
+        }
+
+        searchInput.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(() => load(searchInput.value.trim()), DEBOUNCE_MS);
+        });
+
+        load('');
+    }
+
+    document.querySelectorAll('select[data-search-url]').forEach(initAsyncSelect);
+});
@@ -1,3 +1,232 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import Sum
 from django.test import TestCase
+from django.utils import timezone
+from apps.accounting.models import FinancialAccount, AccountLedgerEntry
+from apps.contacts.models import Agent, Supplier
+from apps.core.models import Salesperson
+from apps.inventory.forms import AcquisitionForm
+from apps.inventory.models import Acquisition, Ticket
+from apps.inventory.services import AcquisitionService
+from .forms import SaleForm, TicketReturnForm
+from .models import Sale, SalesDailyRollup
+from .services import SaleService, SaleImportService, TicketReturnService
 
-# Create your tests here.
+
+class SalesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'parol123')
+        cls.user = User.objects.create_user('sotuvchi', password='parol123')
+        cls.salesperson = Salesperson.objects.create(user=cls.user)
+        cls.usd = FinancialAccount.objects.create(
+            name='Kassa USD', account_type='CASH_USD', currency='USD', current_balance=Decimal('1000')
+        )
+        cls.supplier = Supplier.objects.create(name="Ta'minotchi")
+        cls.agent = Agent.objects.create(name='Agent')
+        now = timezone.now()
+        ticket = Ticket.objects.create(
+            ticket_type='AIR', description='Toshkent-Istanbul', departure_date_time=now + timedelta(days=10)
+        )
+        cls.acquisition = Acquisition.objects.create(
+            supplier=cls.supplier, ticket=ticket, initial_quantity=20, unit_price=Decimal('100'),
+            currency='USD', salesperson=cls.salesperson, acquisition_date=now - timedelta(days=30),
+        )
+
+    def create_sale(self, **data):
+        form = SaleForm({
+            'sale_date': timezone.localtime().strftime('%Y-%m-%dT%H:%M'),
+            'related_acquisition': self.acquisition.pk,
+            **data,
+        }, current_user=self.user)
+        self.assertTrue(form.is_valid(), form.errors)
+        return SaleService.create_sale(form)
+
+    def create_client_sale(self, quantity=2, price='130'):
+        return self.create_sale(
+            quantity=quantity, unit_sale_price=price, client_full_name='Mijoz', client_id_number='AA1234567',
+            paid_to_account=self.usd.pk,
+        )
+
+    def create_return(self, sale, quantity=1, fine='10'):
+        form = TicketReturnForm({
+            'original_sale': sale.pk, 'quantity_returned': quantity, 'fine_amount': fine, 'supplier_fine_amount': '5',
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        return TicketReturnService.create_return(form, self.admin)
+
+    def assertLedgerMatchesBalance(self, account):
+        account.refresh_from_db()
+        ledger_total = account.ledger_entries.aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        self.assertEqual(account.current_balance, account.initial_balance + ledger_total)
+
+
+class SaleLedgerTests(SalesTestCase):
+    def test_client_sale_posts_to_account(self):
+        sale = self.create_client_sale(quantity=2, price='130')
+
+        self.usd.refresh_from_db()
+        self.assertEqual(self.usd.current_balance, Decimal('1260'))
+        entry = AccountLedgerEntry.objects.get(source_type=AccountLedgerEntry.SourceType.SALE, source_id=sale.pk)
+        self.assertEqual((entry.amount, entry.entry_date), (Decimal('260'), sale.sale_date))
+        self.assertLedgerMatchesBalance(self.usd)
+
+    def test_agent_sale_leaves_accounts_alone(self):
+        self.create_sale(quantity=3, unit_sale_price='120', agent=self.agent.pk)
+
+        self.agent.refresh_from_db()
+        self.assertEqual(self.agent.balance_usd, Decimal('360'))
+        self.assertFalse(AccountLedgerEntry.objects.exists())
+        self.assertLedgerMatchesBalance(self.usd)
+
+    def test_sale_edit_and_delete_keep_ledger_in_step(self):
+        sale = self.create_client_sale(quantity=2, price='130')
+        form = SaleForm({
+            'sale_date': timezone.localtime(sale.sale_date).strftime('%Y-%m-%dT%H:%M'),
+            'related_acquisition': self.acquisition.pk, 'quantity': 3, 'unit_sale_price': '125',
+            'client_full_name': 'Mijoz', 'client_id_number': 'AA1234567', 'paid_to_account': self.usd.pk,
+        }, instance=Sale.objects.get(pk=sale.pk), current_user=self.admin)
+        self.assertTrue(form.is_valid(), form.errors)
+        SaleService.update_sale(form.instance, form)
+
+        self.usd.refresh_from_db()
+        self.assertEqual(self.usd.current_balance, Decimal('1375'))
+        self.assertLedgerMatchesBalance(self.usd)
+
+        SaleService.delete_sale(sale.pk, self.admin)
+        self.usd.refresh_from_db()
+        self.assertEqual(self.usd.current_balance, Decimal('1000'))
+        self.assertLedgerMatchesBalance(self.usd)
+
+
+class ReturnLedgerTests(SalesTestCase):
+    def test_client_return_posts_refund_and_fine(self):
+        sale = self.create_client_sale(quantity=2, price='130')
+        self.create_return(sale, quantity=1, fine='10')
+
+        self.usd.refresh_from_db()
+        sale.refresh_from_db()
+        self.assertEqual(sale.returned_quantity, 1)
+        # Refunded at the purchase price, and the fine is taken from the same account
+        self.assertEqual(self.usd.current_balance, Decimal('1260') - Decimal('100') - Decimal('10'))
+        self.assertLedgerMatchesBalance(self.usd)
+
+    def test_return_delete_restores_balances(self):
+        sale = self.create_client_sale(quantity=2, price='130')
+        ticket_return = self.create_return(sale, quantity=1, fine='10')
+        TicketReturnService.delete_return(ticket_return.pk, self.admin)
+
+        self.usd.refresh_from_db()
+        sale.refresh_from_db()
+        self.assertEqual(sale.returned_quantity, 0)
+        self.assertEqual(self.usd.current_balance, Decimal('1260'))
+        self.assertLedgerMatchesBalance(self.usd)
+
+
+class SaleImportTests(SalesTestCase):
+    def row(self, **data):
+        return {
+            'sale_date': timezone.localtime().strftime('%Y-%m-%dT%H:%M'), 'related_acquisition': str(self.acquisition.pk),
+            'quantity': '2', 'unit_sale_price': '130', 'client_full_name': 'Mijoz', 'client_id_number': 'AA1234567',
+            'paid_to_account': str(self.usd.pk), **data,
+        }
+
+    def agent_row(self):
+        return self.row(client_full_name='', client_id_number='', paid_to_account='', agent=str(self.agent.pk))
+
+    def test_valid_rows_post_to_ledger_and_stock(self):
+        imported, errors = SaleImportService(self.user, chunk_size=2).run(
+            [(2, self.row()), (3, self.row(quantity='3')), (4, self.agent_row())]
+        )
+
+        self.assertEqual((imported, errors), (3, []))
+        self.acquisition.refresh_from_db()
+        self.assertEqual(self.acquisition.available_quantity, 13)
+        self.assertEqual(AccountLedgerEntry.objects.filter(source_type=AccountLedgerEntry.SourceType.SALE).count(), 2)
+        self.usd.refresh_from_db()
+        self.assertEqual(self.usd.current_balance, Decimal('1650'))
+        self.assertLedgerMatchesBalance(self.usd)
+
+    def test_bad_rows_are_reported_by_row_number(self):
+        imported, errors = SaleImportService(self.user).run([
+            (2, self.row()),
+            (3, self.row(quantity='abc')),
+            (4, self.row(related_acquisition='999999')),
+            (5, self.row(quantity='25')),
+        ])
+
+        self.assertEqual(imported, 1)
+        self.assertEqual([row_number for row_number, _ in errors], [3, 4, 5])
+        self.assertTrue(all(messages for _, messages in errors))
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertLedgerMatchesBalance(self.usd)
+
+    def test_sold_out_acquisition_is_rejected_not_fatal(self):
+        # The first row takes the last tickets, so the second one finds the acquisition sold out
+        imported, errors = SaleImportService(self.user).run([(2, self.row(quantity='20')), (3, self.row())])
+        imported_later, later_errors = SaleImportService(self.user).run([(2, self.row(quantity='1'))])
+
+        self.assertEqual((imported, [row_number for row_number, _ in errors]), (1, [3]))
+        self.assertEqual((imported_later, [row_number for row_number, _ in later_errors]), (0, [2]))
+        self.acquisition.refresh_from_db()
+        self.assertEqual(self.acquisition.available_quantity, 0)
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_dry_run_writes_nothing(self):
+        imported, errors = SaleImportService(self.user, dry_run=True, chunk_size=1).run(
+            [(2, self.row(quantity='15')), (3, self.row(quantity='10'))]
+        )
+
+        self.assertEqual((imported, [row_number for row_number, _ in errors]), (1, [3]))
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(AccountLedgerEntry.objects.exists())
+        self.acquisition.refresh_from_db()
+        self.assertEqual(self.acquisition.available_quantity, 20)
+
+
+class SalesRollupTests(SalesTestCase):
+    def rollup(self):
+        """Rollup rows by key, without rows that edits have brought back to zero"""
+        rows = {}
+        for row in SalesDailyRollup.objects.values():
+            metrics = tuple(row[metric] for metric in SalesDailyRollup.METRICS)
+            if any(metrics):
+                rows[row['date'], row['salesperson_id'], row['agent_id'], row['supplier_id'], row['currency']] = metrics
+        return rows
+
+    def assertRollupMatchesRebuild(self):
+        incremental = self.rollup()
+        call_command('rebuild_sales_rollup', stdout=StringIO())
+        self.assertEqual(incremental, self.rollup())
+
+    def test_sales_and_returns(self):
+        sale = self.create_client_sale(quantity=3, price='130')
+        self.create_sale(quantity=2, unit_sale_price='120', agent=self.agent.pk)
+        self.create_return(sale, quantity=1, fine='10')
+
+        self.assertEqual(len(self.rollup()), 2)
+        self.assertRollupMatchesRebuild()
+
+    def test_acquisition_supplier_change_moves_its_sales(self):
+        sale = self.create_client_sale(quantity=3, price='130')
+        self.create_return(sale, quantity=1, fine='10')
+        other_supplier = Supplier.objects.create(name="Boshqa ta'minotchi")
+
+        acquisition = Acquisition.objects.get(pk=self.acquisition.pk)
+        form = AcquisitionForm({
+            'supplier': other_supplier.pk,
+            'acquisition_date': timezone.localtime(acquisition.acquisition_date).strftime('%Y-%m-%dT%H:%M'),
+            'initial_quantity': acquisition.initial_quantity, 'unit_price': acquisition.unit_price,
+            'currency': acquisition.currency, 'ticket_type': acquisition.ticket.ticket_type,
+            'ticket_description': acquisition.ticket.description,
+            'ticket_departure_date_time': timezone.localtime(acquisition.ticket.departure_date_time).strftime('%Y-%m-%dT%H:%M'),
+        }, instance=acquisition, current_user=self.user)
+        self.assertTrue(form.is_valid(), form.errors)
+        AcquisitionService.update_acquisition(acquisition, form)
+
+        self.assertEqual({key[3] for key in self.rollup()}, {other_supplier.pk})
+        self.assertRollupMatchesRebuild()
@@ -2,7 +2,7 @@ from django.urls import path
 from .views import (
     SaleListView, get_accounts_for_acquisition_currency, get_sale_info,
     TicketReturnListView, TicketReturnCreateView, TicketReturnDetailView,
-    create_acquisition_from_sales,
+    create_acquisition_from_sales, api_acquisition_search, api_sale_search,
 )
 from .admin_views import delete_sale, edit_sale
 
@@ -13,6 +13,8 @@ urlpatterns = [
     path('acquisitions/create/', create_acquisition_from_sales, name='create-acquisition'),
     path('get-accounts/', get_accounts_for_acquisition_currency, name='get-accounts'),
     path('get-sale-info/', get_sale_info, name='get-sale-info'),
+    path('api/acquisitions/search/', api_acquisition_search, name='api-acquisition-search'),
+    path('api/sales/search/', api_sale_search, name='api-sale-search'),
     path('<int:sale_id>/delete/', delete_sale, name='sale-delete'),
     path('<int:sale_id>/edit/', edit_sale, name='sale-edit'),
     
@@ -13,14 +13,16 @@ from django.views.generic import CreateView, DetailView
 from django.core.exceptions import ValidationError
 
 from .models import Sale, TicketReturn
-from .forms import SaleForm, TicketReturnForm
+from .forms import (
+    SaleForm, TicketReturnForm, available_acquisitions, returnable_sales, acquisition_label, sale_label
+)
 from .services import SaleService, TicketReturnService
 from apps.inventory.models import Acquisition
 from apps.inventory.forms import AcquisitionForm
 from apps.inventory.services import AcquisitionService
 from apps.accounting.models import FinancialAccount
-from apps.contacts.models import Agent, Supplier
-from apps.core.services import DateFilterService
+from apps.core.models import Salesperson
+from apps.core.services import DateFilterService, ReferenceDataService
 
 
 class SaleListView(LoginRequiredMixin, ListView):
@@ -36,7 +38,7 @@ class SaleListView(LoginRequiredMixin, ListView):
             'agent',
             'salesperson',
             'paid_to_account'
-        ).prefetch_related('returns').order_by('-sale_date', '-created_at')
+        ).order_by('-sale_date', '-created_at')
 
         # Filter by salesperson if not superuser
         # Temporarily allow all sales for testing return functionality
@@ -115,29 +117,29 @@ class SaleListView(LoginRequiredMixin, ListView):
 
         if filter_period == 'day':
             start_date_obj, end_date_obj = DateFilterService.get_date_range('day', date_filter, None, None)
-            queryset = queryset.filter(sale_date__date__range=[start_date_obj, end_date_obj])
+            queryset = DateFilterService.filter_queryset(queryset, 'sale_date', start_date_obj, end_date_obj)
         elif filter_period == 'week':
             start_date_obj, end_date_obj = DateFilterService.get_date_range('week', None, None, None)
-            queryset = queryset.filter(sale_date__date__range=[start_date_obj, end_date_obj])
+            queryset = DateFilterService.filter_queryset(queryset, 'sale_date', start_date_obj, end_date_obj)
         elif filter_period == 'month':
             start_date_obj, end_date_obj = DateFilterService.get_date_range('month', None, None, None)
-            queryset = queryset.filter(sale_date__date__range=[start_date_obj, end_date_obj])
+            queryset = DateFilterService.filter_queryset(queryset, 'sale_date', start_date_obj, end_date_obj)
         elif filter_period == 'custom':
             if start_date or end_date:
                 start_date_obj, end_date_obj = DateFilterService.get_date_range('custom', None, start_date, end_date)
-                queryset = queryset.filter(sale_date__date__range=[start_date_obj, end_date_obj])
+                queryset = DateFilterService.filter_queryset(queryset, 'sale_date', start_date_obj, end_date_obj)
         else:
             # If no explicit period, derive from provided dates
             if date_filter:
                 start_date_obj, end_date_obj = DateFilterService.get_date_range('day', date_filter, None, None)
-                queryset = queryset.filter(sale_date__date__range=[start_date_obj, end_date_obj])
+                queryset = DateFilterService.filter_queryset(queryset, 'sale_date', start_date_obj, end_date_obj)
             elif start_date or end_date:
                 start_date_obj, end_date_obj = DateFilterService.get_date_range('custom', None, start_date, end_date)
-                queryset = queryset.filter(sale_date__date__range=[start_date_obj, end_date_obj])
+                queryset = DateFilterService.filter_queryset(queryset, 'sale_date', start_date_obj, end_date_obj)
             else:
                 # Default to today
                 start_date_obj, end_date_obj = DateFilterService.get_date_range(None, None, None, None)
-                queryset = queryset.filter(sale_date__date__range=[start_date_obj, end_date_obj])
+                queryset = DateFilterService.filter_queryset(queryset, 'sale_date', start_date_obj, end_date_obj)
 
         # Search filter
         search = self.request.GET.get('search')
@@ -155,13 +157,12 @@ class SaleListView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         
         # Add filter options
-        context['agents'] = Agent.objects.all().order_by('name')
+        context['agents'] = ReferenceDataService.get('agents')
         context['currencies'] = Sale.SaleCurrency.choices
         
         # Add additional filter options
-        from apps.core.models import Salesperson
-        context['salespeople'] = Salesperson.objects.select_related('user').all().order_by('user__first_name', 'user__last_name')
-        context['suppliers'] = Supplier.objects.all().order_by('name')
+        context['salespeople'] = ReferenceDataService.get('salespeople')
+        context['suppliers'] = ReferenceDataService.get('suppliers')
         
         # Add sale form for modal
         if self.request.method == 'POST':
@@ -253,7 +254,9 @@ class SaleListView(LoginRequiredMixin, ListView):
             else:
                 start_date_obj, end_date_obj = DateFilterService.get_date_range(None, None, None, None)
 
-        commission_qs = Commission.objects.filter(commission_date__date__range=[start_date_obj, end_date_obj])
+        commission_qs = DateFilterService.filter_queryset(
+            Commission.objects.all(), 'commission_date', start_date_obj, end_date_obj
+        )
         supplier_id = self.request.GET.get('supplier')
         if supplier_id:
             commission_qs = commission_qs.filter(supplier_id=supplier_id)
@@ -336,6 +339,70 @@ def get_sale_info(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+SEARCH_PAGE_SIZE = 20
+
+
+def _prefix_match(model, field, query):
+    """
+    Case-insensitive prefix match on ``field``, e.g. 'agent__name'. A field on a related table
+    becomes an id subquery, so each table can search its own NOCASE index instead of the
+    OR over a join scanning every row
+    """
+    if '__' not in field:
+        return Q(**{f'{field}__istartswith': query})
+    relation, rest = field.split('__', 1)
+    related_model = model._meta.get_field(relation).related_model
+    return Q(**{f'{relation}__in': related_model.objects.filter(_prefix_match(related_model, rest, query))})
+
+
+def _search_results(request, queryset, text_fields, label):
+    """
+    One page of typeahead results for ?q=&page=. Text fields match by prefix, which their
+    NOCASE indexes serve; a numeric query also matches the id.
+    Fetches one extra row instead of counting to know whether more pages exist.
+    """
+    query = request.GET.get('q', '').strip()
+    if query:
+        condition = Q()
+        for field in text_fields:
+            condition |= _prefix_match(queryset.model, field, query)
+        if query.isdigit():
+            condition |= Q(pk=int(query))
+        queryset = queryset.filter(condition)
+
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    offset = (page - 1) * SEARCH_PAGE_SIZE
+    rows = list(queryset[offset:offset + SEARCH_PAGE_SIZE + 1])
+
+    return JsonResponse({
+        'results': [{'id': obj.pk, 'text': label(obj)} for obj in rows[:SEARCH_PAGE_SIZE]],
+        'has_more': len(rows) > SEARCH_PAGE_SIZE,
+    })
+
+
+@login_required
+def api_acquisition_search(request):
+    """Typeahead for the sale form acquisition picker"""
+    queryset = available_acquisitions(request.user).order_by('-acquisition_date', '-created_at')
+    return _search_results(
+        request, queryset, ['ticket__description', 'supplier__name'], acquisition_label
+    )
+
+
+@login_required
+def api_sale_search(request):
+    """Typeahead for the return form sale picker"""
+    queryset = returnable_sales().order_by('-sale_date', '-id')
+    return _search_results(
+        request, queryset,
+        ['client_full_name', 'client_id_number', 'agent__name', 'related_acquisition__ticket__description'],
+        sale_label
+    )
+
+
 class TicketReturnListView(LoginRequiredMixin, ListView):
     model = TicketReturn
     template_name = 'sales/return_list.html'
@@ -380,7 +447,7 @@ class TicketReturnListView(LoginRequiredMixin, ListView):
             start_date_obj, end_date_obj = DateFilterService.get_date_range(
                 'custom', None, start_date, end_date
             )
-            queryset = queryset.filter(return_date__date__range=[start_date_obj, end_date_obj])
+            queryset = DateFilterService.filter_queryset(queryset, 'return_date', start_date_obj, end_date_obj)
         
         return queryset
     
@@ -388,7 +455,7 @@ class TicketReturnListView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         
         # Add filter options
-        context['agents'] = Agent.objects.all().order_by('name')
+        context['agents'] = ReferenceDataService.get('agents')
         context['currencies'] = Sale.SaleCurrency.choices
         
         # Add filter values for form persistence